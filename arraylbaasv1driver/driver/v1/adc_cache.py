@@ -19,29 +19,157 @@ import logging
 TENANT_APV_MAPPING = "/usr/share/arraylbaasdriver/mapping_apv.json"
 TENANT_AVX_MAPPING = "/usr/share/arraylbaasdriver/mapping_avx.json"
 
+# The reference counts of shared resources are stored in the same
+# mapping file under this reserved key
+SHARED_REFS_KEY = "_shared_refs"
+# The values the holders configure the shared resources with, such as
+# the address of an interface, are stored under this reserved key
+SHARED_VALUES_KEY = "_shared_values"
+# The scope of the SLB objects which are the same on all APV hosts
+SLB_SCOPE = "_slb"
+HEALTH_PREFIX = "health."
+REAL_PREFIX = "real."
+
 LOG = logging.getLogger(__name__)
 #logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 #LOG = logging.getLogger()
 
-class LogicalAPVCache(object):
+class SharedResourceRefs(object):
+    """
+    Reference counting of the resources shared by several VIPs, such as
+    the VLAN interface, the IP address bound to it and the route. The
+    refs are organized as {scope: {resource: [holder, ...]}}, where the
+    scope is the host (APV) or the VA name (AVX).
+
+    The resource is configured with the value of its first holder, the
+    values of the others are kept so that the resource can be configured
+    with the value of the next holder when the first one is gone.
+
+    The refs changed with dump=False are unsaved until the next dump, a
+    reload of the mapping in between keeps them instead of the refs on
+    disk, which were loaded into them before.
+    """
+    refs = None
+    values = None
+    unsaved = False
+
+    def acquire_ref(self, scope, resource, holder, dump=True, value=None):
+        """ Return True if the holder is the only user of the resource,
+            which means the resource should be configured. The caller
+            changing many refs passes dump=False and dumps them at last.
+        """
+        holders = self.refs.setdefault(scope, {}).setdefault(resource, [])
+        if value is not None:
+            self.values.setdefault(scope, {}).setdefault(resource, {})[holder] = value
+        if holder not in holders:
+            holders.append(holder)
+            if dump:
+                self.dump()
+            else:
+                self.unsaved = True
+        LOG.debug("Resource(%s) in %s is held by %s", resource, scope, holders)
+        return holders == [holder]
+
+    def release_ref(self, scope, resource, holder, dump=True):
+        """ Return True if no one holds the resource anymore, which means
+            the resource should be cleared.
+        """
+        resources = self.refs.get(scope, {})
+        holders = resources.get(resource, None)
+        if holders is None:
+            # The resource was configured before it is reference counted
+            return True
+        if holder in holders:
+            holders.remove(holder)
+        values = self.values.get(scope, {})
+        values.get(resource, {}).pop(holder, None)
+        LOG.debug("Resource(%s) in %s is held by %s", resource, scope, holders)
+        if not holders:
+            resources.pop(resource, None)
+            if not resources:
+                self.refs.pop(scope, None)
+            values.pop(resource, None)
+            if not values:
+                self.values.pop(scope, None)
+        if dump:
+            self.dump()
+        else:
+            self.unsaved = True
+        return not holders
+
+    def holds_ref(self, scope, resource, holder):
+        return holder in self.refs.get(scope, {}).get(resource, [])
+
+    def ref_owner(self, scope, resource):
+        """ Return (holder, value) of the first holder of the resource,
+            whose value the resource is configured with
+        """
+        holders = self.refs.get(scope, {}).get(resource, [])
+        if not holders:
+            return None, None
+        return holders[0], self.values.get(scope, {}).get(resource, {}).get(holders[0])
+
+    def find_ref(self, scope, prefix, holder):
+        """ Return the resource starting with prefix held by the holder """
+        for resource, holders in self.refs.get(scope, {}).items():
+            if resource.startswith(prefix) and holder in holders:
+                return resource
+        return None
+
+    def clear_refs(self, scope):
+        self.values.pop(scope, None)
+        if self.refs.pop(scope, None) is not None:
+            self.unsaved = True
+            LOG.debug("Clear the shared resources in %s", scope)
+
+    def _load_mapping(self, path):
+        with open(path, 'r') as fd:
+            self.mapping = json.load(fd)
+        refs = self.mapping.pop(SHARED_REFS_KEY, {})
+        values = self.mapping.pop(SHARED_VALUES_KEY, {})
+        if self.unsaved:
+            LOG.debug("Keep the unsaved refs %s", self.refs)
+        else:
+            self.refs = refs
+            self.values = values
+        LOG.debug("After loading, the mapping is %s", self.mapping)
+
+    def _dump_mapping(self, path):
+        content = dict(self.mapping)
+        if self.refs:
+            content[SHARED_REFS_KEY] = self.refs
+        if self.values:
+            content[SHARED_VALUES_KEY] = self.values
+        with open(path, 'w') as fd:
+            json.dump(content, fd)
+        self.unsaved = False
+
+
+class LogicalAPVCache(SharedResourceRefs):
     """
     The cache of Logical VIP cache in APV
     """
     def __init__(self):
         self.mapping = {}
+        self.refs = {}
+        self.values = {}
         self._reload()
 
     def _reload(self):
         """ Reload the mapping between tenant and VA """
         if not os.path.exists(TENANT_APV_MAPPING):
             return None
-        with open(TENANT_APV_MAPPING, 'r') as fd:
-            self.mapping = json.load(fd)
-            LOG.debug("After loading, the mapping is %s", self.mapping)
+        self._load_mapping(TENANT_APV_MAPPING)
 
     def dump(self):
-        with open(TENANT_APV_MAPPING, 'w') as fd:
-            json.dump(self.mapping, fd)
+        self._dump_mapping(TENANT_APV_MAPPING)
+
+    def rebuild(self, mapping, refs, values=None):
+        """ Replace the whole mapping, it is used to recover the mapping """
+        self.mapping = mapping
+        self.refs = refs
+        self.values = values or {}
+        self.dump()
 
     def put(self, vip_id, host, port_id, dump = False):
         if not vip_id or not host or not port_id:
@@ -78,13 +206,15 @@ class LogicalAPVCache(object):
                 LOG.debug("Host(%s): Port(%s)" % (vk, self.mapping[k][vk]))
 
 
-class LogicalAVXCache(object):
+class LogicalAVXCache(SharedResourceRefs):
     """
     The cache of Logical APVs in AVX
     """
     va_name_prefix = "va"
     def __init__(self, in_interface):
         self.mapping = {}
+        self.refs = {}
+        self.values = {}
         self.in_interface = in_interface
         self.va_pools = self._generate_va_pools()
         self._reload()
@@ -99,23 +229,33 @@ class LogicalAVXCache(object):
             vas.append(va_name)
         return vas
 
+    def all_va_names(self):
+        return self._generate_va_pools()
+
     def _reload(self):
         """ Reload the mapping between tenant and VA """
         if not os.path.exists(TENANT_AVX_MAPPING):
             return None
-        with open(TENANT_AVX_MAPPING, 'r') as fd:
-            self.mapping = json.load(fd)
-            LOG.debug("After loading, the mapping is %s", self.mapping)
+        self._load_mapping(TENANT_AVX_MAPPING)
         self.va_pools = self._generate_va_pools()
         for dv in self.mapping.values():
             self.va_pools = [x for x in self.va_pools if x != dv['va_name']]
         LOG.debug("For now, va_pools is %s", self.va_pools)
 
     def dump(self):
-        with open(TENANT_AVX_MAPPING, 'w') as fd:
-            json.dump(self.mapping, fd)
+        self._dump_mapping(TENANT_AVX_MAPPING)
         LOG.debug("DUMP is Done!!!!")
 
+    def rebuild(self, mapping, refs, values=None):
+        """ Replace the whole mapping, it is used to recover the mapping """
+        self.mapping = mapping
+        self.refs = refs
+        self.values = values or {}
+        used_vas = [lb_item['va_name'] for lb_item in mapping.values()]
+        self.va_pools = [x for x in self._generate_va_pools() if x not in used_vas]
+        LOG.debug("After rebuild, va_pools is %s", self.va_pools)
+        self.dump()
+
     def put(self, pool_id, vip_id, host, port_id, dump = False):
         lb_item = {}
         interface_map = {}
@@ -145,6 +285,7 @@ class LogicalAVXCache(object):
         if lb_item:
             va_name = lb_item['va_name']
             self.va_pools.append(va_name)
+            self.clear_refs(va_name)
             LOG.debug("After running remove, va_pools is %s", self.va_pools)
             self.mapping.pop(pool_id, None)
             self.dump()
@@ -164,6 +305,7 @@ class LogicalAVXCache(object):
                 self.mapping.pop(pool_id, None)
                 LOG.debug("Will add (%s) into va_pools", va_name)
                 self.va_pools.append(va_name)
+                self.clear_refs(va_name)
                 LOG.debug("After running remove_group, va_pools is %s", self.va_pools)
             self.dump()
         return va_name
@@ -184,6 +326,7 @@ class LogicalAVXCache(object):
                 self.mapping.pop(pool_id, None)
                 LOG.debug("Will add (%s) into va_pools", va_name)
                 self.va_pools.append(va_name)
+                self.clear_refs(va_name)
                 LOG.debug("After running remove_vip, va_pools is %s", self.va_pools)
             self.dump()
         return va_name
@@ -236,7 +379,7 @@ class LogicalAVXCache(object):
             LOG.debug("Pool ID: %s" % k)
             for vk in self.mapping[k].keys():
                 if vk == 'va_name':
-		    LOG.debug("va_name: %s" % self.mapping[k][vk])
+                    LOG.debug("va_name: %s" % self.mapping[k][vk])
                 else:
                     LOG.debug("vip: %s" % vk)
                     for vkk in self.mapping[k][vk].keys():
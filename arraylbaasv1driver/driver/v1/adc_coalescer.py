@@ -0,0 +1,75 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import logging
+import threading
+
+LOG = logging.getLogger(__name__)
+
+
+class Coalescer(object):
+    """
+    Collect the changes submitted within a short window and keep only
+    the latest one of each key. When the window of a group expires, all
+    the pending changes of the group are passed to flush(group, items)
+    together, where items is a list of (item, merged) and merged is the
+    number of the superseded changes of this key.
+    """
+    def __init__(self, window, flush):
+        self.window = window
+        self.flush = flush
+        self.pending = {}
+        self.flush_locks = {}
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.merged = 0
+
+    def submit(self, group, key, item):
+        with self.lock:
+            self.submitted += 1
+            items = self.pending.get(group, None)
+            if items is None:
+                items = self.pending[group] = {}
+                timer = threading.Timer(self.window, self._flush, (group,))
+                timer.daemon = True
+                timer.start()
+            merged = -1
+            if key in items:
+                merged = items[key][1]
+                self.merged += 1
+            items[key] = (item, merged + 1)
+
+    def discard(self, group, key):
+        """ Drop the pending change, e.g. the object has been deleted """
+        with self.lock:
+            items = self.pending.get(group, {})
+            if items.pop(key, None):
+                LOG.debug("Discard the pending change of %s in %s", key, group)
+
+    def _flush(self, group):
+        with self.lock:
+            flush_lock = self.flush_locks.setdefault(group, threading.Lock())
+
+        # The changes of a group are flushed one window after another
+        with flush_lock:
+            with self.lock:
+                items = self.pending.pop(group, {})
+            if not items:
+                return
+            LOG.debug("Flush %d changes of %s, %d merged in total of %d",
+                      len(items), group, self.merged, self.submitted)
+            try:
+                self.flush(group, list(items.values()))
+            except Exception as e:
+                LOG.exception("Failed to flush the changes of %s: %s", group, e)
@@ -11,43 +11,49 @@
 # limitations under the License.
 #
 
+import hashlib
+
 from arraylbaasv1driver.driver.v1.adc_map import service_group_lb_method
+from arraylbaasv1driver.driver.v1.adc_plan import Command
+from arraylbaasv1driver.driver.v1.adc_plan import ACTION_CREATE, ACTION_DELETE, ACTION_UPDATE
 
 class ADCDevice(object):
     """
         This class is used to generate the command line of Array ADC
-        Product by different action.
+        Product by different action. The commands are typed with the
+        objects they change and require, see adc_plan.Command.
     """
 
     @staticmethod
     def vlan_device(interface, vlan_device_name, vlan_tag):
         cmd = "vlan %s %s %s" % (interface, vlan_device_name, vlan_tag)
-        return cmd
+        return Command(cmd, 'vlan', vlan_device_name, ACTION_CREATE)
 
     @staticmethod
     def no_vlan_device(vlan_device_name):
         cmd = "no vlan %s" % vlan_device_name
-        return cmd
+        return Command(cmd, 'vlan', vlan_device_name, ACTION_DELETE)
 
     @staticmethod
     def configure_ip(interface, ip_address, netmask):
         cmd = "ip address %s %s %s" % (interface, ip_address, netmask)
-        return cmd
+        return Command(cmd, 'ip', interface, ACTION_CREATE,
+                       [('vlan', interface)])
 
     @staticmethod
     def configure_route(gateway_ip):
         cmd = "ip route default %s" % (gateway_ip)
-        return cmd
+        return Command(cmd, 'route', 'default', ACTION_CREATE)
 
     @staticmethod
     def clear_route():
         cmd = "clear ip route"
-        return cmd
+        return Command(cmd, 'route', 'default', ACTION_DELETE)
 
     @staticmethod
     def no_ip(interface):
         cmd = "no ip address %s" % interface
-        return cmd
+        return Command(cmd, 'ip', interface, ACTION_DELETE)
 
     @staticmethod
     def create_virtual_service(name, vip, port, protocol, conn_limit):
@@ -57,12 +63,12 @@ class ADCDevice(object):
 
         cmd = "slb virtual %s %s %s %s arp %s" % (protocol, name, vip, port,
                 max_conn)
-        return cmd
+        return Command(cmd, 'virtual', name, ACTION_CREATE)
 
     @staticmethod
     def no_virtual_service(name, protocol):
         cmd = "no slb virtual %s %s" % (protocol, name)
-        return cmd
+        return Command(cmd, 'virtual', name, ACTION_DELETE)
 
     @staticmethod
     def create_group(name, lb_algorithm, sp_type):
@@ -82,12 +88,12 @@ class ADCDevice(object):
                 cmd = "slb group method %s ic array" % (name)
             else:
                 cmd = "slb group method %s %s" % (name, algorithm.lower())
-        return cmd
+        return cmd and Command(cmd, 'group', name, ACTION_CREATE)
 
     @staticmethod
     def no_group(name):
         cmd = "no slb group method %s" % name
-        return cmd
+        return Command(cmd, 'group', name, ACTION_DELETE)
 
     @staticmethod
     def create_policy(vs_name,
@@ -109,7 +115,8 @@ class ADCDevice(object):
         elif policy == 'IC':
             cmd = "slb policy default %s %s; " % (vs_name, group_name)
             cmd += "slb policy icookie %s %s %s 100" % (vs_name, vs_name, group_name)
-        return cmd
+        return cmd and Command(cmd, 'policy', vs_name, ACTION_CREATE,
+                              [('virtual', vs_name), ('group', group_name)])
 
     @staticmethod
     def no_policy(vs_name, lb_algorithm, session_persistence_type):
@@ -122,7 +129,7 @@ class ADCDevice(object):
         elif policy == 'IC':
             cmd = "no slb policy default %s; " % vs_name
             cmd += "no slb policy icookie %s" % vs_name
-        return cmd
+        return Command(cmd, 'policy', vs_name, ACTION_DELETE)
 
     @staticmethod
     def create_real_server(member_name,
@@ -132,12 +139,18 @@ class ADCDevice(object):
                           ):
         cmd = "slb real %s %s %s %s 65535 none" % (protocol, member_name,\
                 member_address, member_port)
-        return cmd
+        return Command(cmd, 'real', member_name, ACTION_CREATE)
+
+    @staticmethod
+    def shared_real_server_name(protocol, member_address, member_port):
+        """ The name of the real server shared by the members on the same backend """
+        content = "%s|%s|%s" % (protocol, member_address, member_port)
+        return "rs_" + hashlib.sha1(content.encode('utf-8')).hexdigest()[:32]
 
     @staticmethod
     def no_real_server(protocol, member_name):
         cmd = "no slb real %s %s" % (protocol, member_name)
-        return cmd
+        return Command(cmd, 'real', member_name, ACTION_DELETE)
 
     @staticmethod
     def add_rs_into_group(group_name,
@@ -145,12 +158,13 @@ class ADCDevice(object):
                           member_weight
                          ):
         cmd = "slb group member %s %s %s" % (group_name, member_name, member_weight)
-        return cmd
+        return Command(cmd, 'member', (group_name, member_name), ACTION_CREATE,
+                       [('group', group_name), ('real', member_name)])
 
     @staticmethod
     def delete_rs_from_group(group_name, member_name):
         cmd = "no slb group member %s %s" % (group_name, member_name)
-        return cmd
+        return Command(cmd, 'member', (group_name, member_name), ACTION_DELETE)
 
     @staticmethod
     def create_health_monitor(hm_name,
@@ -172,52 +186,68 @@ class ADCDevice(object):
         else:
             cmd = "slb health %s %s %s %s 2 %s" % (hm_name, hm_type.lower(), \
                     str(hm_delay), str(hm_timeout), str(hm_max_retries))
-        return cmd
+        return cmd and Command(cmd, 'health', hm_name, ACTION_CREATE)
+
+    @staticmethod
+    def shared_health_monitor_name(hm_type,
+                                   hm_delay,
+                                   hm_max_retries,
+                                   hm_timeout,
+                                   hm_http_method,
+                                   hm_url,
+                                   hm_expected_codes
+                                  ):
+        """ The name of the health object shared by the identical monitors """
+        content = "|".join(["%s" % (value,) for value in (hm_type, hm_delay,
+                            hm_max_retries, hm_timeout, hm_http_method,
+                            hm_url, hm_expected_codes)])
+        return "hm_" + hashlib.sha1(content.encode('utf-8')).hexdigest()[:32]
 
     @staticmethod
     def no_health_monitor(hm_name):
         cmd = "no slb health %s" % hm_name
-        return cmd
+        return Command(cmd, 'health', hm_name, ACTION_DELETE)
 
     @staticmethod
     def attach_hm_to_group(group_name, hm_name):
         cmd = "slb group health %s %s" % (group_name, hm_name)
-        return cmd
+        return Command(cmd, 'group_health', (group_name, hm_name), ACTION_CREATE,
+                       [('group', group_name), ('health', hm_name)])
 
     @staticmethod
     def detach_hm_to_group(group_name, hm_name):
         cmd = "no slb group health %s %s" % (group_name, hm_name)
-        return cmd
+        return Command(cmd, 'group_health', (group_name, hm_name), ACTION_DELETE)
 
     @staticmethod
     def cluster_config_virtual_interface(interface_name):
         cmd = "cluster virtual ifname %s 100" % interface_name
-        return cmd
+        return Command(cmd, 'cluster', interface_name, ACTION_UPDATE)
 
     @staticmethod
     def cluster_clear_virtual_interface(interface_name):
         cmd = "clear cluster virtual ifname %s 100" % interface_name
-        return cmd
+        return Command(cmd, 'cluster', interface_name, ACTION_UPDATE)
 
     @staticmethod
     def cluster_config_vip(interface_name, vip_address):
         cmd = "cluster virtual vip %s 100 %s" % (interface_name, vip_address)
-        return cmd
+        return Command(cmd, 'cluster', interface_name, ACTION_UPDATE)
 
     @staticmethod
     def cluster_config_priority(interface_name, priority):
         cmd = "cluster virtual priority %s 100 %d" % (interface_name, priority)
-        return cmd
+        return Command(cmd, 'cluster', interface_name, ACTION_UPDATE)
 
     @staticmethod
     def cluster_enable(interface_name):
         cmd = "cluster virtual on 100 %s" % (interface_name)
-        return cmd
+        return Command(cmd, 'cluster', interface_name, ACTION_UPDATE)
 
     @staticmethod
     def cluster_disable(interface_name):
         cmd = "cluster virtual off 100 %s" % (interface_name)
-        return cmd
+        return Command(cmd, 'cluster', interface_name, ACTION_UPDATE)
 
     @staticmethod
     def write_memory():
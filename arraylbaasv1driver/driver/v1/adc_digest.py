@@ -0,0 +1,265 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import hashlib
+import logging
+import shlex
+import threading
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+from arraylbaasv1driver.driver.v1.adc_dirty import command_scope
+from arraylbaasv1driver.driver.v1.adc_rebuild import cli_output
+
+LOG = logging.getLogger(__name__)
+
+# (type, prefix, name positions, pool position) of the SLB objects in the
+# digest, the commands deleting them start with "no" and have every
+# position shifted by one
+OBJECTS = sorted([
+    ('virtual', ('slb', 'virtual'), (3,), None),
+    ('group', ('slb', 'group', 'method'), (3,), 3),
+    ('real', ('slb', 'real'), (3,), None),
+    ('member', ('slb', 'group', 'member'), (3, 4), 3),
+    ('health', ('slb', 'health'), (2,), None),
+    ('group_health', ('slb', 'group', 'health'), (3, 4), 3),
+    ('policy', ('slb', 'policy', 'default'), (3,), 4),
+    ('cookie', ('slb', 'policy', 'persistent', 'cookie'), (4,), 6),
+    ('icookie', ('slb', 'policy', 'icookie'), (3,), 5),
+], key=lambda entry: -len(entry[1]))
+
+# The objects removed with an object of the type, by the position of its
+# name in their keys
+CHILDREN = {
+    'group': (('member', 0), ('group_health', 0)),
+    'real': (('member', 1),),
+    'health': (('group_health', 1),),
+}
+
+# The objects which are not in a pool, such as the shared real servers
+# and health monitors, are in the bucket of the device or VA itself
+NO_POOL = ''
+
+# The parents of each type of objects, by the position of their names
+PARENTS = {}
+for _parent, _children in CHILDREN.items():
+    for _child, _index in _children:
+        PARENTS.setdefault(_child, []).append((_parent, _index))
+
+
+def _line_hash(line):
+    return int(hashlib.sha1(line.encode('utf-8')).hexdigest()[:16], 16)
+
+
+def parse_command(cmd):
+    """
+    Return (create, obj_type, names, pool_id, line) of one command on an
+    object in the digest, or None. The line is the command without the
+    quoting, so that the commands and the running configuration match.
+    """
+    try:
+        words = shlex.split(cmd.replace('$$', '"').strip())
+    except ValueError:
+        return None
+    create = not words or words[0] != 'no'
+    offset = 0 if create else 1
+    for obj_type, prefix, names, pool in OBJECTS:
+        if tuple(words[offset:offset + len(prefix)]) != prefix:
+            continue
+        if len(words) <= max(names) + offset:
+            return None
+        key = tuple(words[i + offset] for i in names)
+        pool_id = NO_POOL
+        if create and pool is not None and len(words) > pool:
+            pool_id = words[pool]
+        return create, obj_type, key, pool_id, ' '.join(words)
+    return None
+
+
+def object_name(obj):
+    obj_type, key = obj
+    return "%s %s" % (obj_type, '/'.join(key))
+
+
+class ScopeDigest(object):
+    """
+    The objects of one device or VA with the rolling hash of each pool
+    and of all of them. The hashes are the XOR of the hashes of the
+    objects, so adding or removing one object changes them at once
+    whatever the size of the configuration. The virtual service is in
+    the pool of its default policy.
+    """
+    def __init__(self):
+        self.hash = 0
+        self.objects = {}
+        self.pools = {}
+        self.children = {}
+        self.vs_pools = {}
+
+    def apply(self, cmd):
+        parsed = parse_command(cmd)
+        if parsed is None:
+            return
+        create, obj_type, key, pool_id, line = parsed
+        obj = (obj_type, key)
+        if not create:
+            self._remove(obj)
+            return
+        if obj_type == 'virtual':
+            pool_id = self.vs_pools.get(key[0], NO_POOL)
+        self._remove(obj, cascade=False)
+        self._add(obj, pool_id, _line_hash(line))
+        for parent, index in PARENTS.get(obj_type, ()):
+            self.children.setdefault((parent, key[index:index + 1]), set()).add(obj)
+        if obj_type == 'policy':
+            self.vs_pools[key[0]] = pool_id
+            self._move(('virtual', key), pool_id)
+
+    def _add(self, obj, pool_id, value):
+        self.objects[obj] = (pool_id, value)
+        pool = self.pools.setdefault(pool_id, [0, set()])
+        pool[0] ^= value
+        pool[1].add(obj)
+        self.hash ^= value
+
+    def _remove(self, obj, cascade=True):
+        if obj not in self.objects:
+            return
+        pool_id, value = self.objects.pop(obj)
+        pool = self.pools[pool_id]
+        pool[0] ^= value
+        pool[1].discard(obj)
+        if not pool[1]:
+            del self.pools[pool_id]
+        self.hash ^= value
+
+        obj_type, key = obj
+        for parent, index in PARENTS.get(obj_type, ()):
+            self.children.get((parent, key[index:index + 1]), set()).discard(obj)
+        if not cascade:
+            return
+        if obj_type == 'policy':
+            self.vs_pools.pop(key[0], None)
+            self._move(('virtual', key), NO_POOL)
+        for child in list(self.children.pop(obj, ())):
+            self._remove(child)
+
+    def _move(self, obj, pool_id):
+        if obj in self.objects and self.objects[obj][0] != pool_id:
+            value = self.objects[obj][1]
+            self._remove(obj, cascade=False)
+            self._add(obj, pool_id, value)
+
+    def diff(self, other):
+        """ Compare with the digest of the other side, pool by pool only
+            when the hashes differ. Return {pool_id: {'missing': [...],
+            'unexpected': [...], 'changed': [...]}} of the drifted pools,
+            the objects are missing from or unexpected by the other side
+        """
+        drift = {}
+        if self.hash == other.hash:
+            return drift
+        for pool_id in set(self.pools) | set(other.pools):
+            mine = self.pools.get(pool_id, [0, set()])
+            theirs = other.pools.get(pool_id, [0, set()])
+            if mine[0] == theirs[0] and len(mine[1]) == len(theirs[1]):
+                continue
+            changed = [obj for obj in mine[1] & theirs[1]
+                       if self.objects[obj][1] != other.objects[obj][1]]
+            drift[pool_id] = {
+                'missing': sorted(object_name(obj) for obj in mine[1] - theirs[1]),
+                'unexpected': sorted(object_name(obj) for obj in theirs[1] - mine[1]),
+                'changed': sorted(object_name(obj) for obj in changed),
+            }
+        return drift
+
+
+def running_digest(text):
+    """ The digest of the running configuration of a device or VA """
+    digest = ScopeDigest()
+    for line in cli_output(text).splitlines():
+        digest.apply(line)
+    return digest
+
+
+def applied_commands(text):
+    """ Return the function telling whether a command is applied on the
+        running configuration of text: the object it creates is there
+        with the same line, or the object it deletes is gone. The
+        commands out of the digest are never applied.
+    """
+    device = running_digest(text)
+
+    def is_applied(cmd):
+        parsed = parse_command(cmd)
+        if parsed is None:
+            return False
+        create, obj_type, key, _, line = parsed
+        current = device.objects.get((obj_type, key))
+        if not create:
+            return current is None
+        return current is not None and current[1] == _line_hash(line)
+    return is_applied
+
+
+class ConfigDigest(object):
+    """
+    The digest of the configuration intended for each device and VA,
+    updated by the commands which succeeded on them.
+    The scope is (host, va_name), va_name is None for the host itself.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.scopes = {}
+
+    def record(self, base_rest_url, cmd):
+        (_, va_name), cmds = command_scope(base_rest_url, cmd)
+        scope = (urlparse(base_rest_url).hostname, va_name)
+        with self.lock:
+            digest = self.scopes.setdefault(scope, ScopeDigest())
+            for one in cmds.split(';'):
+                digest.apply(one)
+
+    def replace(self, other):
+        with self.lock:
+            self.scopes = other.scopes
+
+    def compare(self, scope, text):
+        """ Return the drift of scope from its running configuration """
+        device = running_digest(text)
+        with self.lock:
+            intended = self.scopes.get(scope) or ScopeDigest()
+            return {
+                'objects': len(intended.objects),
+                'drift': intended.diff(device),
+            }
+
+
+class DigestRecorder(object):
+    """ The recorder of a device driver which puts the requests into a
+        digest instead of sending them
+    """
+    def __init__(self, digest):
+        self.digest = digest
+
+    def cli_extend(self, base_rest_url, cmd):
+        self.digest.record(base_rest_url, cmd)
+        return ''
+
+    def rest(self, base_rest_url, method, path, payload=None):
+        # the VLANs of REST are out of the digest
+        return ''
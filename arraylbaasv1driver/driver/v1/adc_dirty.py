@@ -0,0 +1,89 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import logging
+import re
+import threading
+
+LOG = logging.getLogger(__name__)
+
+VA_RUN = re.compile(r'^\s*va\s+run\s+(\S+)\s+"(.*)"\s*$', re.S)
+READ_ONLY_PREFIXES = ('show ', 'write memory')
+
+
+def command_scope(base_rest_url, cmd):
+    """ Return (scope, commands) of the cli_extend command, the scope is
+        (base_rest_url, va_name) and va_name is None for the host itself
+    """
+    match = VA_RUN.match(cmd)
+    if match:
+        return (base_rest_url, match.group(1)), match.group(2)
+    return (base_rest_url, None), cmd
+
+
+def is_mutating(cmds):
+    for cmd in cmds.split(';'):
+        cmd = cmd.strip()
+        if cmd and not (cmd + ' ').startswith(READ_ONLY_PREFIXES):
+            return True
+    return False
+
+
+class DirtyTracker(object):
+    """
+    Track the hosts and VAs which received mutating commands since their
+    last config save, so that write memory is skipped on the clean ones.
+    The first save of each scope after the driver is loaded always runs,
+    since the changes made before the restart are unknown.
+    """
+    def __init__(self):
+        self.dirty = set()
+        self.saved = set()
+        self.lock = threading.Lock()
+        self.saves = 0
+        self.skipped = 0
+
+    def record(self, base_rest_url, cmd):
+        scope, cmds = command_scope(base_rest_url, cmd)
+        if is_mutating(cmds):
+            self.mark(scope)
+
+    def mark(self, scope):
+        with self.lock:
+            self.dirty.add(scope)
+
+    def begin_save(self, scope):
+        """ Return False if the save of scope can be skipped """
+        with self.lock:
+            if scope in self.saved and scope not in self.dirty:
+                self.skipped += 1
+                LOG.info("Skip write memory on %s, no change since the last "
+                         "save (%d skipped, %d saved)", scope, self.skipped,
+                         self.saves)
+                return False
+            self.dirty.discard(scope)
+            self.saved.add(scope)
+            self.saves += 1
+            return True
+
+    def abort_save(self, scope):
+        """ The save failed, keep the scope dirty """
+        with self.lock:
+            self.dirty.add(scope)
+            self.saves -= 1
+
+    def stats(self):
+        with self.lock:
+            return {'saves': self.saves, 'skipped': self.skipped,
+                    'dirty': len(self.dirty)}
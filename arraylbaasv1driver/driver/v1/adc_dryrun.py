@@ -0,0 +1,171 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import copy
+import logging
+import threading
+
+from arraylbaasv1driver.driver.v1 import adc_metrics
+
+LOG = logging.getLogger(__name__)
+
+# The plugin methods which change Neutron, they are recorded instead
+MUTATING_CALLS = frozenset([
+    'update_status', 'update_pool_health_monitor', '_delete_db_vip',
+    '_delete_db_pool', '_delete_db_member', '_delete_db_pool_health_monitor',
+    'create_port', 'update_port', 'delete_port',
+])
+
+
+class PlanRecorder(object):
+    """
+    Record the requests of a device driver instead of sending them, every
+    request returns an empty response.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = []
+        self.neutron_calls = []
+
+    def cli_extend(self, base_rest_url, cmd):
+        device, va, verb = adc_metrics.request_labels(base_rest_url, cmd)
+        with self.lock:
+            self.requests.append({
+                'device': device,
+                'va': va,
+                'verb': verb,
+                'cli_extend': str(cmd),
+                'commands': cmd.count(';') + 1,
+                'save': 'write memory' in cmd,
+            })
+        return ''
+
+    def rest(self, base_rest_url, method, path, payload=None):
+        device, va, verb = adc_metrics.request_labels(base_rest_url, method=method,
+                                                      path=path)
+        with self.lock:
+            self.requests.append({
+                'device': device,
+                'va': va,
+                'verb': verb,
+                'rest': {'method': method, 'path': path, 'payload': payload},
+                'commands': len(payload) if isinstance(payload, list) else 1,
+                'save': False,
+            })
+        return ''
+
+    def neutron(self, call, args):
+        with self.lock:
+            self.neutron_calls.append({'call': call, 'args': [str(a) for a in args]})
+
+    def reset(self):
+        with self.lock:
+            self.requests = []
+            self.neutron_calls = []
+
+    def summary(self, request_seconds=None, with_requests=True):
+        """
+        Return the plan with the round trips, commands and saves of each
+        device or VA and in total. With the seconds of one request, the
+        time of sending the requests one by one is estimated.
+        """
+        with self.lock:
+            requests = list(self.requests)
+            neutron_calls = list(self.neutron_calls)
+        scopes = {}
+        for request in requests:
+            key = request['device'] + ('/' + request['va'] if request['va'] else '')
+            scope = scopes.setdefault(key, {'round_trips': 0, 'commands': 0, 'saves': 0})
+            scope['round_trips'] += 1
+            scope['commands'] += request['commands']
+            scope['saves'] += 1 if request['save'] else 0
+        plan = {
+            'round_trips': len(requests),
+            'commands': sum(r['commands'] for r in requests),
+            'saves': len([r for r in requests if r['save']]),
+            'devices': scopes,
+            'neutron_calls': neutron_calls,
+        }
+        if request_seconds is not None:
+            plan['estimated_seconds'] = round(len(requests) * request_seconds, 3)
+        if with_requests:
+            plan['requests'] = requests
+        return plan
+
+
+class ReadOnlyPlugin(object):
+    """ Pass the reads to the plugin and its core plugin, and record the
+        changes to the recorder instead. The created ports get made up
+        ids and addresses.
+    """
+    def __init__(self, plugin, recorder, prefix=''):
+        self._plugin = plugin
+        self._recorder = recorder
+        self._prefix = prefix
+        self._ports = {}
+
+    def __getattr__(self, name):
+        if name == '_core_plugin':
+            core = ReadOnlyPlugin(self._plugin._core_plugin, self._recorder, 'core.')
+            self.__dict__['_core_plugin'] = core
+            return core
+        if name not in MUTATING_CALLS:
+            return getattr(self._plugin, name)
+        call = self._prefix + name
+
+        def recorded(context, *args, **kwargs):
+            self._recorder.neutron(call, args)
+            if name == 'create_port':
+                return self._new_port(args[0]['port'])
+            if name == 'update_port':
+                port = self.get_port(context, args[0])
+                port.update(args[1]['port'])
+                return port
+            return None
+        return recorded
+
+    def _new_port(self, data):
+        index = len(self._ports) + 1
+        port = dict(data)
+        port['id'] = 'dry-run-port-%d' % index
+        port['fixed_ips'] = [{'subnet_id': data['fixed_ips'][0]['subnet_id'],
+                              'ip_address': '<new-port-%d>' % index}]
+        self._ports[port['id']] = port
+        return copy.deepcopy(port)
+
+    def get_port(self, context, port_id):
+        if port_id in self._ports:
+            return copy.deepcopy(self._ports[port_id])
+        return self._plugin.get_port(context, port_id)
+
+
+class NoPortPool(object):
+    """ The port pool of the plans, it never has ports """
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+
+    def claim(self, context, tenant_id, subnet, count):
+        return []
+
+    def release(self, context, port_ids):
+        for port_id in port_ids:
+            self.plugin._core_plugin.delete_port(context, port_id)
+
+
+def detached_cache(cache):
+    """ A copy of the mapping which is never written to the file """
+    cache = copy.deepcopy(cache)
+    cache.dump = lambda: None
+    return cache
@@ -0,0 +1,87 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import contextlib
+import functools
+import threading
+import time
+
+from arraylbaasv1driver.driver.v1 import adc_scheduler
+from arraylbaasv1driver.driver.v1.adc_utils import LazyModule
+
+# imported only when the driver turns the feature on
+adc_metrics = LazyModule('arraylbaasv1driver.driver.v1.adc_metrics')
+adc_profiler = LazyModule('arraylbaasv1driver.driver.v1.adc_profiler')
+adc_spans = LazyModule('arraylbaasv1driver.driver.v1.adc_spans')
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def _nothing():
+    yield
+
+
+def _span(tracer, func, context, args):
+    if not tracer:
+        return _nothing()
+    return adc_spans.span(tracer, func.__name__,
+                          tenant_id=adc_scheduler.operation_tenant(context, args))
+
+
+def _profile(profiler, func):
+    if not profiler:
+        return _nothing()
+    return adc_profiler.profile(profiler, func.__name__)
+
+
+def operation(func):
+    """ Decorate the operations of ArrayADCDriver with the trace recorder,
+        the metrics, the spans and the profiler of the driver. Every
+        operation gets a span, but only the outermost ones, which are
+        called by Neutron, are recorded, timed and profiled, and they
+        start the metrics exporter of the worker.
+    """
+    @functools.wraps(func)
+    def wrapper(self, context, *args, **kwargs):
+        tracer = getattr(self, 'tracer', None)
+        if getattr(_local, 'active', False):
+            with _span(tracer, func, context, args):
+                return func(self, context, *args, **kwargs)
+
+        exporter = getattr(self, 'metrics_exporter', None)
+        if exporter:
+            exporter.ensure_started()
+        recorder = getattr(self, 'trace_recorder', None)
+        metrics = getattr(self, 'metrics', None)
+        profiler = getattr(self, 'profiler', None)
+        error = None
+        start = time.time()
+        _local.active = True
+        try:
+            with _span(tracer, func, context, args):
+                with _profile(profiler, func):
+                    return func(self, context, *args, **kwargs)
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            _local.active = False
+            if recorder:
+                recorder.record(func.__name__, args, kwargs, start,
+                                time.time() - start, error)
+            if metrics:
+                metrics.observe(adc_metrics.OPERATION, (func.__name__,),
+                                time.time() - start, error is not None)
+    return wrapper
@@ -0,0 +1,174 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import contextlib
+import logging
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+
+class _Call(object):
+    """ The outcome of one request, set failed when device is overloaded """
+
+    def __init__(self):
+        self.failed = False
+        self.start = time.time()
+
+    def begin(self):
+        """ The request is sent now, the time the caller waited for
+            something else after the slot isn't the latency of device
+        """
+        self.start = time.time()
+
+
+class AdaptiveLimiter(object):
+    """
+    Limit the concurrency and the rate of the requests sent to one
+    management plane by AIMD. Every request finished in time increases
+    the concurrency limit by 1/limit and the rate by 1/rate, a request
+    which fails or is slower than latency_target halves both of them, at
+    most once per latency_target. max_rate <= 0 means no rate limit.
+    """
+    def __init__(self, name, min_concurrency, max_concurrency,
+                 min_rate, max_rate, latency_target):
+        self.name = name
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.min_rate = min_rate
+        self.max_rate = max(min_rate, max_rate) if max_rate > 0 else 0
+        self.latency_target = latency_target
+
+        self.limit = float(self.max_concurrency)
+        self.rate = float(self.max_rate)
+        self.tokens = max(1.0, self.rate)
+        self.last_refill = time.time()
+        self.last_decrease = 0
+        self.inflight = 0
+        self.cond = threading.Condition()
+
+        self.requests = 0
+        self.errors = 0
+        self.slow = 0
+
+    @contextlib.contextmanager
+    def slot(self):
+        self._acquire()
+        call = _Call()
+        try:
+            yield call
+        except Exception:
+            call.failed = True
+            raise
+        finally:
+            self._release(time.time() - call.start, call.failed)
+
+    def _refill(self, now):
+        if not self.rate:
+            return
+        self.tokens = min(max(1.0, self.rate),
+                          self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def _acquire(self):
+        with self.cond:
+            while True:
+                now = time.time()
+                self._refill(now)
+                if self.inflight < int(self.limit) and (not self.rate or self.tokens >= 1):
+                    break
+                timeout = None
+                if self.rate and self.tokens < 1:
+                    timeout = (1 - self.tokens) / self.rate
+                self.cond.wait(timeout)
+            self.inflight += 1
+            if self.rate:
+                self.tokens -= 1
+
+    def _release(self, latency, failed):
+        with self.cond:
+            self.inflight -= 1
+            self.requests += 1
+            slow = latency > self.latency_target
+            if failed or slow:
+                self.errors += int(failed)
+                self.slow += int(slow)
+                now = time.time()
+                if now - self.last_decrease >= self.latency_target:
+                    self.last_decrease = now
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    if self.rate:
+                        self.rate = max(self.min_rate, self.rate / 2)
+                    LOG.info("Device(%s) is overloaded (latency %.3fs, failed %s), "
+                             "decrease concurrency to %d and rate to %.1f/s",
+                             self.name, latency, failed, int(self.limit), self.rate)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+                if self.rate:
+                    self.rate = min(self.max_rate, self.rate + 1.0 / self.rate)
+            self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {
+                'limit': int(self.limit),
+                'rate': self.rate,
+                'inflight': self.inflight,
+                'requests': self.requests,
+                'errors': self.errors,
+                'slow': self.slow,
+            }
+
+
+class DeviceLimiters(object):
+    """ One AdaptiveLimiter for each management IP """
+
+    def __init__(self, min_concurrency, max_concurrency, min_rate, max_rate,
+                 latency_target):
+        self.options = (min_concurrency, max_concurrency, min_rate, max_rate,
+                        latency_target)
+        self.limiters = {}
+        self.lock = threading.Lock()
+
+    def get(self, url):
+        # https://host:9997/rest/...
+        host = url.split('/')[2].rsplit(':', 1)[0]
+        with self.lock:
+            limiter = self.limiters.get(host, None)
+            if limiter is None:
+                limiter = AdaptiveLimiter(host, *self.options)
+                self.limiters[host] = limiter
+        return limiter
+
+    def stats(self):
+        with self.lock:
+            limiters = dict(self.limiters)
+        return dict((host, limiter.stats()) for host, limiter in limiters.items())
+
+
+@contextlib.contextmanager
+def _no_limit():
+    yield _Call()
+
+
+def host_slot(limiters, url):
+    """ The slot to send a request to the management plane of url """
+    if not limiters:
+        return _no_limit()
+    return limiters.get(url).slot()
+
+
+def is_overloaded(status_code):
+    return status_code == 429 or status_code >= 500
@@ -0,0 +1,316 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import contextlib
+import logging
+import os
+import threading
+import time
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from arraylbaasv1driver.driver.v1.adc_dirty import command_scope
+
+LOG = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+OPERATION = 'array_operation_seconds'
+DEVICE_REQUEST = 'array_device_request_seconds'
+VLAN_LOOKUP = 'array_vlan_lookup_seconds'
+PLUGIN_CALL = 'array_plugin_call_seconds'
+
+# name: (labels, help) of the latency histograms, each one comes with a
+# counter of the failed ones named *_errors_total
+FAMILIES = {
+    OPERATION: (('operation',),
+                'Latency of the ArrayADCDriver operations called by Neutron'),
+    DEVICE_REQUEST: (('device', 'va', 'verb'),
+                     'Latency of the requests to devices, by the verb of the '
+                     'CLI command or the REST method and resource'),
+    VLAN_LOOKUP: ((), 'Latency of looking up the VLAN of a port in DB'),
+    PLUGIN_CALL: (('call',), 'Latency of the calls to the Neutron plugins'),
+}
+
+
+def errors_name(name):
+    return name[:-len('_seconds')] + '_errors_total'
+
+
+def command_verb(cmds):
+    """ The verb of the CLI commands, such as "slb real" or "no slb real",
+        the commands of different verbs sent together are a "batch"
+    """
+    verbs = set()
+    for cmd in cmds.split(';'):
+        words = cmd.split()
+        if not words:
+            continue
+        count = 3 if words[0] == 'no' else 2
+        verbs.add(' '.join(words[:count]))
+    if len(verbs) == 1:
+        return verbs.pop()
+    return 'batch' if verbs else ''
+
+
+def rest_resource(path):
+    """ The resource of a REST path such as /network/interface/VlanInterface,
+        without the name of the object after it
+    """
+    parts = [part for part in path.split('?')[0].split('/') if part]
+    for part in parts:
+        if part[:1].isupper():
+            return part
+    return parts[-1] if parts else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = ['%s="%s"' % (name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append('%s="%s"' % extra)
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+class _Series(object):
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+
+class _Timer(object):
+
+    def __init__(self):
+        self.failed = False
+
+
+class Metrics(object):
+    """
+    The latency histograms and error counters of the driver, kept in memory
+    and rendered in the Prometheus text format
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = dict((name, {}) for name in FAMILIES)
+
+    def observe(self, name, labels, seconds, failed=False):
+        """ labels are the values in the order of the family labels """
+        with self.lock:
+            series = self.series[name].get(labels)
+            if series is None:
+                series = self.series[name][labels] = _Series()
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    series.buckets[index] += 1
+            series.count += 1
+            series.sum += seconds
+            if failed:
+                series.errors += 1
+
+    def mean(self, name):
+        """ The mean seconds of all the series of the family, or None """
+        with self.lock:
+            count = sum(s.count for s in self.series[name].values())
+            total = sum(s.sum for s in self.series[name].values())
+        return total / count if count else None
+
+    @contextlib.contextmanager
+    def timed(self, name, *labels):
+        """ Time the block, it fails when it raises or timer.failed is set """
+        timer = _Timer()
+        start = time.time()
+        try:
+            yield timer
+        except Exception:
+            timer.failed = True
+            raise
+        finally:
+            self.observe(name, labels, time.time() - start, timer.failed)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name in sorted(FAMILIES):
+                label_names, help_text = FAMILIES[name]
+                series = sorted(self.series[name].items())
+                lines.append("# HELP %s %s" % (name, help_text))
+                lines.append("# TYPE %s histogram" % name)
+                for values, s in series:
+                    for bound, count in zip(BUCKETS, s.buckets):
+                        lines.append("%s_bucket%s %d" % (
+                            name, _labels(label_names, values, ('le', repr(bound))), count))
+                    lines.append("%s_bucket%s %d" % (
+                        name, _labels(label_names, values, ('le', '+Inf')), s.count))
+                    lines.append("%s_sum%s %.6f" % (name, _labels(label_names, values), s.sum))
+                    lines.append("%s_count%s %d" % (name, _labels(label_names, values), s.count))
+                errors = errors_name(name)
+                lines.append("# HELP %s Number of the failed ones of %s" % (errors, name))
+                lines.append("# TYPE %s counter" % errors)
+                for values, s in series:
+                    lines.append("%s%s %d" % (errors, _labels(label_names, values), s.errors))
+        return "\n".join(lines) + "\n"
+
+
+@contextlib.contextmanager
+def _no_timer():
+    yield _Timer()
+
+
+def request_labels(base_rest_url, cmd=None, method=None, path=None):
+    """ Return (device, va, verb) of a request to the device of
+        base_rest_url, either the CLI command or the REST method on path
+    """
+    device = urlparse(base_rest_url).hostname or base_rest_url
+    if cmd is not None:
+        (_, va_name), cmds = command_scope(base_rest_url, cmd)
+        return device, va_name or '', command_verb(cmds)
+    return device, '', "%s %s" % (method, rest_resource(path))
+
+
+def device_timer(metrics, base_rest_url, cmd=None, method=None, path=None):
+    """ Time a request to the device of base_rest_url """
+    if not metrics:
+        return _no_timer()
+    return metrics.timed(DEVICE_REQUEST, *request_labels(base_rest_url, cmd, method, path))
+
+
+class InstrumentedPlugin(object):
+    """ Time the method calls of the Neutron plugin and its core plugin,
+        and open a span for each of them when there is a tracer,
+        everything else is passed through
+    """
+    def __init__(self, plugin, metrics=None, tracer=None, prefix=''):
+        self._plugin = plugin
+        self._metrics = metrics
+        self._tracer = tracer
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        value = getattr(self._plugin, name)
+        if name == '_core_plugin':
+            return InstrumentedPlugin(value, self._metrics, self._tracer, 'core.')
+        if not callable(value):
+            return value
+        call = self._prefix + name
+
+        def instrumented(*args, **kwargs):
+            if self._tracer:
+                with self._tracer.span(call):
+                    return self._call(call, value, args, kwargs)
+            return self._call(call, value, args, kwargs)
+        return instrumented
+
+    def _call(self, call, func, args, kwargs):
+        if self._metrics:
+            with self._metrics.timed(PLUGIN_CALL, call):
+                return func(*args, **kwargs)
+        return func(*args, **kwargs)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        LOG.debug("metrics %s - %s", self.address_string(), format % args)
+
+
+class MetricsExporter(object):
+    """
+    Export the metrics by writing them to a file every interval seconds,
+    "%(pid)s" in the path is replaced by the process id, and by serving
+    them on http://listen/metrics. Either one can be disabled by an
+    empty value.
+    """
+    def __init__(self, metrics, path='', listen='', interval=15):
+        self.metrics = metrics
+        self.template = path
+        self.path = ''
+        self.listen = listen
+        self.interval = interval
+        self.server = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        """ Start the exporter once in every process. The workers of
+            neutron-server are forked after the driver is created, the
+            threads and the server of the parent aren't theirs.
+        """
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self.start()
+        return self
+
+    def start(self):
+        self._pid = os.getpid()
+        self.path = self.template % {'pid': self._pid} if self.template else ''
+        self.server = None
+        if self.path:
+            thread = threading.Thread(target=self._write_periodically)
+            thread.daemon = True
+            thread.start()
+        if self.listen:
+            host, _, port = self.listen.rpartition(':')
+            try:
+                self.server = HTTPServer((host or '127.0.0.1', int(port)), _MetricsHandler)
+            except (IOError, OSError) as e:
+                # the other workers of neutron-server may have taken it
+                LOG.warning("Failed to serve the metrics on %s: %s", self.listen, e)
+                return self
+            self.server.metrics = self.metrics
+            thread = threading.Thread(target=self.server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            LOG.info("Serving the metrics on %s", self.listen)
+        return self
+
+    def write(self):
+        """ Replace the file at once, so that it is never read half written """
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.metrics.render())
+        os.rename(tmp, self.path)
+
+    def _write_periodically(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except (IOError, OSError) as e:
+                LOG.warning("Failed to write the metrics to %s: %s", self.path, e)
@@ -0,0 +1,206 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import collections
+import logging
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+OP_CREATE = 'create'
+OP_UPDATE = 'update'
+OP_DELETE = 'delete'
+
+
+class PendingOperation(object):
+
+    def __init__(self, obj_type, op, args):
+        self.obj_type = obj_type
+        self.op = op
+        self.args = args
+
+    @property
+    def obj(self):
+        """ The latest state of the object """
+        return self.args[-1]
+
+
+class OperationQueue(object):
+    """
+    Hold the operations of VIPs and members for a short window before
+    dispatching them in order. The operations of the same object are
+    merged while they are pending:
+
+        create + update(s) -> create with the final state
+        update + update    -> one update from the first old state
+        update + delete    -> delete
+        create + delete    -> nothing is sent to device
+
+    dispatch(obj_type, op, args) runs the operation against the devices,
+    cancel(obj_type, op, args) finishes the delete annihilated with its
+    create in Neutron only, and counter() returns the number of device
+    calls so far, which is used to estimate the saved device calls.
+
+    The operations of a pool itself and its health monitors aren't held,
+    flush(pool_id) runs the pending operations of the pool before them
+    so that they reach the devices in the order they were made.
+    """
+    def __init__(self, window, dispatch, cancel, counter):
+        self.window = window
+        self.dispatch = dispatch
+        self.cancel = cancel
+        self.counter = counter
+
+        self.entries = collections.OrderedDict()
+        self.cond = threading.Condition()
+        self.local = threading.local()
+        self.thread = None
+        # the entry being dispatched by the thread
+        self.running = None
+
+        self.cost = {}
+        self.saved_ops = 0
+        self.saved_calls = 0.0
+
+    def in_dispatch(self):
+        return getattr(self.local, 'dispatching', False)
+
+    def _start(self):
+        if self.thread:
+            return
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, obj_type, obj_id, op, *args):
+        new = PendingOperation(obj_type, op, args)
+        cancelled = None
+        with self.cond:
+            self._start()
+            key = (obj_type, obj_id)
+            entry = self.entries.get(key, None)
+            if entry is None:
+                self.entries[key] = {'time': time.time(), 'ops': [new]}
+                self.cond.notify_all()
+                return
+
+            last = entry['ops'][-1]
+            merged = self._merge(last, new)
+            if merged is None:
+                entry['ops'].append(new)
+            elif merged is last:
+                LOG.debug("Cancel %s %s(%s) with its %s", op, obj_type,
+                          obj_id, last.op)
+                entry['ops'].pop()
+                if not entry['ops']:
+                    self.entries.pop(key)
+                self._saved(last)
+                self._saved(new)
+                cancelled = new
+            else:
+                LOG.debug("Merge %s into %s of %s(%s)", op, last.op,
+                          obj_type, obj_id)
+                entry['ops'][-1] = merged
+                self._saved(last if merged is new else new)
+
+        if cancelled:
+            self.cancel(cancelled.obj_type, cancelled.op, cancelled.args)
+
+    def flush(self, pool_id):
+        """ Dispatch the pending operations of the pool in the calling
+            thread, after the one of the pool being dispatched if any
+        """
+        with self.cond:
+            while self.running and self._of_pool(self.running, pool_id):
+                self.cond.wait()
+            entries = [(key, entry) for key, entry in self.entries.items()
+                       if self._of_pool(entry, pool_id)]
+            for key, _ in entries:
+                self.entries.pop(key)
+
+        for _, entry in entries:
+            LOG.debug("Flush %d operations of pool(%s)", len(entry['ops']),
+                      pool_id)
+            for operation in entry['ops']:
+                self._dispatch(operation)
+
+    @staticmethod
+    def _of_pool(entry, pool_id):
+        """ The old state of an update counts since a member may move """
+        return any(arg.get('pool_id') == pool_id
+                   for operation in entry['ops'] for arg in operation.args)
+
+    def _merge(self, last, new):
+        """ Return the merged operation, last itself means both of them
+            are cancelled, None means they cannot be merged.
+        """
+        if last.op == OP_CREATE and new.op == OP_DELETE:
+            return last
+        if last.op == OP_CREATE and new.op == OP_UPDATE:
+            if last.obj.get('pool_id') != new.obj.get('pool_id'):
+                return None
+            return PendingOperation(last.obj_type, OP_CREATE, (new.obj,))
+        if last.op == OP_UPDATE and new.op == OP_UPDATE:
+            return PendingOperation(last.obj_type, OP_UPDATE,
+                                    (last.args[0], new.obj))
+        if last.op == OP_UPDATE and new.op == OP_DELETE:
+            return new
+        return None
+
+    def _saved(self, operation):
+        total, count = self.cost.get((operation.obj_type, operation.op), (0, 0))
+        self.saved_ops += 1
+        if count:
+            self.saved_calls += float(total) / count
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.entries:
+                    self.cond.wait()
+                key, entry = next(iter(self.entries.items()))
+                delay = entry['time'] + self.window - time.time()
+                if delay > 0:
+                    self.cond.wait(delay)
+                    continue
+                self.entries.pop(key)
+                self.running = entry
+
+            try:
+                for operation in entry['ops']:
+                    self._dispatch(operation)
+            finally:
+                with self.cond:
+                    self.running = None
+                    self.cond.notify_all()
+
+    def _dispatch(self, operation):
+        start = self.counter()
+        self.local.dispatching = True
+        try:
+            self.dispatch(operation.obj_type, operation.op, operation.args)
+        except Exception as e:
+            LOG.exception("Failed to %s %s: %s", operation.op,
+                          operation.obj_type, e)
+        finally:
+            self.local.dispatching = False
+
+        calls = self.counter() - start
+        key = (operation.obj_type, operation.op)
+        total, count = self.cost.get(key, (0, 0))
+        self.cost[key] = (total + calls, count + 1)
+        LOG.debug("Dispatched %s %s with %d device calls, saved %d operations "
+                  "and about %d device calls so far", operation.op,
+                  operation.obj_type, calls, self.saved_ops, self.saved_calls)
@@ -0,0 +1,268 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import heapq
+import logging
+import time
+
+LOG = logging.getLogger(__name__)
+
+ACTION_CREATE = 'create'
+ACTION_UPDATE = 'update'
+ACTION_DELETE = 'delete'
+
+try:
+    _text_type = unicode
+except NameError:
+    _text_type = str
+
+
+class Command(_text_type):
+    """
+    A device command, which is still the CLI text so it can be sent as it
+    is, together with the object it changes and the objects it requires.
+    The object is identified by (obj_type, name).
+    """
+    def __new__(cls, text, obj_type=None, name=None, action=None, requires=()):
+        self = _text_type.__new__(cls, text)
+        self.obj_type = obj_type
+        self.name = name
+        self.action = action
+        self.requires = tuple(requires)
+        return self
+
+    @property
+    def key(self):
+        if self.obj_type is None:
+            return None
+        return (self.obj_type, self.name)
+
+
+def as_command(cmd):
+    if isinstance(cmd, Command):
+        return cmd
+    return Command(cmd)
+
+
+class _Step(object):
+
+    def __init__(self, scope, command):
+        self.scope = scope
+        self.command = command
+
+    def key(self):
+        return (self.scope, self.command.key)
+
+    def requires(self):
+        return [(self.scope, key) for key in self.command.requires]
+
+    def cost(self):
+        return self.command.count(';') + 1
+
+
+class Plan(object):
+    """
+    The device commands of one Neutron operation. The scope of a command
+    is where it runs, such as the VA name on AVX. The untyped commands are
+    barriers which nothing is moved across.
+    """
+    def __init__(self):
+        self.steps = []
+
+    def __len__(self):
+        return len(self.steps)
+
+    def add(self, cmd, scope=None):
+        if cmd:
+            self.steps.append(_Step(scope, as_command(cmd)))
+
+    def extend(self, cmds, scope=None):
+        for cmd in cmds:
+            self.add(cmd, scope)
+
+    def optimize(self):
+        count = len(self.steps)
+        self.steps = _dedupe(self.steps)
+        self.steps = _cancel(self.steps)
+        self.steps = _reorder(self.steps)
+        if count != len(self.steps):
+            LOG.debug("Optimized the plan from %d to %d commands",
+                      count, len(self.steps))
+        return self
+
+    def batches(self, batch_size):
+        """ Yield (scope, commands) of the consecutive commands in the same
+            scope, each batch has at most batch_size commands
+        """
+        batch_size = max(1, batch_size)
+        scope = None
+        batch = []
+        size = 0
+        for step in self.steps:
+            if batch and (step.scope != scope or size + step.cost() > batch_size):
+                yield scope, batch
+                batch = []
+                size = 0
+            scope = step.scope
+            batch.append(step.command)
+            size += step.cost()
+        if batch:
+            yield scope, batch
+
+
+def _dedupe(steps):
+    """ Drop a command identical to the last one of its object, unless an
+        object it requires was changed in between
+    """
+    result = []
+    last = {}
+    versions = {}
+    for step in steps:
+        if step.command.key is None:
+            last.clear()
+            result.append(step)
+            continue
+        key = step.key()
+        required = tuple(versions.get(r, 0) for r in step.requires())
+        if last.get(key) == (step.command, required):
+            LOG.debug("Drop the duplicated command: %s", step.command)
+            continue
+        last[key] = (step.command, required)
+        versions[key] = versions.get(key, 0) + 1
+        result.append(step)
+    return result
+
+
+def _cancel(steps):
+    """ Drop a create and the delete of the same object when nothing used
+        the object in between
+    """
+    removed = set()
+    created = {}
+    for index, step in enumerate(steps):
+        if step.command.key is None:
+            created.clear()
+            continue
+        for key in step.requires():
+            created.pop(key, None)
+        key = step.key()
+        action = step.command.action
+        if action == ACTION_DELETE and key in created:
+            LOG.debug("Cancel the command with its delete: %s", steps[created[key]].command)
+            removed.add(created.pop(key))
+            removed.add(index)
+        elif action == ACTION_CREATE:
+            created[key] = index
+        else:
+            created.pop(key, None)
+    return [step for index, step in enumerate(steps) if index not in removed]
+
+
+def _reorder(steps):
+    """
+    Keep the order of the commands on the same object and of the commands
+    on the objects they require, while moving the commands of the same
+    scope together so that they can be sent in fewer batches.
+    """
+    count = len(steps)
+    preds = [0] * count
+    succs = [[] for _ in range(count)]
+
+    def edge(i, j):
+        if i is not None and i != j:
+            succs[i].append(j)
+            preds[j] += 1
+
+    writer = {}
+    readers = {}
+    barrier = None
+    since_barrier = []
+    for j, step in enumerate(steps):
+        if step.command.key is None:
+            for i in since_barrier:
+                edge(i, j)
+            edge(barrier, j)
+            barrier = j
+            since_barrier = []
+            writer.clear()
+            readers.clear()
+            continue
+        edge(barrier, j)
+        since_barrier.append(j)
+        for key in step.requires():
+            edge(writer.get(key), j)
+            readers.setdefault(key, []).append(j)
+        key = step.key()
+        edge(writer.get(key), j)
+        for i in readers.pop(key, []):
+            edge(i, j)
+        writer[key] = j
+
+    ready = {}
+    for j in range(count):
+        if not preds[j]:
+            heapq.heappush(ready.setdefault(steps[j].scope, []), j)
+
+    result = []
+    scope = None
+    while len(result) < count:
+        if not ready.get(scope):
+            scope = min((heap[0], s) for s, heap in ready.items() if heap)[1]
+        i = heapq.heappop(ready[scope])
+        result.append(steps[i])
+        for j in succs[i]:
+            preds[j] -= 1
+            if not preds[j]:
+                heapq.heappush(ready.setdefault(steps[j].scope, []), j)
+    return result
+
+
+def stream_batches(cmds, batch_size, name="commands"):
+    """
+    Yield lists of at most batch_size commands from the iterable cmds
+    without holding more than one batch, and log the throughput when the
+    stream is exhausted. The commands are kept in their order.
+    """
+    batch_size = max(1, batch_size)
+    start = time.time()
+    batch = []
+    size = 0
+    count = 0
+    batches = 0
+    for cmd in cmds:
+        if not cmd:
+            continue
+        cost = cmd.count(';') + 1
+        if batch and size + cost > batch_size:
+            batches += 1
+            yield batch
+            batch = []
+            size = 0
+        batch.append(cmd)
+        size += cost
+        count += 1
+    if batch:
+        batches += 1
+        yield batch
+    elapsed = time.time() - start
+    LOG.info("Streamed %d %s in %d batches in %.2f seconds, %.1f per second",
+             count, name, batches, elapsed, count / elapsed if elapsed else 0)
+
+
+def apv_syntax(scope, cmds):
+    return "; ".join(cmds)
+
+
+def avx_syntax(va_name, cmds):
+    return "va run %s \"%s\"" % (va_name, "; ".join(cmds))
@@ -0,0 +1,217 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+import time
+
+from oslo.config import cfg
+from oslo_log import log as logging
+
+from neutron import context as n_context
+from neutron.api.v2 import attributes
+from neutron.common import exceptions as n_exc
+
+LOG = logging.getLogger(__name__)
+
+POOL_PORT_PREFIX = '_lb-port-pool-'
+
+# The options are registered by device_driver when it is imported
+
+
+class InterfacePortPool(object):
+    """
+    The warm pool of admin-down ports used as the interface addresses
+    in HA mode. The ports are created in the background for each subnet
+    in use, so that create_vip doesn't wait for create_port. The ports
+    are owned by the tenant of the VIP, so there is a pool for each
+    (tenant_id, subnet_id), which is dropped when the subnet is gone.
+    """
+    def __init__(self, plugin, device_owner):
+        self.plugin = plugin
+        self.device_owner = device_owner
+        self.low_water = cfg.CONF.arraynetworks.array_port_pool_low_water
+        self.high_water = cfg.CONF.arraynetworks.array_port_pool_high_water
+        self.refill_rate = cfg.CONF.arraynetworks.array_port_pool_refill_rate
+        self.low_water = min(self.low_water, self.high_water)
+
+        self.subnets = {}
+        self.ports = {}
+        self.garbage = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    @property
+    def core_plugin(self):
+        return self.plugin._core_plugin
+
+    @property
+    def enabled(self):
+        return self.high_water > 0
+
+    def _start(self):
+        if self.thread:
+            return
+        LOG.debug("Start the refill thread of interface port pool")
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def claim(self, context, tenant_id, subnet, count):
+        """ Take at most count ports of the tenant in the subnet out of
+            the pool
+        """
+        ports = []
+        if not self.enabled:
+            return ports
+
+        self._start()
+        key = (tenant_id, subnet['id'])
+        with self.lock:
+            self.subnets[key] = subnet
+            available = self.ports.setdefault(key, [])
+            while available and len(ports) < count:
+                ports.append(available.pop(0))
+            if len(available) < max(self.low_water, 1):
+                self.wakeup.set()
+        LOG.debug("Claimed %d ports from the pool of subnet(%s) of tenant(%s)",
+                  len(ports), subnet['id'], tenant_id)
+        return ports
+
+    def release(self, context, port_ids):
+        """ Put the ports back into the pool, the ports which are over the
+            high water are deleted in the background.
+        """
+        for port_id in port_ids:
+            if not self.enabled:
+                self.core_plugin.delete_port(context, port_id)
+                continue
+
+            port = self.core_plugin.get_port(context, port_id)
+            subnet_id = port['fixed_ips'][0]['subnet_id']
+            key = (port['tenant_id'], subnet_id)
+            with self.lock:
+                reusable = (key in self.subnets and
+                            len(self.ports.get(key, [])) < self.high_water)
+                if not reusable:
+                    self.garbage.append(port_id)
+                    self.wakeup.set()
+                    continue
+            port = self.core_plugin.update_port(context, port_id,
+                                                {'port': self._pool_port_attrs(subnet_id)})
+            with self.lock:
+                self.ports.setdefault(key, []).append(port)
+        LOG.debug("Released ports(%s) into the pool", port_ids)
+
+    def _pool_port_attrs(self, subnet_id):
+        return {
+            'name': POOL_PORT_PREFIX + subnet_id,
+            'device_id': POOL_PORT_PREFIX + subnet_id
+        }
+
+    def _adopt(self, context):
+        """ Take over the ports pre-created before restarting """
+        filters = {'device_owner': [self.device_owner]}
+        for port in self.core_plugin.get_ports(context, filters=filters):
+            if not port['device_id'].startswith(POOL_PORT_PREFIX):
+                continue
+            subnet_id = port['fixed_ips'][0]['subnet_id']
+            key = (port['tenant_id'], subnet_id)
+            if key not in self.subnets:
+                subnet = self.core_plugin.get_subnet(context, subnet_id)
+                with self.lock:
+                    self.subnets.setdefault(key, subnet)
+            with self.lock:
+                pooled = self.ports.setdefault(key, [])
+                if port['id'] not in [p['id'] for p in pooled]:
+                    pooled.append(port)
+        LOG.debug("After adopting, the port pool is %s", self.ports)
+
+    def _create_port(self, context, tenant_id, subnet):
+        attrs = self._pool_port_attrs(subnet['id'])
+        port_data = {
+            'tenant_id': tenant_id,
+            'name': attrs['name'],
+            'network_id': subnet['network_id'],
+            'mac_address': attributes.ATTR_NOT_SPECIFIED,
+            'admin_state_up': False,
+            'device_id': attrs['device_id'],
+            'device_owner': self.device_owner,
+            'fixed_ips': [{'subnet_id': subnet['id']}]
+        }
+        return self.core_plugin.create_port(context, {'port': port_data})
+
+    def _drop_subnet(self, subnet_id):
+        """ Stop refilling the deleted subnet, the ports left in its pools
+            are deleted if they are still there
+        """
+        with self.lock:
+            for key in [key for key in self.subnets if key[1] == subnet_id]:
+                self.subnets.pop(key)
+                self.garbage.extend(port['id'] for port in self.ports.pop(key, []))
+        LOG.debug("Dropped the deleted subnet(%s) from the port pool", subnet_id)
+
+    def _refill(self, context):
+        interval = 1.0 / self.refill_rate if self.refill_rate > 0 else 0
+
+        with self.lock:
+            garbage = self.garbage
+            self.garbage = []
+        for port_id in garbage:
+            try:
+                self.core_plugin.delete_port(context, port_id)
+            except Exception as e:
+                LOG.warning("Failed to delete the port(%s): %s", port_id, e)
+
+        with self.lock:
+            shortage = {}
+            for key, subnet in self.subnets.items():
+                size = len(self.ports.setdefault(key, []))
+                if size < self.low_water or (size == 0 and self.high_water):
+                    shortage[key] = (subnet, self.high_water - size)
+
+        for (tenant_id, subnet_id), (subnet, needed) in shortage.items():
+            LOG.debug("Will create %d ports for subnet(%s) of tenant(%s)",
+                      needed, subnet_id, tenant_id)
+            for _ in range(needed):
+                try:
+                    port = self._create_port(context, tenant_id, subnet)
+                except n_exc.NotFound as e:
+                    LOG.info("The subnet(%s) is gone: %s", subnet_id, e)
+                    self._drop_subnet(subnet_id)
+                    break
+                except Exception as e:
+                    LOG.warning("Failed to refill the subnet(%s): %s", subnet_id, e)
+                    break
+                with self.lock:
+                    if (tenant_id, subnet_id) not in self.subnets:
+                        # dropped in the meantime
+                        self.garbage.append(port['id'])
+                        break
+                    self.ports[(tenant_id, subnet_id)].append(port)
+                time.sleep(interval)
+
+    def _run(self):
+        context = n_context.get_admin_context()
+        adopted = False
+        while True:
+            self.wakeup.wait(10)
+            self.wakeup.clear()
+            try:
+                if not adopted:
+                    self._adopt(context)
+                    adopted = True
+                self._refill(context)
+            except Exception as e:
+                LOG.exception("Failed to refill the port pool: %s", e)
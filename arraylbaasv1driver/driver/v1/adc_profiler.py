@@ -0,0 +1,144 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import contextlib
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+SUFFIX = '.prof'
+
+
+def parse_operations(value):
+    """ The comma separated operation names, empty means all of them """
+    return frozenset(op.strip() for op in (value or '').split(',') if op.strip())
+
+
+class OperationProfiler(object):
+    """
+    Profile the sampled calls of the selected operations with cProfile
+    while it is enabled, and dump each profile into the directory as
+    <operation>-<time>-<pid>.prof, which can be read by pstats.
+
+    Only one call is profiled at a time, the others run as usual, so that
+    the profiles don't mix the calls interleaved on one thread. The
+    oldest dumps are removed beyond max_dumps, and the profiler disables
+    itself after duration seconds unless duration is 0.
+    """
+    def __init__(self, directory, operations=None, rate=0.1, max_dumps=100,
+                 duration=300):
+        self.directory = directory
+        self.configure(operations, rate, max_dumps, duration)
+        self.enabled_until = None
+        self.busy = threading.Lock()
+        self.dumps = 0
+
+    def configure(self, operations=None, rate=0.1, max_dumps=100, duration=300):
+        self.operations = frozenset(operations or [])
+        self.rate = rate
+        self.max_dumps = max_dumps
+        self.duration = duration
+
+    @property
+    def enabled(self):
+        if self.enabled_until is None:
+            return False
+        if self.enabled_until and time.time() > self.enabled_until:
+            LOG.info("Profiling of the operations expired")
+            self.enabled_until = None
+            return False
+        return True
+
+    def enable(self):
+        self.enabled_until = time.time() + self.duration if self.duration > 0 else 0
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError as e:
+                # another worker of neutron-server may have made it
+                LOG.debug("Failed to make %s: %s", self.directory, e)
+        LOG.info("Profiling %s of the operations %s into %s for %s seconds",
+                 self.rate, ','.join(sorted(self.operations)) or 'all',
+                 self.directory, self.duration or 'unlimited')
+
+    def disable(self):
+        self.enabled_until = None
+        LOG.info("Stopped profiling the operations, %d dumps so far", self.dumps)
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def _selected(self, op):
+        if not self.enabled:
+            return False
+        if self.operations and op not in self.operations:
+            return False
+        return random.random() < self.rate
+
+    @contextlib.contextmanager
+    def profile(self, op):
+        if not self._selected(op) or not self.busy.acquire(False):
+            yield
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                self._dump(op, profile)
+        finally:
+            self.busy.release()
+
+    def _dump(self, op, profile):
+        now = time.time()
+        name = "%s-%s%03d-%d%s" % (op, time.strftime('%Y%m%dT%H%M%S', time.localtime(now)),
+                                   int(now * 1000) % 1000, os.getpid(), SUFFIX)
+        try:
+            profile.dump_stats(os.path.join(self.directory, name))
+            self.dumps += 1
+            self._expire()
+        except (IOError, OSError) as e:
+            LOG.warning("Failed to dump the profile of %s: %s", op, e)
+
+    def _expire(self):
+        """ Remove the oldest dumps beyond max_dumps """
+        dumps = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if name.endswith(SUFFIX)]
+        if len(dumps) <= self.max_dumps:
+            return
+        dumps.sort(key=os.path.getmtime)
+        for path in dumps[:len(dumps) - self.max_dumps]:
+            os.remove(path)
+
+
+@contextlib.contextmanager
+def _no_profile():
+    yield
+
+
+def profile(profiler, op):
+    """ Profile the operation when the profiler selects it """
+    if not profiler:
+        return _no_profile()
+    return profiler.profile(op)
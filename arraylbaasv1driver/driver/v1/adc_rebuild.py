@@ -0,0 +1,171 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import logging
+import shlex
+import time
+
+import netaddr
+
+from arraylbaasv1driver.driver.v1.adc_utils import run_concurrently
+
+LOG = logging.getLogger(__name__)
+
+# the interface ports of the host at index i are named _lb-port-<i>-<subnet>
+INTERFACE_PORT_PREFIX = '_lb-port-'
+
+
+def cli_output(text):
+    """ Get the plain output from the response of cli_extend """
+    try:
+        content = json.loads(text)
+    except ValueError:
+        content = text
+    if isinstance(content, dict):
+        content = "\n".join([v for v in content.values()
+                             if isinstance(v, type(u""))
+                             or isinstance(v, str)])
+    return content.replace('\\n', '\n')
+
+
+def parse_running_config(text):
+    """
+    Parse the running configuration of APV/VA into the objects created
+    by this driver.
+    """
+    config = {
+        'vlans': {},
+        'addresses': {},
+        'routes': [],
+        'groups': [],
+        'members': [],
+        'virtuals': {},
+        'policies': {},
+    }
+    for line in cli_output(text).splitlines():
+        try:
+            words = shlex.split(line.strip())
+        except ValueError:
+            continue
+        if len(words) < 3:
+            continue
+        if words[0] == 'vlan' and len(words) >= 4:
+            config['vlans'][words[2]] = words[3]
+        elif words[:2] == ['ip', 'address'] and len(words) >= 5:
+            config['addresses'][words[2]] = (words[3], words[4])
+        elif words[:3] == ['ip', 'route', 'default'] and len(words) >= 4:
+            config['routes'].append(words[3])
+        elif words[:3] == ['slb', 'group', 'method'] and len(words) >= 4:
+            config['groups'].append(words[3])
+        elif words[:3] == ['slb', 'group', 'member'] and len(words) >= 5:
+            config['members'].append((words[3], words[4]))
+        elif words[:2] == ['slb', 'virtual'] and len(words) >= 5:
+            config['virtuals'][words[3]] = words[4]
+        elif words[:3] == ['slb', 'policy', 'default'] and len(words) >= 5:
+            config['policies'][words[3]] = words[4]
+    return config
+
+
+def interface_of_address(config, address):
+    """ Find the interface whose subnet contains the address """
+    for interface, (ip, netmask) in config['addresses'].items():
+        try:
+            if netaddr.IPAddress(address) in netaddr.IPNetwork("%s/%s" % (ip, netmask)):
+                return interface
+        except (netaddr.AddrFormatError, ValueError):
+            continue
+    return None
+
+
+def interface_ports(ports, index):
+    """ Return {subnet_id: [port]} of the interface ports of the host at
+        index of the hosts
+    """
+    prefix = '%s%d-' % (INTERFACE_PORT_PREFIX, index)
+    by_subnet = {}
+    for port in sorted(ports, key=lambda port: port['id']):
+        if port.get('name', '').startswith(prefix):
+            subnet_id = port['fixed_ips'][0]['subnet_id']
+            by_subnet.setdefault(subnet_id, []).append(port)
+    return by_subnet
+
+
+def claim_interface_ports(free, vip_ids, vips, address):
+    """
+    Give each VIP on an interface a port of its subnet from free, the
+    interface ports of one host by interface_ports(). The interface
+    ports of the same host and subnet are interchangeable, except the
+    one with the address configured on the interface, which goes to the
+    first VIP of its subnet. Return {vip_id: port}.
+    """
+    claimed = {}
+    vip_ids = list(vip_ids)
+    for subnet_id, subnet_ports in free.items():
+        for port in subnet_ports:
+            if port['fixed_ips'][0]['ip_address'] != address:
+                continue
+            for vip_id in vip_ids:
+                if vips.get(vip_id, {}).get('subnet_id', subnet_id) == subnet_id:
+                    subnet_ports.remove(port)
+                    vip_ids.remove(vip_id)
+                    claimed[vip_id] = port
+                    break
+            break
+    for vip_id in vip_ids:
+        subnet_ports = free.get(vips.get(vip_id, {}).get('subnet_id'), [])
+        if subnet_ports:
+            claimed[vip_id] = subnet_ports.pop(0)
+        else:
+            LOG.warning("Rebuild: cannot find the interface port of vip(%s)", vip_id)
+    return claimed
+
+
+def collect_running_configs(show_running, targets, concurrency):
+    """
+    Query the running configuration of all targets concurrently, the
+    target is what show_running accepts such as (host, va_name). Return
+    {target: config}, the targets failed to query are left out.
+    """
+    targets = list(targets)
+    start = time.time()
+    step = max(1, len(targets) // 10)
+
+    def progress(done):
+        if done % step == 0 or done == len(targets):
+            elapsed = time.time() - start
+            LOG.info("Rebuild: queried %d/%d targets in %.1f seconds",
+                     done, len(targets), elapsed)
+
+    configs = {}
+    results = run_concurrently(lambda target: parse_running_config(show_running(target)),
+                               targets, concurrency, progress)
+    for target, config, error in results:
+        if error:
+            LOG.error("Rebuild: failed to query %s: %s", target, error)
+            continue
+        configs[target] = config
+
+    elapsed = time.time() - start
+    LOG.info("Rebuild: queried %d targets (%d failed) in %.2f seconds, "
+             "%.1f targets per second", len(targets), len(targets) - len(configs),
+             elapsed, len(targets) / elapsed if elapsed else 0)
+    return configs
+
+
+def report_orphans(ports, used_port_ids):
+    orphans = [port['id'] for port in ports if port['id'] not in used_port_ids]
+    if orphans:
+        LOG.warning("Rebuild: ports(%s) are not used by any device", orphans)
+    return orphans
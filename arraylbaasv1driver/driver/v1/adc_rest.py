@@ -0,0 +1,83 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from arraylbaasv1driver.driver.v1.exceptions import ArrayADCException
+
+TYPE_VLAN = 'vlan'
+
+OP_CREATE = 'POST'
+OP_DELETE = 'DELETE'
+
+# The collection of each object type under base_rest_url, only the
+# resources verified against the REST API of APV are here
+RESOURCES = {
+    TYPE_VLAN: '/network/interface/VlanInterface',
+}
+
+
+class RestObject(object):
+    """ One object pushed to the structured REST resource of obj_type """
+
+    def __init__(self, obj_type, op, name, payload=None):
+        self.obj_type = obj_type
+        self.op = op
+        self.name = name
+        self.payload = payload
+
+    def __repr__(self):
+        return "%s %s(%s)" % (self.op, self.obj_type, self.name)
+
+
+def vlan(interface, vlan_device_name, vlan_tag):
+    return RestObject(TYPE_VLAN, OP_CREATE, vlan_device_name, {
+        "name": vlan_device_name,
+        "tag": vlan_tag,
+        "interface": interface
+    })
+
+
+def no_vlan(vlan_device_name):
+    return RestObject(TYPE_VLAN, OP_DELETE, vlan_device_name)
+
+
+def parse_types(value):
+    """ Parse the comma separated object types, raise on the unsupported """
+    types = set()
+    for obj_type in (value or "").split(','):
+        obj_type = obj_type.strip()
+        if not obj_type:
+            continue
+        if obj_type not in RESOURCES:
+            msg = "Structured REST isn't supported for %s, choose from %s" % (
+                obj_type, ', '.join(sorted(RESOURCES)))
+            raise ArrayADCException(msg)
+        types.add(obj_type)
+    return types
+
+
+class RestTransport(object):
+    """
+    Push RestObjects to the structured REST resources of a device by
+    request(base_rest_url, method, path, payload), which raises
+    ArrayADCException on failure.
+    """
+    def __init__(self, request):
+        self.request = request
+
+    def push(self, base_rest_url, obj):
+        path = RESOURCES[obj.obj_type]
+        if obj.op == OP_DELETE:
+            self.request(base_rest_url, OP_DELETE, '%s/%s' % (path, obj.name))
+        else:
+            self.request(base_rest_url, obj.op, path, obj.payload)
@@ -0,0 +1,319 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+from arraylbaasv1driver.driver.v1.adc_utils import run_concurrently
+from arraylbaasv1driver.driver.v1.exceptions import ArrayADCException
+
+LOG = logging.getLogger(__name__)
+
+
+class Checkpoint(object):
+    """
+    The pools which were resynced and saved on the target, kept in a JSON
+    file so that an interrupted resync goes on after them. The file of
+    another target is refused instead of being resumed.
+    """
+    def __init__(self, path, target):
+        self.path = path
+        self.target = target
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return set()
+        with open(self.path, 'r') as f:
+            content = json.load(f)
+        if content.get('target') != self.target:
+            msg = "The checkpoint %s is of %s, not %s" % (
+                self.path, content.get('target'), self.target)
+            raise ArrayADCException(msg)
+        return set(content.get('done', []))
+
+    def save(self, done):
+        """ Replace the file at once, so that it is never read half written """
+        if not self.path:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'target': self.target, 'done': sorted(done),
+                       'updated': time.time()}, f)
+        os.rename(tmp, self.path)
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Progress(object):
+    """ Log the resynced pools and members with the estimated time left,
+        the members are the most of the requests so they weigh the ETA
+    """
+    def __init__(self, pools, members, interval=10):
+        self.pools = pools
+        self.members = members
+        self.interval = interval
+        self.done_pools = 0
+        self.done_members = 0
+        self.start = time.time()
+        self.logged = 0
+        self.lock = threading.Lock()
+
+    def eta(self):
+        """ The seconds left at the rate so far, None before the first pool """
+        done = self.done_pools + self.done_members
+        if not done:
+            return None
+        left = self.pools + self.members - done
+        return (time.time() - self.start) / done * left
+
+    def update(self, members):
+        with self.lock:
+            self.done_pools += 1
+            self.done_members += members
+            now = time.time()
+            if now - self.logged < self.interval and self.done_pools < self.pools:
+                return
+            self.logged = now
+            eta = self.eta()
+            LOG.info("Resync: %d/%d pools and %d/%d members in %.1f seconds, "
+                     "%.0f seconds left", self.done_pools, self.pools,
+                     self.done_members, self.members, now - self.start, eta or 0)
+
+
+class ReservedPortPool(object):
+    """
+    The port pool of the resync, it hands out the interface ports which
+    the VIP already has on each host instead of creating new ones, they
+    are reserved by the thread before the VIP is created. Unless it is
+    strict, the VIPs without ports get new ones.
+    """
+    def __init__(self, plugin, hosts, strict=True):
+        self.plugin = plugin
+        self.hosts = hosts
+        self.strict = strict
+        self.local = threading.local()
+
+    @contextlib.contextmanager
+    def reserved(self, interface_map):
+        self.local.interface_map = interface_map
+        try:
+            yield
+        finally:
+            self.local.interface_map = None
+
+    def claim(self, context, tenant_id, subnet, count):
+        interface_map = getattr(self.local, 'interface_map', None) or {}
+        missing = [host for host in self.hosts if host not in interface_map]
+        if missing and not self.strict:
+            return []
+        if missing:
+            msg = "No interface ports of subnet(%s) on hosts(%s) in the mapping" % (
+                subnet['id'], missing)
+            raise ArrayADCException(msg)
+        return [self.plugin._core_plugin.get_port(context, interface_map[host])
+                for host in self.hosts]
+
+    def release(self, context, port_ids):
+        pass
+
+
+class DeviceResync(object):
+    """
+    Push the pools of Neutron to one device, or one VA of it, again with
+    the detached driver of ArrayADCDriver.resync_device().
+
+    The pools run in parallel, except that the pools sharing objects on
+    the device run one by one in the same group: the pools of one VA, the
+    pools whose VIPs are on one network of APV, or all the pools of APV
+    when the real servers or health monitors are shared. The configuration is saved
+    every checkpoint_interval pools, and then the checkpoint is updated.
+    """
+    def __init__(self, driver, host, va_name=None, concurrency=8,
+                 checkpoint=None, checkpoint_interval=50, refs=None):
+        self.driver = driver
+        self.client = driver.client
+        self.host = host
+        self.va_name = va_name
+        self.concurrency = concurrency
+        target = (host or 'all') + ('/' + va_name if va_name else '')
+        self.target = target
+        self.checkpoint = Checkpoint(checkpoint, target)
+        self.checkpoint_interval = max(1, checkpoint_interval)
+        # the refs which the target held before, they order the pools
+        self.refs = refs or {}
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.done = set()
+        self.pending = []
+        self.failed = {}
+        self.progress = None
+
+    def _collect(self, context):
+        """ Return the groups of (pool, vip, interface_map, scope) to push,
+            the pools without VIP have nothing on devices
+        """
+        plugin = self.driver.plugin
+        shared = self.client.share_real_servers or self.client.share_health_monitors
+        groups = {}
+        for pool in plugin.get_pools(context):
+            if not pool.get('vip_id'):
+                continue
+            scope = self.client.resync_scope(pool['id'])
+            if scope is None or (self.va_name and scope != self.va_name):
+                continue
+            vip = plugin.get_vip(context, pool['vip_id'])
+            interface_map = self.client.get_cached_map(
+                {'pool_id': pool['id'], 'vip_id': vip['id']})
+            if scope or shared:
+                key = scope
+            else:
+                key = self.driver.vlan_of(context, vip)
+            groups.setdefault(key, []).append((pool, vip, interface_map, scope))
+
+        ranks = self._ranks()
+        for group in groups.values():
+            # the VIPs take the shared objects in the order they did, so
+            # that the first one configures the interface address by its
+            # ports, and the others use its ports when they have none
+            group.sort(key=lambda item: ranks.get(item[1]['id'], len(ranks)))
+            interface_map = None
+            for index, (pool, vip, vip_map, scope) in enumerate(group):
+                interface_map = interface_map or vip_map
+                if not vip_map:
+                    group[index] = (pool, vip, interface_map, scope)
+        return list(groups.values())
+
+    def _restore(self, context, groups):
+        """ Run the pools done by the interrupted resync again without
+            sending anything, so that the mapping holds what they hold on
+            the target, then return the groups of the other pools
+        """
+        def restore(group):
+            for pool, vip, interface_map, scope in group:
+                if pool['id'] in self.done:
+                    self.driver.resync_vip(context, vip, interface_map)
+
+        only_urls, self.client.only_urls = self.client.only_urls, set()
+        try:
+            for group, _, error in run_concurrently(restore, groups, self.concurrency):
+                if error:
+                    raise error
+        finally:
+            self.client.only_urls = only_urls
+        groups = [[item for item in group if item[0]['id'] not in self.done]
+                  for group in groups]
+        return [group for group in groups if group]
+
+    def _ranks(self):
+        """ The lowest position of each holder in the forgotten refs """
+        ranks = {}
+        for resources in self.refs.values():
+            for holders in resources.values():
+                for index, holder in enumerate(holders):
+                    ranks[holder] = min(index, ranks.get(holder, index))
+        return ranks
+
+    def _resync_group(self, context, group):
+        for pool, vip, interface_map, scope in group:
+            members = len(pool.get('members', []))
+            try:
+                self.driver.resync_vip(context, vip, interface_map)
+            except Exception as e:
+                LOG.error("Resync: failed to push pool(%s) to %s: %s",
+                          pool['id'], self.target, e)
+                with self.lock:
+                    self.failed[pool['id']] = repr(e)
+            else:
+                with self.lock:
+                    self.pending.append((pool, scope))
+                    save = len(self.pending) >= self.checkpoint_interval
+                if save:
+                    self._save(raising=False)
+            self.progress.update(members)
+
+    def _save(self, raising=True):
+        """ Save the configuration of the scopes of the pushed pools, and
+            then check them in, the pools pushed while saving wait for the
+            next one
+        """
+        with self.save_lock:
+            with self.lock:
+                pending, self.pending = self.pending, []
+            if not pending:
+                return
+            scopes = {}
+            for pool, scope in pending:
+                scopes.setdefault(scope, pool)
+            try:
+                for pool in scopes.values():
+                    self.client.write_memory({'tenant_id': pool['tenant_id'],
+                                              'pool_id': pool['id']})
+            except Exception as e:
+                LOG.error("Resync: failed to save the configuration of %s: %s",
+                          self.target, e)
+                with self.lock:
+                    self.pending.extend(pending)
+                if raising:
+                    raise
+                return
+            self.done.update(pool['id'] for pool, scope in pending)
+            self.checkpoint.save(self.done)
+
+    def run(self, context):
+        """ Return the summary of the resync, the failed pools are left out
+            of the checkpoint, so that they are pushed by the next run
+        """
+        start = time.time()
+        self.done = self.checkpoint.load()
+        resumed = len(self.done)
+        groups = self._collect(context)
+        if self.done:
+            groups = self._restore(context, groups)
+        pools = sum(len(group) for group in groups)
+        members = sum(len(pool.get('members', [])) for group in groups
+                      for pool, _, _, _ in group)
+        LOG.info("Resync: pushing %d pools with %d members to %s in %d groups, "
+                 "%d pools were done before", pools, members, self.target,
+                 len(groups), resumed)
+        self.progress = Progress(pools, members)
+
+        results = run_concurrently(lambda group: self._resync_group(context, group),
+                                   groups, self.concurrency)
+        for group, _, error in results:
+            if error:
+                LOG.error("Resync: failed to push the group of pool(%s): %s",
+                          group[0][0]['id'], error)
+                self.failed.setdefault(group[0][0]['id'], repr(error))
+        self._save()
+        if not self.failed:
+            self.checkpoint.remove()
+
+        elapsed = time.time() - start
+        LOG.info("Resync: pushed %d pools to %s in %.2f seconds, %d failed",
+                 pools - len(self.failed), self.target, elapsed, len(self.failed))
+        return {
+            'target': self.target,
+            'pools': pools,
+            'members': members,
+            'resumed': resumed,
+            'failed': self.failed,
+            'round_trips': self.client.request_count,
+            'seconds': round(elapsed, 3),
+        }
@@ -0,0 +1,251 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import collections
+import contextlib
+import functools
+import logging
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+LANE_PRIORITY = 'priority'
+LANE_NORMAL = 'normal'
+DEFAULT_TENANT = '_unknown'
+REPORT_INTERVAL = 60
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def tenant_context(tenant_id, lane):
+    """ Mark the device calls made by this thread as the ones of the
+        tenant, the outermost operation decides the tenant and the lane
+    """
+    if getattr(_local, 'tenant_id', None) is not None:
+        yield
+        return
+    _local.tenant_id = tenant_id or DEFAULT_TENANT
+    _local.lane = lane
+    try:
+        yield
+    finally:
+        _local.tenant_id = None
+        _local.lane = None
+
+
+def current_tenant():
+    return (getattr(_local, 'tenant_id', None) or DEFAULT_TENANT,
+            getattr(_local, 'lane', None) or LANE_NORMAL)
+
+
+def operation_tenant(context, args):
+    """ The tenant of an operation is taken from the first Neutron object
+        in its arguments, or else from its context
+    """
+    for arg in args:
+        if isinstance(arg, dict) and arg.get('tenant_id', None):
+            return arg['tenant_id']
+    return getattr(context, 'tenant_id', None)
+
+
+def tenant_operation(lane=LANE_NORMAL):
+    """ Decorate the operations of ArrayADCDriver, so that their device
+        calls are scheduled as the ones of their tenant in the lane
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, context, *args, **kwargs):
+            tenant_id = operation_tenant(context, args)
+            start = time.time()
+            with tenant_context(tenant_id, lane):
+                try:
+                    return func(self, context, *args, **kwargs)
+                finally:
+                    if self.scheduler:
+                        self.scheduler.record_operation(tenant_id, func.__name__,
+                                                        time.time() - start)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def _no_slot():
+    yield
+
+
+def device_slot(scheduler, cmd=None):
+    """ The slot to send one request to device, cmd is used to evaluate
+        the cost and the lane of the request
+    """
+    if not scheduler:
+        return _no_slot()
+    cost = 1
+    lane = None
+    if cmd:
+        cost = cmd.count(';') + 1
+        if 'write memory' in cmd:
+            lane = LANE_PRIORITY
+    return scheduler.slot(cost, lane)
+
+
+class _Waiter(object):
+
+    def __init__(self, cost):
+        self.cost = cost
+        self.granted = False
+
+
+class FairScheduler(object):
+    """
+    Share the device request slots among tenants. The waiting requests
+    are queued per tenant and served by deficit round robin, the requests
+    in the priority lane (deletes and config saves) are served before the
+    normal ones, but at most priority_ratio of them in a row when normal
+    requests are waiting.
+    """
+    def __init__(self, concurrency, quantum=1, weights=None, priority_ratio=4):
+        self.available = concurrency
+        self.quantum = quantum
+        self.weights = weights or {}
+        self.priority_ratio = priority_ratio
+
+        self.cond = threading.Condition()
+        self.lanes = {
+            LANE_PRIORITY: collections.OrderedDict(),
+            LANE_NORMAL: collections.OrderedDict(),
+        }
+        self.deficit = {}
+        self.visited = set()
+        self.priority_streak = 0
+
+        self.metrics = {}
+        self.last_report = time.time()
+
+    @contextlib.contextmanager
+    def slot(self, cost=1, lane=None):
+        tenant_id, current_lane = current_tenant()
+        lane = lane or current_lane
+        start = time.time()
+        self._acquire(tenant_id, lane, cost)
+        waited = time.time() - start
+        try:
+            yield
+        finally:
+            self._release()
+            self._record(tenant_id, 'device_call', waited, time.time() - start - waited)
+
+    def _acquire(self, tenant_id, lane, cost):
+        waiter = _Waiter(cost)
+        with self.cond:
+            self.lanes[lane].setdefault(tenant_id, collections.deque()).append(waiter)
+            self._grant()
+            while not waiter.granted:
+                self.cond.wait()
+
+    def _release(self):
+        with self.cond:
+            self.available += 1
+            self._grant()
+
+    def _grant(self):
+        granted = False
+        while self.available > 0:
+            priority = self.lanes[LANE_PRIORITY]
+            normal = self.lanes[LANE_NORMAL]
+            if priority and (not normal or self.priority_streak < self.priority_ratio):
+                lane = LANE_PRIORITY
+                self.priority_streak += 1
+            elif normal:
+                lane = LANE_NORMAL
+                self.priority_streak = 0
+            else:
+                break
+            waiter = self._pick(lane)
+            waiter.granted = True
+            self.available -= 1
+            granted = True
+        if granted:
+            self.cond.notify_all()
+
+    def _pick(self, lane):
+        """ Deficit round robin among the tenants of the lane """
+        tenants = self.lanes[lane]
+        while True:
+            tenant_id, waiters = next(iter(tenants.items()))
+            key = (lane, tenant_id)
+            waiter = waiters[0]
+            if self.deficit.get(key, 0) >= waiter.cost:
+                self.deficit[key] -= waiter.cost
+                waiters.popleft()
+                if not waiters:
+                    tenants.pop(tenant_id)
+                    self.deficit.pop(key, None)
+                    self.visited.discard(key)
+                return waiter
+            if key in self.visited:
+                # The quantum of this round is used up, move to the end
+                self.visited.discard(key)
+                tenants.pop(tenant_id)
+                tenants[tenant_id] = waiters
+                continue
+            self.visited.add(key)
+            weight = self.weights.get(tenant_id, 1)
+            self.deficit[key] = self.deficit.get(key, 0) + self.quantum * weight
+
+    def record_operation(self, tenant_id, name, latency):
+        self._record(tenant_id or DEFAULT_TENANT, name, 0, latency)
+
+    def _record(self, tenant_id, name, waited, latency):
+        with self.cond:
+            stats = self.metrics.setdefault(tenant_id, {}).setdefault(name, {
+                'count': 0, 'wait_total': 0.0, 'wait_max': 0.0,
+                'latency_total': 0.0, 'latency_max': 0.0})
+            stats['count'] += 1
+            stats['wait_total'] += waited
+            stats['wait_max'] = max(stats['wait_max'], waited)
+            stats['latency_total'] += latency
+            stats['latency_max'] = max(stats['latency_max'], latency)
+            report = time.time() - self.last_report >= REPORT_INTERVAL
+            if report:
+                self.last_report = time.time()
+        if report:
+            self.report()
+
+    def report(self):
+        """ Log and return the latency metrics per tenant """
+        with self.cond:
+            metrics = dict((tenant_id, dict((name, dict(stats))
+                                            for name, stats in ops.items()))
+                           for tenant_id, ops in self.metrics.items())
+        for tenant_id, ops in sorted(metrics.items()):
+            for name, stats in sorted(ops.items()):
+                LOG.info("Tenant(%s) %s: count %d, wait avg %.3fs max %.3fs, "
+                         "latency avg %.3fs max %.3fs", tenant_id, name,
+                         stats['count'], stats['wait_total'] / stats['count'],
+                         stats['wait_max'], stats['latency_total'] / stats['count'],
+                         stats['latency_max'])
+        return metrics
+
+
+def parse_weights(value):
+    """ Parse "tenant_id:weight,tenant_id:weight" """
+    weights = {}
+    for item in (value or "").split(','):
+        if ':' not in item:
+            continue
+        tenant_id, weight = item.rsplit(':', 1)
+        weights[tenant_id.strip()] = max(1, int(weight))
+    return weights
@@ -0,0 +1,137 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import logging
+
+from arraylbaasv1driver.driver.v1.adc_cache import HEALTH_PREFIX, REAL_PREFIX
+from arraylbaasv1driver.driver.v1.adc_device import ADCDevice
+
+LOG = logging.getLogger(__name__)
+
+
+class SharedObjects(object):
+    """
+    The real servers and health objects shared by the members and the
+    monitors of the APV and AVX drivers. The scope is where the objects
+    live, such as the VA name on AVX, and the refs are kept in the cache
+    of the driver, which turns the sharing on by share_health_monitors
+    and share_real_servers.
+    """
+
+    def _acquire_real_server(self, scope, argu):
+        """ Return the name of the real server and whether to create it,
+            the members on the same backend share one real server when
+            it is enabled. The refs are dumped by the caller.
+        """
+        if not self.share_real_servers:
+            return argu['member_id'], True
+        rs_name = ADCDevice.shared_real_server_name(
+                                                   argu['protocol'],
+                                                   argu['member_address'],
+                                                   argu['member_port']
+                                                   )
+        create = self.cache.acquire_ref(scope, REAL_PREFIX + rs_name,
+                                        argu['member_id'], dump=False)
+        return rs_name, create
+
+    def _find_real_server(self, scope, argu):
+        """ Return the name of the real server of the member """
+        if self.share_real_servers and argu.get('member_address') is not None:
+            rs_name = ADCDevice.shared_real_server_name(
+                                                       argu['protocol'],
+                                                       argu['member_address'],
+                                                       argu['member_port']
+                                                       )
+            if self.cache.holds_ref(scope, REAL_PREFIX + rs_name, argu['member_id']):
+                return rs_name
+        resource = self.cache.find_ref(scope, REAL_PREFIX, argu['member_id'])
+        if resource is None:
+            return argu['member_id']
+        return resource[len(REAL_PREFIX):]
+
+    def _release_real_server(self, scope, argu):
+        """ Return the name of the real server, whether it is shared and
+            whether to delete it. The refs are dumped by the caller when
+            sharing is enabled.
+        """
+        member_id = argu['member_id']
+        rs_name = self._find_real_server(scope, argu)
+        if rs_name == member_id:
+            return rs_name, False, True
+        last = self.cache.release_ref(scope, REAL_PREFIX + rs_name, member_id,
+                                      dump=not self.share_real_servers)
+        return rs_name, True, last
+
+    def _release_failed_real_servers(self, failures):
+        """ The real servers of the failed creates aren't held by them """
+        for member_id in failures:
+            argu = {'member_id': member_id}
+            for scope in list(self.cache.refs.keys()):
+                if self._find_real_server(scope, argu) != member_id:
+                    self._release_real_server(scope, argu)
+
+    def _dump_real_server_refs(self):
+        if self.share_real_servers:
+            self.cache.dump()
+
+    def _rebuild_real_server_refs(self, group_members, members, scope_of):
+        """
+        Return the refs of the shared real servers, {scope: {resource:
+        [member_id]}}, by group_members, the set of (scope, group, real
+        server) on the devices, and members, the argu of all the members
+        in Neutron. scope_of(pool_id) is the scope of the pool.
+        """
+        refs = {}
+        if not self.share_real_servers:
+            return refs
+        for argu in members:
+            scope = scope_of(argu['pool_id'])
+            rs_name = ADCDevice.shared_real_server_name(
+                                                       argu['protocol'],
+                                                       argu['member_address'],
+                                                       argu['member_port']
+                                                       )
+            if (scope, argu['pool_id'], rs_name) not in group_members:
+                continue
+            refs.setdefault(scope, {}).setdefault(
+                REAL_PREFIX + rs_name, []).append(argu['member_id'])
+        LOG.info("Rebuild: found %d shared real servers",
+                 sum(len(resources) for resources in refs.values()))
+        return refs
+
+    def _acquire_health_monitor(self, scope, argu):
+        """ Return the name of the health object and whether to create it,
+            the identical monitors share one object when it is enabled
+        """
+        if not self.share_health_monitors:
+            return argu['hm_id'], True
+        hm_name = ADCDevice.shared_health_monitor_name(
+                                                      argu['hm_type'],
+                                                      argu['hm_delay'],
+                                                      argu['hm_max_retries'],
+                                                      argu['hm_timeout'],
+                                                      argu['hm_http_method'],
+                                                      argu['hm_url'],
+                                                      argu['hm_expected_codes']
+                                                      )
+        holder = "%s/%s" % (argu['pool_id'], argu['hm_id'])
+        return hm_name, self.cache.acquire_ref(scope, HEALTH_PREFIX + hm_name, holder)
+
+    def _release_health_monitor(self, scope, pool_id, hm_id):
+        """ Return the name of the health object and whether to delete it """
+        holder = "%s/%s" % (pool_id, hm_id)
+        resource = self.cache.find_ref(scope, HEALTH_PREFIX, holder)
+        if resource is None:
+            return hm_id, True
+        return resource[len(HEALTH_PREFIX):], self.cache.release_ref(scope, resource, holder)
@@ -0,0 +1,173 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import binascii
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+from arraylbaasv1driver.driver.v1 import adc_metrics
+
+LOG = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def _new_id(size):
+    return binascii.hexlify(os.urandom(size)).decode('ascii')
+
+
+class Span(object):
+    """ One timed step of an operation, the spans of an operation share
+        the trace_id and point to their parent by parent_id
+    """
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else _new_id(16)
+        self.span_id = _new_id(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.end = None
+        self.error = None
+
+    def set(self, name, value):
+        self.attributes[name] = value
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': round(self.start, 6),
+            'duration': round((self.end or time.time()) - self.start, 6),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+class SpanExporter(object):
+    """ The interface of the exporters, export() is called with each span
+        when it ends, by the thread which ran it
+    """
+    def export(self, span):
+        raise NotImplementedError()
+
+    def shutdown(self):
+        pass
+
+
+class FileSpanExporter(SpanExporter):
+    """ Append the spans to a JSON lines file, one span per line """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), sort_keys=True, separators=(',', ':'))
+        with self.lock:
+            try:
+                if self.file is None:
+                    self.file = open(self.path, 'a')
+                self.file.write(line + "\n")
+                self.file.flush()
+            except (IOError, OSError) as e:
+                LOG.warning("Failed to write the span to %s: %s", self.path, e)
+
+    def shutdown(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+class Tracer(object):
+    """ Open the spans of this thread, the span opened inside another one
+        becomes its child
+    """
+    def __init__(self, exporter):
+        self.exporter = exporter
+
+    def current(self):
+        stack = getattr(_local, 'stack', None)
+        return stack[-1] if stack else None
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        if getattr(_local, 'stack', None) is None:
+            _local.stack = []
+        span = Span(name, self.current(), attributes)
+        _local.stack.append(span)
+        try:
+            yield span
+        except Exception as e:
+            span.error = repr(e)
+            raise
+        finally:
+            _local.stack.pop()
+            span.end = time.time()
+            try:
+                self.exporter.export(span)
+            except Exception:
+                LOG.exception("Failed to export the span %s", name)
+
+
+class _NoSpan(object):
+
+    def set(self, name, value):
+        pass
+
+_NO_SPAN = _NoSpan()
+
+
+@contextlib.contextmanager
+def _no_span():
+    yield _NO_SPAN
+
+
+def span(tracer, name, **attributes):
+    """ The span of the tracer, nothing is recorded without a tracer """
+    if not tracer:
+        return _no_span()
+    return tracer.span(name, **attributes)
+
+
+def request_span(tracer, base_rest_url, cmd=None, method=None, path=None):
+    """ The span of a request to the device of base_rest_url """
+    if not tracer:
+        return _no_span()
+    device, va, verb = adc_metrics.request_labels(base_rest_url, cmd, method, path)
+    attributes = {'device': device, 'va': va, 'verb': verb}
+    if cmd is not None:
+        attributes['commands'] = cmd.count(';') + 1
+    return tracer.span('cli_extend' if cmd is not None else 'rest', **attributes)
+
+
+def traced(func):
+    """ Open a span named by the method when its object has a tracer """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        tracer = getattr(self, 'tracer', None)
+        if not tracer:
+            return func(self, *args, **kwargs)
+        with tracer.span(func.__name__):
+            return func(self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,123 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import contextlib
+import hashlib
+import json
+import logging
+import threading
+
+LOG = logging.getLogger(__name__)
+
+# The fields which may carry names given by users, and the member ids of
+# pools which grow with the pool, they are not needed to replay the
+# operations
+DROPPED_KEYS = frozenset(['name', 'description', 'status_description', 'members'])
+HASHED_KEYS = frozenset(['tenant_id'])
+
+_local = threading.local()
+
+
+def _hash(value):
+    return hashlib.sha1(str(value).encode('utf-8')).hexdigest()[:12]
+
+
+def sanitize(value):
+    """ Return a JSON friendly copy of the arguments of an operation, the
+        user given names are dropped and the tenants are hashed
+    """
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if key in DROPPED_KEYS:
+                continue
+            if key in HASHED_KEYS and item:
+                result[key] = _hash(item)
+            else:
+                result[key] = sanitize(item)
+        return result
+    if isinstance(value, (list, tuple)):
+        return [sanitize(item) for item in value]
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return str(value)
+
+
+@contextlib.contextmanager
+def untraced():
+    """ The operations of this thread are not recorded, for the ones
+        which were already recorded when they were queued
+    """
+    _local.untraced = True
+    try:
+        yield
+    finally:
+        _local.untraced = False
+
+
+class TraceRecorder(object):
+    """
+    Append the calls of the ArrayADCDriver operations to a JSON lines file,
+    one line per call:
+
+        {"ts": 1500000000.123, "op": "create_vip", "args": [...],
+         "kw": {...}, "dur": 0.215, "err": "..."}
+
+    kw and err are only present when they are not empty. The file is
+    opened on the first call and kept open.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+        self.count = 0
+
+    def record(self, op, args, kwargs, start, duration, error=None):
+        if getattr(_local, 'untraced', False):
+            return
+        entry = {
+            'ts': round(start, 6),
+            'op': op,
+            'args': sanitize(args),
+            'dur': round(duration, 6),
+        }
+        if kwargs:
+            entry['kw'] = sanitize(kwargs)
+        if error:
+            entry['err'] = error
+        line = json.dumps(entry, sort_keys=True, separators=(',', ':'))
+        with self.lock:
+            try:
+                if self.file is None:
+                    self.file = open(self.path, 'a')
+                self.file.write(line + "\n")
+                self.file.flush()
+                self.count += 1
+            except (IOError, OSError) as e:
+                LOG.warning("Failed to write the trace to %s: %s", self.path, e)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_trace(path):
+    """ Yield the entries of a trace file in order """
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
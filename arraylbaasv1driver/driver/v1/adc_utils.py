@@ -0,0 +1,148 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import importlib
+import logging
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+
+class LazyModule(object):
+    """
+    The proxy of a module which is imported when one of its attributes
+    is accessed for the first time, so that importing the driver doesn't
+    pull in the heavy neutron modules.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                start = time.time()
+                self._module = importlib.import_module(self._name)
+                LOG.info("Imported %s in %.3f seconds", self._name,
+                         time.time() - start)
+        return self._module
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self._load()
+        return getattr(module, attr)
+
+
+def run_concurrently(func, items, concurrency, progress=None):
+    """
+    Call func(item) for each item with at most concurrency threads.
+    Return a list of (item, result, error) in the order of items, the
+    progress is called with the number of finished items.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    state = {'next': 0, 'done': 0}
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                index = state['next']
+                if index >= len(items):
+                    return
+                state['next'] += 1
+            try:
+                results[index] = (items[index], func(items[index]), None)
+            except Exception as e:
+                results[index] = (items[index], None, e)
+            with lock:
+                state['done'] += 1
+                done = state['done']
+            if progress:
+                progress(done)
+
+    threads = []
+    for _ in range(max(1, min(concurrency, len(items)))):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def run_in_batches(items, batch_size, run, targets, applied):
+    """
+    Run the commands of items in batches on each target. The items yield
+    tuples of (item_id, scope, commands), the commands of the same scope
+    are joined into batches of at most batch_size commands and passed to
+    run(target, scope, commands).
+
+    A failed batch may be applied partly, so applied(target, scope) reads
+    what the target has and returns the function telling whether a
+    command is applied there. The commands of each item not applied yet
+    are then run one by one on that target only, to find out the failed
+    items. Return {item_id: error}.
+    """
+    batch_size = max(1, batch_size)
+    failures = {}
+    pending = []
+    state = {'scope': None, 'size': 0}
+
+    def retry(target, scope):
+        try:
+            is_applied = applied(target, scope)
+        except Exception as e:
+            LOG.warning("Failed to read what %s has applied(%s), retry all "
+                        "the commands", target, e)
+            is_applied = lambda cmd: False
+        for item_id, commands in pending:
+            if item_id in failures:
+                continue
+            commands = [cmd for cmd in commands if not is_applied(cmd)]
+            if not commands:
+                continue
+            try:
+                run(target, scope, commands)
+            except Exception as e:
+                failures[item_id] = e
+
+    def flush():
+        if not pending:
+            return
+        scope = state['scope']
+        cmds = [cmd for _, commands in pending for cmd in commands]
+        for target in targets:
+            try:
+                run(target, scope, cmds)
+            except Exception as e:
+                LOG.debug("Batch of %d items failed on %s(%s), retry the "
+                          "ones not applied one by one", len(pending), target, e)
+                retry(target, scope)
+        del pending[:]
+        state['size'] = 0
+
+    for item_id, scope, commands in items:
+        if pending and (scope != state['scope'] or
+                        state['size'] + len(commands) > batch_size):
+            flush()
+        state['scope'] = scope
+        pending.append((item_id, commands))
+        state['size'] += len(commands)
+    flush()
+    return failures
@@ -13,15 +13,27 @@
 import json
 import requests
 import logging
+import time
 
+from arraylbaasv1driver.driver.v1 import adc_digest
+from arraylbaasv1driver.driver.v1 import adc_plan
+from arraylbaasv1driver.driver.v1 import adc_rebuild
+from arraylbaasv1driver.driver.v1 import adc_rest
 from arraylbaasv1driver.driver.v1.exceptions import ArrayADCException
 from arraylbaasv1driver.driver.v1.adc_cache import LogicalAPVCache
+from arraylbaasv1driver.driver.v1.adc_cache import SLB_SCOPE
 from arraylbaasv1driver.driver.v1.adc_device import ADCDevice
+from arraylbaasv1driver.driver.v1.adc_limiter import host_slot, is_overloaded
+from arraylbaasv1driver.driver.v1.adc_metrics import device_timer
+from arraylbaasv1driver.driver.v1.adc_spans import request_span, traced
+from arraylbaasv1driver.driver.v1.adc_scheduler import device_slot
+from arraylbaasv1driver.driver.v1.adc_shared import SharedObjects
+from arraylbaasv1driver.driver.v1.adc_utils import run_in_batches
 
 LOG = logging.getLogger(__name__)
 
 
-class ArrayAPVAPIDriver(object):
+class ArrayAPVAPIDriver(SharedObjects):
     """ The real implementation on host to push config to
         APV instance via RESTful API
     """
@@ -31,13 +43,40 @@ class ArrayAPVAPIDriver(object):
         self.in_interface = in_interface
         self.hostnames = management_ip
         self.base_rest_urls = ["https://" + host + ":9997/rest/apv" for host in self.hostnames]
-        self.cache = LogicalAPVCache()
-
+        self._cache = None
+        self.request_count = 0
+        self.scheduler = None
+        self.limiters = None
+        self.dirty = None
+        self.metrics = None
+        self.tracer = None
+        # the requests are recorded instead of sent when it is set
+        self.recorder = None
+        # the requests to the other devices are dropped when it is set
+        self.only_urls = None
+        # the digest of the configuration intended for the devices
+        self.digest = None
+        self.rest_types = set([adc_rest.TYPE_VLAN])
+        self.rest = adc_rest.RestTransport(self._rest_request)
+        self.plan_batch_size = 200
+        self.share_health_monitors = False
+        self.share_real_servers = False
+
+
+    @property
+    def cache(self):
+        """ The mapping is loaded when it is used for the first time """
+        if self._cache is None:
+            start = time.time()
+            self._cache = LogicalAPVCache()
+            LOG.info("Loaded the mapping in %.3f seconds", time.time() - start)
+        return self._cache
 
     def get_auth(self):
         return (self.user_name, self.user_passwd)
 
 
+    @traced
     def allocate_vip(self, argu):
         """ allocation vip when create_vip"""
 
@@ -56,15 +95,19 @@ class ArrayAPVAPIDriver(object):
                          argu['vip_port_mac']
                         )
 
+        plan = adc_plan.Plan()
+
         # create group
         self._create_group(
+                           plan,
                            argu['pool_id'],
                            argu['lb_algorithm'],
                            argu['session_persistence_type'],
                           )
 
         # create vs
-        self._create_vs(argu['vip_id'],
+        self._create_vs(plan,
+                        argu['vip_id'],
                         argu['vip_address'],
                         argu['protocol'],
                         argu['protocol_port'],
@@ -72,16 +115,19 @@ class ArrayAPVAPIDriver(object):
                        )
 
         # create policy
-        self._create_policy(argu['pool_id'],
+        self._create_policy(plan,
+                            argu['pool_id'],
                             argu['vip_id'],
                             argu['session_persistence_type'],
                             argu['lb_algorithm'],
                             argu['cookie_name']
                            )
+        self._run_plan(plan)
 
         # config the HA
         self.config_ha(argu['vlan_tag'], argu['vip_address'])
 
+    @traced
     def deallocate_vip(self, argu, updated):
         """ Delete VIP in lb_delete_vip """
 
@@ -91,8 +137,11 @@ class ArrayAPVAPIDriver(object):
         if argu['vlan_tag'] == "None":
             argu['vlan_tag'] = None
 
+        plan = adc_plan.Plan()
+
         # delete policy
         self._delete_policy(
+                           plan,
                            argu['vip_id'],
                            argu['session_persistence_type'],
                            argu['lb_algorithm']
@@ -100,9 +149,11 @@ class ArrayAPVAPIDriver(object):
 
         # delete vs
         self._delete_vs(
+                       plan,
                        argu['vip_id'],
                        argu['protocol']
                        )
+        self._run_plan(plan)
 
         # delete vip
         self._delete_vip(argu['vip_id'], argu['vlan_tag'])
@@ -110,6 +161,7 @@ class ArrayAPVAPIDriver(object):
         self.no_ha(argu['vlan_tag'])
 
 
+    @traced
     def _create_vip(self,
                     vip_id,
                     vlan_tag,
@@ -131,33 +183,34 @@ class ArrayAPVAPIDriver(object):
         # create vlan
         if vlan_tag:
             interface_name = "vlan." + vlan_tag
-            payload = {
-                "name": interface_name,
-                "tag": vlan_tag,
-                "interface": self.in_interface
-            }
-            for base_rest_url in self.base_rest_urls:
-                url = base_rest_url + '/network/interface/VlanInterface'
-                LOG.debug("create_vip URL: --%s--", url)
-                LOG.debug("create_vip payload: --%s--", url)
-                r = requests.post(url, data=json.dumps(payload), auth=self.get_auth(), verify=False)
-                if r.status_code != 200:
-                    msg = r.text
-                    raise ArrayADCException(msg, r.status_code)
-
-        # configure vip
+            if adc_rest.TYPE_VLAN in self.rest_types:
+                op_create_vlan = adc_rest.vlan(self.in_interface, interface_name, vlan_tag)
+            else:
+                op_create_vlan = ADCDevice.vlan_device(self.in_interface, interface_name, vlan_tag)
+            for host, base_rest_url in zip(self.hostnames, self.base_rest_urls):
+                if not self.cache.acquire_ref(host, interface_name, vip_id):
+                    LOG.debug("The %s has existed in host(%s)", interface_name, host)
+                    continue
+                self._run_op(base_rest_url, op_create_vlan)
+
+        # configure vip, the interface takes the address of the first VIP
+        # and the others keep theirs to take over when it is deleted
+        ip_resource = "ip." + interface_name
         if len(self.hostnames) == 1:
             LOG.debug("Configure the vip address into interface")
             cmd_config_vip = "ip address %s %s %s" % (interface_name, vip_address, netmask)
-            for base_rest_url in self.base_rest_urls:
-                self.run_cli_extend(base_rest_url, cmd_config_vip)
+            for host, base_rest_url in zip(self.hostnames, self.base_rest_urls):
+                if self.cache.acquire_ref(host, ip_resource, vip_id,
+                                          value=[vip_address, netmask]):
+                    self.run_cli_extend(base_rest_url, cmd_config_vip)
         else:
             for host in self.hostnames:
                 iface = interface_mapping[host]
                 ip = iface['address']
                 cmd_config_vip = "ip address %s %s %s" % (interface_name, ip, netmask)
                 base_rest_url = "https://" + host + ":9997/rest/apv"
-                self.run_cli_extend(base_rest_url, cmd_config_vip)
+                if self.cache.acquire_ref(host, ip_resource, vip_id, value=[ip, netmask]):
+                    self.run_cli_extend(base_rest_url, cmd_config_vip)
                 self.cache.put(vip_id, host, iface['port_id'])
             self.cache.dump()
 
@@ -167,28 +220,49 @@ class ArrayAPVAPIDriver(object):
         if vlan_tag:
             interface_name = "vlan." + vlan_tag
 
-        # configure vip
+        # configure vip, the address of a deleted VIP is released to
+        # Neutron, so the interface takes the address of the next VIP
         LOG.debug("no the vip address into interface")
         cmd_no_ip = "no ip address %s " % (interface_name)
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_no_ip)
+        ip_resource = "ip." + interface_name
+        for host, base_rest_url in zip(self.hostnames, self.base_rest_urls):
+            owner, _ = self.cache.ref_owner(host, ip_resource)
+            if self.cache.release_ref(host, ip_resource, vip_id):
+                self.run_cli_extend(base_rest_url, cmd_no_ip)
+            elif owner == vip_id:
+                self._take_over_ip(host, base_rest_url, interface_name, vip_id)
 
         if len(self.hostnames) > 1:
             self.cache.remove(vip_id)
             self.cache.dump()
 
         if vlan_tag:
-            for base_rest_url in self.base_rest_urls:
-                url = '%s/network/interface/VlanInterface/%s' % (
-                    base_rest_url, interface_name)
-                LOG.debug("delete_vip URL: --%s--", url)
-                r = requests.delete(url, auth=self.get_auth(), verify=False)
-                if r.status_code != 200:
-                    msg = r.text
-                    raise ArrayADCException(msg, r.status_code)
-
-
+            if adc_rest.TYPE_VLAN in self.rest_types:
+                op_no_vlan = adc_rest.no_vlan(interface_name)
+            else:
+                op_no_vlan = ADCDevice.no_vlan_device(interface_name)
+            for host, base_rest_url in zip(self.hostnames, self.base_rest_urls):
+                if not self.cache.release_ref(host, interface_name, vip_id):
+                    LOG.debug("The %s is still used in host(%s)", interface_name, host)
+                    continue
+                self._run_op(base_rest_url, op_no_vlan)
+
+
+    def _take_over_ip(self, host, base_rest_url, interface_name, vip_id):
+        """ Configure the interface with the address of its next holder """
+        holder, value = self.cache.ref_owner(host, "ip." + interface_name)
+        if not value:
+            LOG.warning("The address of vip(%s) is left on %s of host(%s), "
+                        "the address of vip(%s) is unknown", vip_id,
+                        interface_name, host, holder)
+            return
+        LOG.debug("The %s of host(%s) takes the address of vip(%s)",
+                  interface_name, host, holder)
+        self.run_cli_extend(base_rest_url, ADCDevice.configure_ip(interface_name, *value))
+
+    @traced
     def _create_vs(self,
+                   plan,
                    vip_id,
                    vip_address,
                    protocol,
@@ -202,20 +276,20 @@ class ArrayAPVAPIDriver(object):
                                                              protocol,
                                                              connection_limit
                                                             )
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_apv_create_vs)
+        plan.add(cmd_apv_create_vs)
 
 
-    def _delete_vs(self, vip_id, protocol):
+    def _delete_vs(self, plan, vip_id, protocol):
         cmd_apv_no_vs = ADCDevice.no_virtual_service(
                                                      vip_id,
                                                      protocol
                                                     )
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_apv_no_vs)
+        plan.add(cmd_apv_no_vs)
 
 
+    @traced
     def _create_policy(self,
+                       plan,
                        pool_id,
                        vip_id,
                        session_persistence_type,
@@ -230,12 +304,10 @@ class ArrayAPVAPIDriver(object):
                                                         session_persistence_type,
                                                         cookie_name
                                                        )
-
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_apv_create_policy)
+        plan.add(cmd_apv_create_policy)
 
 
-    def _delete_policy(self, vip_id, session_persistence_type, lb_algorithm):
+    def _delete_policy(self, plan, vip_id, session_persistence_type, lb_algorithm):
         """ Delete SLB policy """
 
         cmd_apv_no_policy = ADCDevice.no_policy(
@@ -243,64 +315,93 @@ class ArrayAPVAPIDriver(object):
                                                 lb_algorithm,
                                                 session_persistence_type
                                                )
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_apv_no_policy)
+        plan.add(cmd_apv_no_policy)
 
 
     def create_group(self, argu):
         """ Create SLB group in lb-pool-create"""
         pass
 
-    def _create_group(self, pool_id, lb_algorithm, pk_type):
+    @traced
+    def _create_group(self, plan, pool_id, lb_algorithm, pk_type):
         """ Create SLB group in lb-pool-create"""
 
         cmd_apv_create_group = ADCDevice.create_group(pool_id, lb_algorithm, pk_type)
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_apv_create_group)
+        plan.add(cmd_apv_create_group)
 
 
     def delete_group(self, argu, updated):
         """Delete SLB group in lb-pool-delete"""
 
-        cmd_apv_no_group = ADCDevice.no_group(argu['pool_id'])
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_apv_no_group)
-
-        member_dict = argu['members']
-        for member in member_dict.keys():
-            cmd_apv_no_member = ADCDevice.no_real_server(member_dict[member], member)
-            for base_rest_url in self.base_rest_urls:
-                self.run_cli_extend(base_rest_url, cmd_apv_no_member)
-
-        for health_monitor in argu['health_monitors']:
-            cmd_apv_no_hm = ADCDevice.no_health_monitor(health_monitor)
-            for base_rest_url in self.base_rest_urls:
-                self.run_cli_extend(base_rest_url, cmd_apv_no_hm)
+        def cmds():
+            yield ADCDevice.no_group(argu['pool_id'])
+
+            # the members may be streamed from DB
+            for member in argu['members']:
+                rs_name, _, last = self._release_real_server(SLB_SCOPE, member)
+                if last:
+                    yield ADCDevice.no_real_server(member['protocol'], rs_name)
+
+            for health_monitor in argu['health_monitors']:
+                hm_name, last = self._release_health_monitor(
+                    SLB_SCOPE, argu['pool_id'], health_monitor)
+                if last:
+                    yield ADCDevice.no_health_monitor(hm_name)
+        self._run_stream(None, cmds())
+        self._dump_real_server_refs()
         self.write_memory(argu)
 
 
-    def create_member(self, argu):
-        """ create a member"""
-
-        if not argu:
-            LOG.error("In create_member, it should not pass the None.")
+    def _create_member_cmds(self, argu):
+        rs_name, create = self._acquire_real_server(SLB_SCOPE, argu)
+        cmds = []
+        if create:
+            cmds.append("slb real %s %s %s %s" % (
+                                                 argu['protocol'],
+                                                 rs_name,
+                                                 argu['member_address'],
+                                                 argu['member_port']
+                                                 ))
 
-        cmd_create_member = "slb real %s %s %s %s" % (
-                                                     argu['protocol'],
-                                                     argu['member_id'],
-                                                     argu['member_address'],
-                                                     argu['member_port']
-                                                     )
+        return cmds + self._group_member_cmds(argu, rs_name)
 
+    def _update_member_cmds(self, argu):
+        return self._group_member_cmds(argu, self._find_real_server(SLB_SCOPE, argu))
 
+    def _group_member_cmds(self, argu, rs_name):
         cmd_add_rs_to_group = "slb group member %s %s %s" % (
                                                             argu['pool_id'],
-                                                            argu['member_id'],
+                                                            rs_name,
                                                             argu['member_weight']
                                                             )
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_create_member)
-            self.run_cli_extend(base_rest_url, cmd_add_rs_to_group)
+        return [cmd_add_rs_to_group]
+
+    def _delete_member_cmds(self, argu):
+        rs_name, shared, last = self._release_real_server(SLB_SCOPE, argu)
+        cmds = []
+        if shared:
+            # the shared real server stays for the other members
+            cmds.append(ADCDevice.delete_rs_from_group(argu['pool_id'], rs_name))
+        if last:
+            cmds.append("no slb real %s %s" % (argu['protocol'], rs_name))
+        return cmds
+
+    def create_member(self, argu):
+        """ create a member"""
+
+        if not argu:
+            LOG.error("In create_member, it should not pass the None.")
+
+        cmds = self._create_member_cmds(argu)
+        try:
+            for base_rest_url in self.base_rest_urls:
+                for cmd in cmds:
+                    self._run_op(base_rest_url, cmd)
+        except Exception:
+            self._release_failed_real_servers([argu['member_id']])
+            raise
+        finally:
+            self._dump_real_server_refs()
 
 
     def update_member(self, argu):
@@ -309,13 +410,10 @@ class ArrayAPVAPIDriver(object):
         if not argu:
             LOG.error("In update_member, it should not pass the None.")
 
-        cmd_add_rs_to_group = "slb group member %s %s %s" % (
-                                                            argu['pool_id'],
-                                                            argu['member_id'],
-                                                            argu['member_weight']
-                                                            )
+        cmds = self._update_member_cmds(argu)
         for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_add_rs_to_group)
+            for cmd in cmds:
+                self._run_op(base_rest_url, cmd)
 
 
     def delete_member(self, argu):
@@ -324,10 +422,67 @@ class ArrayAPVAPIDriver(object):
         if not argu:
             LOG.error("In delete_member, it should not pass the None.")
 
-        cmd_delete_member = "no slb real %s %s" % (argu['protocol'], argu['member_id'])
+        cmds = self._delete_member_cmds(argu)
+        self._dump_real_server_refs()
+        for base_rest_url in self.base_rest_urls:
+            for cmd in cmds:
+                self._run_op(base_rest_url, cmd)
+
+
+    @traced
+    def _run_plan(self, plan):
+        """ Optimize the plan and run its batches on all devices """
+        batches = list(plan.optimize().batches(self.plan_batch_size))
+        for base_rest_url in self.base_rest_urls:
+            for scope, cmds in batches:
+                self.run_cli_extend(base_rest_url, adc_plan.apv_syntax(scope, cmds))
+
+    def _run_stream(self, scope, cmds):
+        """ Run the commands in batches as they are generated """
+        for batch in adc_plan.stream_batches(cmds, self.plan_batch_size):
+            for base_rest_url in self.base_rest_urls:
+                self.run_cli_extend(base_rest_url, adc_plan.apv_syntax(scope, batch))
+
+    def _run_op(self, base_rest_url, op):
+        """ Run a CLI command or push a structured REST object """
+        if isinstance(op, adc_rest.RestObject):
+            self.rest.push(base_rest_url, op)
+        else:
+            self.run_cli_extend(base_rest_url, op)
 
+    def _run_batch(self, scope, cmds):
         for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_delete_member)
+            self._run_batch_on(base_rest_url, scope, cmds)
+
+    def _run_batch_on(self, base_rest_url, scope, cmds):
+        self.run_cli_extend(base_rest_url, adc_plan.apv_syntax(scope, cmds))
+
+    def _applied_on(self, base_rest_url, scope):
+        """ What the device has applied, it is read after a failed batch """
+        return adc_digest.applied_commands(self.run_cli_extend(base_rest_url, "show running"))
+
+    def _run_members_in_batches(self, argus, member_cmds, batch_size):
+        items = ((argu['member_id'], None, member_cmds(argu)) for argu in argus)
+        return run_in_batches(items, batch_size, self._run_batch_on,
+                              self.base_rest_urls, self._applied_on)
+
+    def create_members(self, argus, batch_size):
+        """ Create members in batches, return {member_id: error} """
+        failures = self._run_members_in_batches(argus, self._create_member_cmds, batch_size)
+        if self.share_real_servers:
+            self._release_failed_real_servers(failures)
+            self.cache.dump()
+        return failures
+
+    def update_members(self, argus, batch_size):
+        """ Update members in batches, return {member_id: error} """
+        return self._run_members_in_batches(argus, self._update_member_cmds, batch_size)
+
+    def delete_members(self, argus, batch_size):
+        """ Delete members in batches, return {member_id: error} """
+        failures = self._run_members_in_batches(argus, self._delete_member_cmds, batch_size)
+        self._dump_real_server_refs()
+        return failures
 
 
     def create_health_monitor(self, argu):
@@ -335,8 +490,9 @@ class ArrayAPVAPIDriver(object):
         if not argu:
             LOG.error("In delete_member, it should not pass the None.")
 
+        hm_name, create = self._acquire_health_monitor(SLB_SCOPE, argu)
         cmd_apv_create_hm = ADCDevice.create_health_monitor(
-                                                           argu['hm_id'],
+                                                           hm_name,
                                                            argu['hm_type'],
                                                            argu['hm_delay'],
                                                            argu['hm_max_retries'],
@@ -346,25 +502,78 @@ class ArrayAPVAPIDriver(object):
                                                            argu['hm_expected_codes']
                                                            )
 
-        cmd_apv_attach_hm = ADCDevice.attach_hm_to_group(argu['pool_id'], argu['hm_id'])
+        cmd_apv_attach_hm = ADCDevice.attach_hm_to_group(argu['pool_id'], hm_name)
 
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_apv_create_hm)
-            self.run_cli_extend(base_rest_url, cmd_apv_attach_hm)
+        try:
+            for base_rest_url in self.base_rest_urls:
+                if create:
+                    self.run_cli_extend(base_rest_url, cmd_apv_create_hm)
+                self.run_cli_extend(base_rest_url, cmd_apv_attach_hm)
+        except Exception:
+            self._release_health_monitor(SLB_SCOPE, argu['pool_id'], argu['hm_id'])
+            raise
 
     def delete_health_monitor(self, argu):
-        cmd_apv_detach_hm = ADCDevice.detach_hm_to_group(argu['pool_id'], argu['hm_id'])
-        cmd_apv_no_hm = ADCDevice.no_health_monitor(argu['hm_id'])
+        hm_name, last = self._release_health_monitor(SLB_SCOPE, argu['pool_id'], argu['hm_id'])
+        cmd_apv_detach_hm = ADCDevice.detach_hm_to_group(argu['pool_id'], hm_name)
+        cmd_apv_no_hm = ADCDevice.no_health_monitor(hm_name)
         for base_rest_url in self.base_rest_urls:
             self.run_cli_extend(base_rest_url, cmd_apv_detach_hm)
-            self.run_cli_extend(base_rest_url, cmd_apv_no_hm)
+            if last:
+                self.run_cli_extend(base_rest_url, cmd_apv_no_hm)
 
 
+    @traced
     def write_memory(self, argu):
         cmd_apv_write_memory = ADCDevice.write_memory()
         for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_apv_write_memory)
-
+            self._save_config((base_rest_url, None), cmd_apv_write_memory)
+
+    def _save_config(self, scope, cmd):
+        """ Run write memory unless nothing changed in scope since the last save """
+        if self.dirty and not self.dirty.begin_save(scope):
+            return
+        try:
+            self.run_cli_extend(scope[0], cmd)
+        except Exception:
+            if self.dirty:
+                self.dirty.abort_save(scope)
+            raise
+
+    def _rest_request(self, base_rest_url, method, path, payload=None):
+        url = base_rest_url + path
+        LOG.debug("%s URL: --%s-- payload: --%s--", method, url, payload)
+        if self.only_urls is not None and base_rest_url not in self.only_urls:
+            return ''
+        if self.recorder:
+            return self.recorder.rest(base_rest_url, method, path, payload)
+        self.request_count += 1
+        data = None
+        if payload is not None:
+            data = json.dumps(payload)
+        try:
+            with request_span(self.tracer, base_rest_url, method=method, path=path) as span:
+                # the fair share of the tenant isn't held while the
+                # request waits for a slow device
+                with host_slot(self.limiters, base_rest_url) as call:
+                    with device_slot(self.scheduler):
+                        call.begin()
+                        with device_timer(self.metrics, base_rest_url, method=method,
+                                          path=path) as timer:
+                            r = requests.request(method, url, data=data,
+                                                 auth=self.get_auth(), verify=False)
+                            timer.failed = r.status_code != 200
+                        call.failed = is_overloaded(r.status_code)
+                span.set('status_code', r.status_code)
+        finally:
+            # marked once the request is done, even failed, so that a
+            # save made while it waited doesn't leave the change unsaved
+            if self.dirty:
+                self.dirty.mark((base_rest_url, None))
+        if r.status_code != 200:
+            msg = r.text
+            raise ArrayADCException(msg, r.status_code)
+        return r.text
 
     def run_cli_extend(self, base_rest_url, cmd):
         url = base_rest_url + '/cli_extend'
@@ -372,10 +581,35 @@ class ArrayAPVAPIDriver(object):
             "cmd": cmd
         }
         LOG.debug("Run cmd: %s" % cmd)
-        r = requests.post(url, json.dumps(payload), auth=self.get_auth(), verify=False)
+        if self.only_urls is not None and base_rest_url not in self.only_urls:
+            return ''
+        if self.recorder:
+            return self.recorder.cli_extend(base_rest_url, cmd)
+        self.request_count += 1
+        try:
+            with request_span(self.tracer, base_rest_url, cmd) as span:
+                # the fair share of the tenant isn't held while the
+                # request waits for a slow device
+                with host_slot(self.limiters, base_rest_url) as call:
+                    with device_slot(self.scheduler, cmd):
+                        call.begin()
+                        with device_timer(self.metrics, base_rest_url, cmd) as timer:
+                            r = requests.post(url, json.dumps(payload),
+                                              auth=self.get_auth(), verify=False)
+                            timer.failed = r.status_code != 200
+                        call.failed = is_overloaded(r.status_code)
+                span.set('status_code', r.status_code)
+        finally:
+            # recorded once the request is done, even failed, so that a
+            # save made while it waited doesn't leave the change unsaved
+            if self.dirty:
+                self.dirty.record(base_rest_url, cmd)
         if r.status_code != 200:
             msg = r.text
             raise ArrayADCException(msg, r.status_code)
+        if self.digest:
+            self.digest.record(base_rest_url, cmd)
+        return r.text
 
     def no_ha(self, vlan_tag):
         """ clear the HA configuration when delete_vip """
@@ -398,6 +632,7 @@ class ArrayAPVAPIDriver(object):
             self.run_cli_extend(base_rest_url, cmd_apv_clear_cluster_config)
 
 
+    @traced
     def config_ha(self, vlan_tag, vip_address):
         """ set the HA configuration when delete_vip """
 
@@ -426,5 +661,122 @@ class ArrayAPVAPIDriver(object):
             self.run_cli_extend(base_rest_url, cmd_enable_cluster)
 
 
+    def start_resync(self, host, va_name=None):
+        """ Send the requests only to host and forget the shared objects
+            held on it, so that the operations configure all of them on
+            host again, None means all the hosts. It is used on a
+            detached mapping by the resync of a replaced device. Return
+            the refs which were forgotten.
+        """
+        if va_name:
+            raise ArrayADCException("APV has no VA(%s)" % va_name)
+        scopes = list(self.cache.refs)
+        if host:
+            self.only_urls = set(url for name, url in zip(self.hostnames, self.base_rest_urls)
+                                 if name == host)
+            scopes = (host, SLB_SCOPE)
+        forgotten = {}
+        for scope in scopes:
+            forgotten[scope] = self.cache.refs.get(scope, {})
+            self.cache.clear_refs(scope)
+        return forgotten
+
+    def resync_scope(self, pool_id):
+        """ The VA of the pool, APV configures all the pools itself """
+        return ''
+
+    def config_scopes(self):
+        """ The (host, va_name) of the configurations on the devices """
+        return [(host, None) for host in self.hostnames]
+
+    def show_running_config(self, scope):
+        return self._show_running(scope[0])
+
     def get_cached_map(self, argu):
         return self.cache.get_interface_map_by_vip(argu['vip_id'])
+
+
+    def _show_running(self, host):
+        base_rest_url = "https://" + host + ":9997/rest/apv"
+        return self.run_cli_extend(base_rest_url, "show running")
+
+    def rebuild_cache(self, ports, vips, members, concurrency):
+        """ Rebuild the mapping by the running configuration of devices,
+            the ports created by this driver and vips, which are
+            {vip_id: {'vlan_tag', 'subnet_id', 'netmask'}} from Neutron.
+            Every VIP on an interface holds its address and the first
+            holder is the VIP whose address is configured on it. The
+            members in Neutron hold the shared real servers in their
+            groups.
+        """
+        configs = adc_rebuild.collect_running_configs(self._show_running,
+                                                      self.hostnames,
+                                                      concurrency)
+        mapping = {}
+        refs = {}
+        values = {}
+        for index, host in enumerate(self.hostnames):
+            config = configs.get(host, None)
+            if not config:
+                continue
+            interfaces = {}
+            for vip_id, vip_address in sorted(config['virtuals'].items()):
+                interface_name = self._interface_of_vip(config, vips.get(vip_id),
+                                                        vip_address)
+                if not interface_name:
+                    LOG.debug("Cannot find the interface of vip(%s)", vip_id)
+                    continue
+                interfaces.setdefault(interface_name, []).append(vip_id)
+
+            free = adc_rebuild.interface_ports(ports, index)
+            resources = refs.setdefault(host, {})
+            for interface_name, vip_ids in sorted(interfaces.items()):
+                address, netmask = config['addresses'].get(interface_name,
+                                                           (None, None))
+                if len(self.hostnames) == 1:
+                    # the VIPs take over the interface by their own addresses
+                    addresses = dict((vip_id, config['virtuals'][vip_id])
+                                     for vip_id in vip_ids)
+                else:
+                    addresses = {}
+                    claimed = adc_rebuild.claim_interface_ports(
+                        free, vip_ids, vips, address)
+                    for vip_id, port in claimed.items():
+                        mapping.setdefault(vip_id, {})[host] = port['id']
+                        addresses[vip_id] = port['fixed_ips'][0]['ip_address']
+
+                owners = [vip_id for vip_id in vip_ids
+                          if addresses.get(vip_id) == address][:1]
+                holders = owners + [vip_id for vip_id in vip_ids
+                                    if vip_id not in owners]
+                resources["ip." + interface_name] = holders
+                if interface_name in config['vlans']:
+                    resources[interface_name] = list(holders)
+                for vip_id in holders:
+                    vip_netmask = vips.get(vip_id, {}).get('netmask') or netmask
+                    if vip_id in addresses and vip_netmask:
+                        values.setdefault(host, {}).setdefault(
+                            "ip." + interface_name, {})[vip_id] = [
+                                addresses[vip_id], vip_netmask]
+
+        group_members = set((SLB_SCOPE, group, rs_name)
+                            for config in configs.values()
+                            for group, rs_name in config['members'])
+        refs.update(self._rebuild_real_server_refs(
+            group_members, members, lambda pool_id: SLB_SCOPE))
+        self.cache.rebuild(mapping, refs, values)
+        used_port_ids = set(port_id for interface_map in mapping.values()
+                            for port_id in interface_map.values())
+        adc_rebuild.report_orphans(ports, used_port_ids)
+        LOG.info("Rebuild: found %d VIPs with interface ports", len(mapping))
+        return mapping
+
+    def _interface_of_vip(self, config, vip, vip_address):
+        """ The interface of the VIP is given by its VLAN in Neutron, the
+            one whose subnet contains its address otherwise
+        """
+        if vip is None:
+            return adc_rebuild.interface_of_address(config, vip_address)
+        if vip['vlan_tag']:
+            return "vlan." + str(vip['vlan_tag'])
+        return self.in_interface
@@ -15,14 +15,23 @@ import requests
 import logging
 import time
 
+from arraylbaasv1driver.driver.v1 import adc_digest
+from arraylbaasv1driver.driver.v1 import adc_plan
+from arraylbaasv1driver.driver.v1 import adc_rebuild
 from arraylbaasv1driver.driver.v1.exceptions import ArrayADCException
 from arraylbaasv1driver.driver.v1.adc_cache import LogicalAVXCache
 from arraylbaasv1driver.driver.v1.adc_device import ADCDevice
+from arraylbaasv1driver.driver.v1.adc_limiter import host_slot, is_overloaded
+from arraylbaasv1driver.driver.v1.adc_metrics import device_timer
+from arraylbaasv1driver.driver.v1.adc_spans import request_span, traced
+from arraylbaasv1driver.driver.v1.adc_scheduler import device_slot
+from arraylbaasv1driver.driver.v1.adc_shared import SharedObjects
+from arraylbaasv1driver.driver.v1.adc_utils import run_in_batches
 
 LOG = logging.getLogger(__name__)
 
 
-class ArrayAVXAPIDriver(object):
+class ArrayAVXAPIDriver(SharedObjects):
     """ The real implementation on host to push config to
         APV instance via RESTful API
     """
@@ -32,8 +41,33 @@ class ArrayAVXAPIDriver(object):
         self.in_interface = "port2"
         self.hostnames = management_ip
         self.base_rest_urls = ["https://" + host + ":9997/rest/avx" for host in self.hostnames]
-        self.cache = LogicalAVXCache(in_interface)
-
+        self.cache_interface = in_interface
+        self._cache = None
+        self.request_count = 0
+        self.scheduler = None
+        self.limiters = None
+        self.dirty = None
+        self.metrics = None
+        self.tracer = None
+        # the requests are recorded instead of sent when it is set
+        self.recorder = None
+        # the requests to the other devices are dropped when it is set
+        self.only_urls = None
+        # the digest of the configuration intended for the devices
+        self.digest = None
+        self.plan_batch_size = 200
+        self.share_health_monitors = False
+        self.share_real_servers = False
+
+
+    @property
+    def cache(self):
+        """ The mapping is loaded when it is used for the first time """
+        if self._cache is None:
+            start = time.time()
+            self._cache = LogicalAVXCache(self.cache_interface)
+            LOG.info("Loaded the mapping in %.3f seconds", time.time() - start)
+        return self._cache
 
     def get_auth(self):
         return (self.user_name, self.user_passwd)
@@ -57,6 +91,7 @@ class ArrayAVXAPIDriver(object):
             raise ArrayADCException(msg)
         return va_name
 
+    @traced
     def allocate_vip(self, argu):
         """ allocation vip when create_vip"""
 
@@ -65,7 +100,7 @@ class ArrayAVXAPIDriver(object):
         # create vip
         self._create_vip(
                          va_name,
-                         argu['tenant_id'],
+                         argu['pool_id'],
                          argu['vip_id'],
                          argu['vlan_tag'],
                          argu['vip_address'],
@@ -75,8 +110,11 @@ class ArrayAVXAPIDriver(object):
                          argu['gateway_ip']
                         )
 
+        plan = adc_plan.Plan()
+
         # create group
         self._create_group(
+                          plan,
                           va_name,
                           argu['pool_id'],
                           argu['lb_algorithm'],
@@ -85,6 +123,7 @@ class ArrayAVXAPIDriver(object):
 
         # create vs
         self._create_vs(
+                        plan,
                         va_name,
                         argu['vip_id'],
                         argu['vip_address'],
@@ -95,6 +134,7 @@ class ArrayAVXAPIDriver(object):
 
         # create policy
         self._create_policy(
+                            plan,
                             va_name,
                             argu['pool_id'],
                             argu['vip_id'],
@@ -102,6 +142,7 @@ class ArrayAVXAPIDriver(object):
                             argu['lb_algorithm'],
                             argu['cookie_name']
                            )
+        self._run_plan(plan)
 
         # config the HA
         self.config_ha(
@@ -110,19 +151,24 @@ class ArrayAVXAPIDriver(object):
                        argu['vip_address']
                       )
 
+    @traced
     def deallocate_vip(self, argu, updated=True):
         """ Delete VIP in lb_delete_vip """
 
         va_name = self.get_va_name(argu)
 
+        plan = adc_plan.Plan()
+
         # delete group
         self._delete_group(
+                           plan,
                            va_name,
                            argu['pool_id'],
                            )
 
         # delete policy
         self._delete_policy(
+                           plan,
                            va_name,
                            argu['vip_id'],
                            argu['session_persistence_type'],
@@ -131,15 +177,17 @@ class ArrayAVXAPIDriver(object):
 
         # delete vs
         self._delete_vs(
+                        plan,
                         va_name,
                         argu['vip_id'],
                         argu['protocol']
                        )
+        self._run_plan(plan)
 
         # delete vip
         self._delete_vip(
                          va_name,
-                         argu['tenant_id'],
+                         argu['pool_id'],
                          argu['vip_id'],
                          argu['vlan_tag'],
                          updated
@@ -148,6 +196,7 @@ class ArrayAVXAPIDriver(object):
         self.no_ha(va_name, argu['vlan_tag'])
 
 
+    @traced
     def _create_vip(self,
                     va_name,
                     pool_id,
@@ -180,7 +229,8 @@ class ArrayAVXAPIDriver(object):
             for base_rest_url in self.base_rest_urls:
                 self.run_cli_extend(base_rest_url, cmd_avx_config_mac)
 
-        # create vlan
+        # create vlan, a VA holds the only VIP of its pool, so the VLAN
+        # interface, its address and the route are not shared
         if vlan_tag != 'None':
             interface_name = "vlan." + vlan_tag
             cmd_apv_config_vlan = ADCDevice.vlan_device(
@@ -253,7 +303,9 @@ class ArrayAVXAPIDriver(object):
                 self.run_cli_extend(base_rest_url, cmd_avx_no_vlan_device)
 
 
+    @traced
     def _create_vs(self,
+                   plan,
                    va_name,
                    vip_id,
                    vip_address,
@@ -268,22 +320,20 @@ class ArrayAVXAPIDriver(object):
                                                              protocol,
                                                              connection_limit
                                                             )
-        cmd_avx_create_vs = "va run %s \"%s\"" % (va_name, cmd_apv_create_vs)
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_avx_create_vs)
+        plan.add(cmd_apv_create_vs, va_name)
 
 
-    def _delete_vs(self, va_name, vip_id, protocol):
+    def _delete_vs(self, plan, va_name, vip_id, protocol):
         cmd_apv_no_vs = ADCDevice.no_virtual_service(
                                                      vip_id,
                                                      protocol
                                                     )
-        cmd_avx_no_vs = "va run %s \"%s\"" % (va_name, cmd_apv_no_vs)
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_avx_no_vs)
+        plan.add(cmd_apv_no_vs, va_name)
 
 
+    @traced
     def _create_policy(self,
+                       plan,
                        va_name,
                        pool_id,
                        vip_id,
@@ -299,13 +349,11 @@ class ArrayAVXAPIDriver(object):
                                                         session_persistence_type,
                                                         cookie_name
                                                        )
-
-        cmd_avx_create_policy = "va run %s \"%s\"" % (va_name, cmd_apv_create_policy)
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_avx_create_policy)
+        plan.add(cmd_apv_create_policy, va_name)
 
 
     def _delete_policy(self,
+                       plan,
                        va_name,
                        vip_id,
                        session_persistence_type,
@@ -317,9 +365,7 @@ class ArrayAVXAPIDriver(object):
                                                 lb_algorithm,
                                                 session_persistence_type
                                                )
-        cmd_avx_no_policy = "va run %s \"%s\"" % (va_name, cmd_apv_no_policy)
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_avx_no_policy)
+        plan.add(cmd_apv_no_policy, va_name)
 
 
 
@@ -330,20 +376,17 @@ class ArrayAVXAPIDriver(object):
 
 
 
-    def _create_group(self, va_name, pool_id, lb_algorithm, sp_type):
+    @traced
+    def _create_group(self, plan, va_name, pool_id, lb_algorithm, sp_type):
 
         cmd_apv_create_group = ADCDevice.create_group(pool_id, lb_algorithm, sp_type)
-        cmd_avx_create_group = "va run %s \"%s\"" % (va_name, cmd_apv_create_group)
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_avx_create_group)
+        plan.add(cmd_apv_create_group, va_name)
 
 
-    def _delete_group(self, va_name, pool_id):
+    def _delete_group(self, plan, va_name, pool_id):
 
         cmd_apv_delete_group = ADCDevice.no_group(pool_id)
-        cmd_avx_delete_group = "va run %s \"%s\"" % (va_name, cmd_apv_delete_group)
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_avx_delete_group)
+        plan.add(cmd_apv_delete_group, va_name)
 
 
     def delete_group(self, argu, updated = True):
@@ -351,86 +394,165 @@ class ArrayAVXAPIDriver(object):
 
         va_name = self.get_va_name(argu)
 
-        cmd_apv_no_group = ADCDevice.no_group(argu['pool_id'])
-        cmd_avx_no_group = "va run %s \"%s\"" % (va_name, cmd_apv_no_group)
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_avx_no_group)
+        def cmds():
+            yield ADCDevice.no_group(argu['pool_id'])
 
-        member_dict = argu['members']
-        for member in member_dict.keys():
-            cmd_apv_no_member = ADCDevice.no_real_server(member_dict[member], member)
-            cmd_avx_no_member = "va run %s \"%s\"" % (va_name, cmd_apv_no_member)
-            for base_rest_url in self.base_rest_urls:
-                self.run_cli_extend(base_rest_url, cmd_avx_no_member)
+            # the members may be streamed from DB
+            for member in argu['members']:
+                rs_name, _, last = self._release_real_server(va_name, member)
+                if last:
+                    yield ADCDevice.no_real_server(member['protocol'], rs_name)
 
-        for health_monitor in argu['health_monitors']:
-            cmd_apv_no_hm = ADCDevice.no_health_monitor(health_monitor)
-            cmd_avx_no_hm = "va run %s \"%s\"" % (va_name, cmd_apv_no_hm)
-            for base_rest_url in self.base_rest_urls:
-                self.run_cli_extend(base_rest_url, cmd_avx_no_hm)
+            for health_monitor in argu['health_monitors']:
+                hm_name, last = self._release_health_monitor(
+                    va_name, argu['pool_id'], health_monitor)
+                if last:
+                    yield ADCDevice.no_health_monitor(hm_name)
+        self._run_stream(va_name, cmds())
+        self._dump_real_server_refs()
 
         if updated:
             self.write_memory(argu)
             self.cache.remove_group(argu['pool_id'])
 
 
-    def create_member(self, argu):
-        """ create a member"""
-
-        va_name = self.get_va_name(argu)
+    def _create_member_cmds(self, argu):
+        rs_name, create = self._acquire_real_server(self.get_va_name(argu), argu)
+        cmds = []
+        if create:
+            cmds.append(ADCDevice.create_real_server(
+                                                     rs_name,
+                                                     argu['member_address'],
+                                                     argu['member_port'],
+                                                     argu['protocol']
+                                                     ))
 
-        cmd_apv_create_real_server = ADCDevice.create_real_server(
-                                                       argu['member_id'],
-                                                       argu['member_address'],
-                                                       argu['member_port'],
-                                                       argu['protocol']
-                                                       )
+        cmd_apv_add_rs_into_group = ADCDevice.add_rs_into_group(
+                                                               argu['pool_id'],
+                                                               rs_name,
+                                                               argu['member_weight']
+                                                               )
+        return cmds + [cmd_apv_add_rs_into_group]
 
+    def _update_member_cmds(self, argu):
+        rs_name = self._find_real_server(self.get_va_name(argu), argu)
         cmd_apv_add_rs_into_group = ADCDevice.add_rs_into_group(
                                                                argu['pool_id'],
-                                                               argu['member_id'],
+                                                               rs_name,
                                                                argu['member_weight']
                                                                )
+        return [cmd_apv_add_rs_into_group]
+
+    def _delete_member_cmds(self, argu):
+        rs_name, shared, last = self._release_real_server(self.get_va_name(argu), argu)
+        cmds = []
+        if shared:
+            # the shared real server stays for the other members
+            cmds.append(ADCDevice.delete_rs_from_group(argu['pool_id'], rs_name))
+        if last:
+            cmds.append(ADCDevice.no_real_server(argu['protocol'], rs_name))
+        return cmds
 
-        cmd_avx_create_rs = "va run %s \"%s\"" % (va_name, cmd_apv_create_real_server)
-        cmd_avx_add_rs_into_group = "va run %s \"%s\"" % (va_name, cmd_apv_add_rs_into_group)
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_avx_create_rs)
-            self.run_cli_extend(base_rest_url, cmd_avx_add_rs_into_group)
+    def create_member(self, argu):
+        """ create a member"""
+
+        va_name = self.get_va_name(argu)
+        try:
+            for cmd in self._create_member_cmds(argu):
+                self._run_batch(va_name, [cmd])
+        except Exception:
+            self._release_failed_real_servers([argu['member_id']])
+            raise
+        finally:
+            self._dump_real_server_refs()
 
     def update_member(self, argu):
         """ Update a member"""
 
         va_name = self.get_va_name(argu)
-        cmd_apv_add_rs_into_group = ADCDevice.add_rs_into_group(
-                                                               argu['pool_id'],
-                                                               argu['member_id'],
-                                                               argu['member_weight']
-                                                               )
-
-        cmd_avx_add_rs_into_group = "va run %s \"%s\"" % (va_name, cmd_apv_add_rs_into_group)
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_avx_add_rs_into_group)
+        for cmd in self._update_member_cmds(argu):
+            self._run_batch(va_name, [cmd])
 
 
     def delete_member(self, argu):
         """ Delete a member"""
 
         va_name = self.get_va_name(argu)
+        cmds = self._delete_member_cmds(argu)
+        self._dump_real_server_refs()
+        for cmd in cmds:
+            self._run_batch(va_name, [cmd])
+
+
+    @traced
+    def _run_plan(self, plan):
+        """ Optimize the plan and run its batches on all devices """
+        batches = list(plan.optimize().batches(self.plan_batch_size))
+        for base_rest_url in self.base_rest_urls:
+            for va_name, cmds in batches:
+                self.run_cli_extend(base_rest_url, adc_plan.avx_syntax(va_name, cmds))
 
-        cmd_apv_no_rs = ADCDevice.no_real_server(argu['protocol'], argu['member_id'])
-        cmd_avx_no_rs = "va run %s \"%s\"" % (va_name, cmd_apv_no_rs)
+    def _run_stream(self, va_name, cmds):
+        """ Run the commands in batches as they are generated """
+        for batch in adc_plan.stream_batches(cmds, self.plan_batch_size):
+            for base_rest_url in self.base_rest_urls:
+                self.run_cli_extend(base_rest_url, adc_plan.avx_syntax(va_name, batch))
 
+    def _run_batch(self, va_name, cmds):
         for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_avx_no_rs)
+            self._run_batch_on(base_rest_url, va_name, cmds)
+
+    def _run_batch_on(self, base_rest_url, va_name, cmds):
+        self.run_cli_extend(base_rest_url, adc_plan.avx_syntax(va_name, cmds))
+
+    def _applied_on(self, base_rest_url, va_name):
+        """ What the VA has applied, it is read after a failed batch """
+        cmd_avx_show_running = "va run %s \"%s\"" % (va_name, "show running")
+        return adc_digest.applied_commands(
+            self.run_cli_extend(base_rest_url, cmd_avx_show_running))
+
+    def _run_members_in_batches(self, argus, member_cmds, batch_size):
+        failures = {}
+
+        def items():
+            for argu in argus:
+                try:
+                    va_name = self.get_va_name(argu)
+                except ArrayADCException as e:
+                    failures[argu['member_id']] = e
+                    continue
+                yield (argu['member_id'], va_name, member_cmds(argu))
+
+        failures.update(run_in_batches(items(), batch_size, self._run_batch_on,
+                                       self.base_rest_urls, self._applied_on))
+        return failures
+
+    def create_members(self, argus, batch_size):
+        """ Create members in batches, return {member_id: error} """
+        failures = self._run_members_in_batches(argus, self._create_member_cmds, batch_size)
+        if self.share_real_servers:
+            self._release_failed_real_servers(failures)
+            self.cache.dump()
+        return failures
+
+    def update_members(self, argus, batch_size):
+        """ Update members in batches, return {member_id: error} """
+        return self._run_members_in_batches(argus, self._update_member_cmds, batch_size)
+
+    def delete_members(self, argus, batch_size):
+        """ Delete members in batches, return {member_id: error} """
+        failures = self._run_members_in_batches(argus, self._delete_member_cmds, batch_size)
+        self._dump_real_server_refs()
+        return failures
 
 
     def create_health_monitor(self, argu):
 
         va_name = self.get_va_name(argu)
 
+        hm_name, create = self._acquire_health_monitor(va_name, argu)
         cmd_apv_create_hm = ADCDevice.create_health_monitor(
-                                                           argu['hm_id'],
+                                                           hm_name,
                                                            argu['hm_type'],
                                                            argu['hm_delay'],
                                                            argu['hm_max_retries'],
@@ -440,31 +562,40 @@ class ArrayAVXAPIDriver(object):
                                                            argu['hm_expected_codes']
                                                            )
 
-        cmd_apv_attach_hm = ADCDevice.attach_hm_to_group(argu['pool_id'], argu['hm_id'])
+        cmd_apv_attach_hm = ADCDevice.attach_hm_to_group(argu['pool_id'], hm_name)
 
         cmd_avx_create_hm = "va run %s \"%s\"" % (va_name, cmd_apv_create_hm)
         cmd_avx_attach_hm = "va run %s \"%s\"" % (va_name, cmd_apv_attach_hm)
 
-        for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_avx_create_hm)
-            self.run_cli_extend(base_rest_url, cmd_avx_attach_hm)
+        try:
+            for base_rest_url in self.base_rest_urls:
+                if create:
+                    self.run_cli_extend(base_rest_url, cmd_avx_create_hm)
+                self.run_cli_extend(base_rest_url, cmd_avx_attach_hm)
+        except Exception:
+            self._release_health_monitor(va_name, argu['pool_id'], argu['hm_id'])
+            raise
 
     def delete_health_monitor(self, argu):
 
         va_name = self.get_va_name(argu)
 
-        cmd_apv_detach_hm = ADCDevice.detach_hm_to_group(argu['pool_id'], argu['hm_id'])
+        hm_name, last = self._release_health_monitor(va_name, argu['pool_id'], argu['hm_id'])
 
-        cmd_apv_no_hm = ADCDevice.no_health_monitor(argu['hm_id'])
+        cmd_apv_detach_hm = ADCDevice.detach_hm_to_group(argu['pool_id'], hm_name)
+
+        cmd_apv_no_hm = ADCDevice.no_health_monitor(hm_name)
 
         cmd_avx_detach_hm = "va run %s \"%s\"" % (va_name, cmd_apv_detach_hm)
         cmd_avx_no_hm = "va run %s \"%s\"" % (va_name, cmd_apv_no_hm)
 
         for base_rest_url in self.base_rest_urls:
             self.run_cli_extend(base_rest_url, cmd_avx_detach_hm)
-            self.run_cli_extend(base_rest_url, cmd_avx_no_hm)
+            if last:
+                self.run_cli_extend(base_rest_url, cmd_avx_no_hm)
 
 
+    @traced
     def write_memory(self, argu):
         va_name = self.get_va_name(argu)
 
@@ -472,8 +603,18 @@ class ArrayAVXAPIDriver(object):
         cmd_avx_write_memory = "va run %s \"%s\"" % (va_name, cmd_apv_write_memory)
 
         for base_rest_url in self.base_rest_urls:
-            self.run_cli_extend(base_rest_url, cmd_avx_write_memory)
-
+            self._save_config((base_rest_url, va_name), cmd_avx_write_memory)
+
+    def _save_config(self, scope, cmd):
+        """ Run write memory unless nothing changed in scope since the last save """
+        if self.dirty and not self.dirty.begin_save(scope):
+            return
+        try:
+            self.run_cli_extend(scope[0], cmd)
+        except Exception:
+            if self.dirty:
+                self.dirty.abort_save(scope)
+            raise
 
     def run_cli_extend(self, base_rest_url, cmd):
         url = base_rest_url + '/cli_extend'
@@ -481,10 +622,35 @@ class ArrayAVXAPIDriver(object):
             "cmd": cmd
         }
         LOG.debug("Run cmd: %s" % cmd)
-        r = requests.post(url, json.dumps(payload), auth=self.get_auth(), verify=False)
+        if self.only_urls is not None and base_rest_url not in self.only_urls:
+            return ''
+        if self.recorder:
+            return self.recorder.cli_extend(base_rest_url, cmd)
+        self.request_count += 1
+        try:
+            with request_span(self.tracer, base_rest_url, cmd) as span:
+                # the fair share of the tenant isn't held while the
+                # request waits for a slow device
+                with host_slot(self.limiters, base_rest_url) as call:
+                    with device_slot(self.scheduler, cmd):
+                        call.begin()
+                        with device_timer(self.metrics, base_rest_url, cmd) as timer:
+                            r = requests.post(url, json.dumps(payload),
+                                              auth=self.get_auth(), verify=False)
+                            timer.failed = r.status_code != 200
+                        call.failed = is_overloaded(r.status_code)
+                span.set('status_code', r.status_code)
+        finally:
+            # recorded once the request is done, even failed, so that a
+            # save made while it waited doesn't leave the change unsaved
+            if self.dirty:
+                self.dirty.record(base_rest_url, cmd)
         if r.status_code != 200:
             msg = r.text
             raise ArrayADCException(msg, r.status_code)
+        if self.digest:
+            self.digest.record(base_rest_url, cmd)
+        return r.text
 
     def no_ha(self, va_name, vlan_tag):
         """ clear the HA configuration when delete_vip """
@@ -510,6 +676,7 @@ class ArrayAVXAPIDriver(object):
             self.run_cli_extend(base_rest_url, cmd_avx_clear_cluster_config)
 
 
+    @traced
     def config_ha(self, va_name, vlan_tag, vip_address):
         """ set the HA configuration when create_vip """
 
@@ -522,7 +689,7 @@ class ArrayAVXAPIDriver(object):
             interface_name = "vlan." + vlan_tag
 
         cmd_apv_config_virtual_iface = ADCDevice.cluster_config_virtual_interface(interface_name)
-        cmd_apv_config_virtual_vip = ADCDevice.cluster_config_vip(interface_name)
+        cmd_apv_config_virtual_vip = ADCDevice.cluster_config_vip(interface_name, vip_address)
         cmd_apv_cluster_enable = ADCDevice.cluster_enable(interface_name)
 
         cmd_avx_config_virtual_iface = "va run %s \"%s\"" % (va_name, cmd_apv_config_virtual_iface)
@@ -542,5 +709,98 @@ class ArrayAVXAPIDriver(object):
             self.run_cli_extend(base_rest_url, cmd_avx_cluster_enable)
 
 
+    def start_resync(self, host, va_name=None):
+        """ Send the requests only to host and forget the shared objects
+            held in va_name, or in all VAs, so that the operations
+            configure all of them on host again, None means all the
+            hosts. It is used on a detached mapping by the resync of a
+            replaced device. Return the refs which were forgotten.
+        """
+        if host:
+            self.only_urls = set(url for name, url in zip(self.hostnames, self.base_rest_urls)
+                                 if name == host)
+        forgotten = {}
+        for scope in list(self.cache.refs):
+            if not va_name or scope == va_name:
+                forgotten[scope] = self.cache.refs[scope]
+                self.cache.clear_refs(scope)
+        return forgotten
+
+    def resync_scope(self, pool_id):
+        """ The VA of the pool, None if the pool is not on any VA """
+        return self.cache.find_va_by_pool(pool_id)
+
+    def config_scopes(self):
+        """ The (host, va_name) of the configurations on the devices """
+        return [(host, va_name) for host in self.hostnames
+                for va_name in self.cache.all_va_names()]
+
+    def show_running_config(self, scope):
+        return self._show_running(scope)
+
     def get_cached_map(self, argu):
         return self.cache.get_interface_map_by_vip(argu['pool_id'], argu['vip_id'])
+
+
+    def _show_running(self, target):
+        host, va_name = target
+        base_rest_url = "https://" + host + ":9997/rest/avx"
+        cmd_avx_show_running = "va run %s \"%s\"" % (va_name, "show running")
+        return self.run_cli_extend(base_rest_url, cmd_avx_show_running)
+
+    def rebuild_cache(self, ports, vips, members, concurrency):
+        """ Rebuild the mapping by the running configuration of all VAs
+            and the ports created by this driver, the VIPs of Neutron
+            aren't needed since a VA has the interface of one VIP only.
+            The members in Neutron hold the shared real servers in their
+            groups.
+        """
+        port_by_address = dict((port['fixed_ips'][0]['ip_address'], port['id'])
+                               for port in ports)
+        targets = [(host, va_name) for host in self.hostnames
+                   for va_name in self.cache.all_va_names()]
+        configs = adc_rebuild.collect_running_configs(self._show_running,
+                                                      targets,
+                                                      concurrency)
+        mapping = {}
+        for target in targets:
+            config = configs.get(target, None)
+            if not config:
+                continue
+            host, va_name = target
+            for pool_id in config['groups']:
+                mapping.setdefault(pool_id, {'va_name': va_name})
+
+            for vip_id, vip_address in sorted(config['virtuals'].items()):
+                pool_id = config['policies'].get(vip_id, None)
+                if not pool_id and config['groups']:
+                    pool_id = config['groups'][0]
+                if not pool_id:
+                    LOG.debug("Cannot find the pool of vip(%s)", vip_id)
+                    continue
+                lb_item = mapping.setdefault(pool_id, {'va_name': va_name})
+
+                interface_name = adc_rebuild.interface_of_address(config, vip_address)
+                if not interface_name:
+                    LOG.debug("Cannot find the interface of vip(%s)", vip_id)
+                    continue
+
+                port_id = port_by_address.get(config['addresses'][interface_name][0])
+                if port_id and len(self.hostnames) > 1:
+                    lb_item.setdefault(vip_id, {})[host] = port_id
+
+        group_members = set((target[1], group, rs_name)
+                            for target, config in configs.items()
+                            for group, rs_name in config['members'])
+        refs = self._rebuild_real_server_refs(
+            group_members, members,
+            lambda pool_id: mapping.get(pool_id, {}).get('va_name'))
+        self.cache.rebuild(mapping, refs)
+        used_port_ids = set(port_id for lb_item in mapping.values()
+                            for vip_id, interface_map in lb_item.items()
+                            if vip_id != 'va_name'
+                            for port_id in interface_map.values())
+        adc_rebuild.report_orphans(ports, used_port_ids)
+        LOG.info("Rebuild: found %d pools in %d VAs", len(mapping),
+                 len(set(lb_item['va_name'] for lb_item in mapping.values())))
+        return mapping
@@ -25,27 +25,8 @@ CMCC_DEFAULT_NETWORK_TYPE = 'vlan'
 
 LOG = logging.getLogger(__name__)
 
-DB_OPTS = [
-    cfg.StrOpt(
-        'array_request_vlan_interval',
-        default=100,
-        help=('Interval in millisecond to request VLAN ID'
-              'from database')
-    ),
-    cfg.StrOpt(
-        'array_request_vlan_max_retries',
-        default=10,
-        help=('Maximum number to try to request vlan'
-              'from database')
-    ),
-    cfg.StrOpt(
-        'array_request_vlan_hostname',
-        default=10,
-        help=('Hostname of port binding')
-    )
-]
-
-cfg.CONF.register_opts(DB_OPTS, "arraynetworks")
+# The options are registered by device_driver when it is imported
+
 
 def _get_binding_level(context, port_id, level):
     result = None
@@ -89,8 +70,8 @@ def get_vlan_id_by_port_cmcc(context, port_id):
         return None
 
     attempts = 0
-    seconds_time = int(cfg.CONF.arraynetworks.array_request_vlan_interval) / 1000
-    retries = int(cfg.CONF.arraynetworks.array_request_vlan_max_retries)
+    seconds_time = cfg.CONF.arraynetworks.array_request_vlan_interval / 1000
+    retries = cfg.CONF.arraynetworks.array_request_vlan_max_retries
     while True:
         if attempts < retries:
             attempts += 1
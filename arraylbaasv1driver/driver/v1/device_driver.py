@@ -17,22 +17,50 @@
 # @author: Array Networks, Inc.
 
 import netaddr
+import signal
+import threading
 import time
 
 from oslo.config import cfg
 from oslo_log import log as logging
 from oslo_utils import importutils
 
-from neutron.api.v2 import attributes
-from neutron.plugins.common import constants
-
-from neutron_lbaas.db.loadbalancer import loadbalancer_db
 from neutron_lbaas.services.loadbalancer.drivers import abstract_driver
 
-from arraylbaasv1driver.driver.v1 import db
+from arraylbaasv1driver.driver.v1 import adc_instrument
+from arraylbaasv1driver.driver.v1 import adc_scheduler
+from arraylbaasv1driver.driver.v1 import adc_utils
+from arraylbaasv1driver.driver.v1.adc_scheduler import tenant_operation
+from arraylbaasv1driver.driver.v1.adc_utils import LazyModule
+
+# The modules below are only needed when the first operation comes,
+# import them lazily to speed up the start of neutron-server
+attributes = LazyModule('neutron.api.v2.attributes')
+constants = LazyModule('neutron.plugins.common.constants')
+loadbalancer_db = LazyModule('neutron_lbaas.db.loadbalancer.loadbalancer_db')
+db = LazyModule('arraylbaasv1driver.driver.v1.db')
+adc_port_pool = LazyModule('arraylbaasv1driver.driver.v1.adc_port_pool')
+adc_coalescer = LazyModule('arraylbaasv1driver.driver.v1.adc_coalescer')
+adc_op_queue = LazyModule('arraylbaasv1driver.driver.v1.adc_op_queue')
+n_context = LazyModule('neutron.context')
+adc_exceptions = LazyModule('arraylbaasv1driver.driver.v1.exceptions')
+adc_rest = LazyModule('arraylbaasv1driver.driver.v1.adc_rest')
+
+# The optional features are only imported when their options turn them
+# on, or when the plans, the resync or the audit are called
+adc_digest = LazyModule('arraylbaasv1driver.driver.v1.adc_digest')
+adc_dirty = LazyModule('arraylbaasv1driver.driver.v1.adc_dirty')
+adc_dryrun = LazyModule('arraylbaasv1driver.driver.v1.adc_dryrun')
+adc_limiter = LazyModule('arraylbaasv1driver.driver.v1.adc_limiter')
+adc_metrics = LazyModule('arraylbaasv1driver.driver.v1.adc_metrics')
+adc_profiler = LazyModule('arraylbaasv1driver.driver.v1.adc_profiler')
+adc_resync = LazyModule('arraylbaasv1driver.driver.v1.adc_resync')
+adc_spans = LazyModule('arraylbaasv1driver.driver.v1.adc_spans')
+adc_trace = LazyModule('arraylbaasv1driver.driver.v1.adc_trace')
 
 LOG = logging.getLogger(__name__)
 DRIVER_NAME = 'ArrayAPV'
+STREAM_CHUNK = 1000
 
 OPTS = [
     cfg.StrOpt(
@@ -60,43 +88,692 @@ OPTS = [
         default=('arraylbaasv1driver.driver.v1.avx_driver.'
                  'ArrayAVXAPIDriver'),
         help=('The driver used to provision ADC product')
+    ),
+    cfg.IntOpt(
+        'array_bulk_batch_size',
+        default=200,
+        min=1,
+        help=('Maximum number of commands pushed to device in one request '
+              'by the bulk member operations and the command plans')
+    ),
+    cfg.IntOpt(
+        'array_member_weight_coalesce_window',
+        default=0,
+        min=0,
+        help=('Window in millisecond to merge the weight updates of '
+              'members in the same pool, 0 means not to merge')
+    ),
+    cfg.IntOpt(
+        'array_op_queue_window',
+        default=0,
+        min=0,
+        help=('Window in millisecond to hold the operations of VIPs and '
+              'members, so that the operations of the same object can be '
+              'cancelled or merged before they are sent to devices, 0 '
+              'means to send them immediately')
+    ),
+    cfg.IntOpt(
+        'array_scheduler_concurrency',
+        default=0,
+        min=0,
+        help=('Maximum number of requests sent to devices at the same '
+              'time, the slots are shared fairly among tenants, 0 means '
+              'no limit')
+    ),
+    cfg.StrOpt(
+        'array_scheduler_tenant_weights',
+        default='',
+        help=('Weights of tenants when sharing the request slots, in '
+              'the format of tenant_id:weight,tenant_id:weight')
+    ),
+    cfg.IntOpt(
+        'array_scheduler_priority_ratio',
+        default=4,
+        min=1,
+        help=('Maximum number of requests in the priority lane (deletes '
+              'and config saves) served in a row when others are waiting')
+    ),
+    cfg.IntOpt(
+        'array_limiter_max_concurrency',
+        default=0,
+        min=0,
+        help=('Maximum number of concurrent requests to the management '
+              'plane of one device, the limit is adapted between the '
+              'minimum and this value by the latency and the errors, '
+              '0 means not to limit')
+    ),
+    cfg.IntOpt(
+        'array_limiter_min_concurrency',
+        default=1,
+        min=1,
+        help=('Minimum number of concurrent requests to one device')
+    ),
+    cfg.FloatOpt(
+        'array_limiter_max_rate',
+        default=0.0,
+        min=0,
+        help=('Maximum number of requests per second to one device, 0 '
+              'means not to limit the rate')
+    ),
+    cfg.FloatOpt(
+        'array_limiter_min_rate',
+        default=1.0,
+        min=0,
+        help=('Minimum number of requests per second to one device')
+    ),
+    cfg.IntOpt(
+        'array_limiter_latency_target',
+        default=5000,
+        min=1,
+        help=('Latency in millisecond above which the device is regarded '
+              'as overloaded')
+    ),
+    cfg.StrOpt(
+        'array_rest_object_types',
+        default='vlan',
+        help=('Object types pushed to APV through the structured REST '
+              'resources instead of CLI, only vlan is supported')
+    ),
+    cfg.BoolOpt(
+        'array_share_health_monitors',
+        default=False,
+        help=('Create one health object for the identical health monitors '
+              'in a device or VA and attach it to all their groups')
+    ),
+    cfg.BoolOpt(
+        'array_share_real_servers',
+        default=False,
+        help=('Create one real server for the members with the same '
+              'protocol, address and port in a device or VA and add it '
+              'to all their groups')
+    ),
+    cfg.BoolOpt(
+        'array_skip_clean_write_memory',
+        default=False,
+        help=('Skip write memory on the devices and VAs which received '
+              'no configuration change since their last save')
+    ),
+    cfg.StrOpt(
+        'array_trace_file',
+        default='',
+        help=('Append the calls of the driver operations to this JSON lines '
+              'file, to be replayed by arraylbaasv1driver.tools.replay, '
+              'empty means not to record them')
+    ),
+    cfg.StrOpt(
+        'array_metrics_file',
+        default='',
+        help=('Write the latency histograms and error counters of the driver '
+              'to this file in the Prometheus text format, %(pid)s is '
+              'replaced by the process id, empty means not to write them')
+    ),
+    cfg.StrOpt(
+        'array_metrics_listen',
+        default='',
+        help=('Serve the metrics on http://<host>:<port>/metrics of this '
+              'address, empty means not to serve them')
+    ),
+    cfg.FloatOpt(
+        'array_metrics_interval',
+        default=15.0,
+        min=1,
+        help=('Seconds between the writes of array_metrics_file')
+    ),
+    cfg.StrOpt(
+        'array_span_exporter',
+        default='',
+        help=('Export a trace span for each driver operation and its steps '
+              'down to each device request, "file" appends them to '
+              'array_span_file, or the class path of a SpanExporter, empty '
+              'means not to trace them')
+    ),
+    cfg.StrOpt(
+        'array_span_file',
+        default='/var/log/neutron/array_spans.jsonl',
+        help=('The JSON lines file of the spans of the file exporter')
+    ),
+    cfg.StrOpt(
+        'array_profile_dir',
+        default='',
+        help=('Dump the cProfile of the sampled driver operations into this '
+              'directory while profiling is on, it is switched by SIGUSR2 '
+              'which also reloads the profile options, empty means the '
+              'profiling is not available')
+    ),
+    cfg.BoolOpt(
+        'array_profile_enabled',
+        default=False,
+        help=('Switch the profiling on when the driver is loaded')
+    ),
+    cfg.StrOpt(
+        'array_profile_operations',
+        default='',
+        help=('Comma separated driver operations to profile, such as '
+              'create_vip,delete_pool, empty means all of them')
+    ),
+    cfg.FloatOpt(
+        'array_profile_rate',
+        default=0.1,
+        min=0,
+        max=1,
+        help=('The fraction of the calls of the operations to profile')
+    ),
+    cfg.IntOpt(
+        'array_profile_max_dumps',
+        default=100,
+        min=1,
+        help=('Keep at most this number of dumps, the oldest ones are removed')
+    ),
+    cfg.FloatOpt(
+        'array_profile_duration',
+        default=300.0,
+        min=0,
+        help=('Seconds after which the profiling switches itself off, 0 '
+              'means to keep it on until SIGUSR2')
+    ),
+    cfg.BoolOpt(
+        'array_config_digest',
+        default=False,
+        help=('Keep the digest of the configuration intended for each device '
+              'and VA, so that audit_config does not rebuild it from Neutron')
+    ),
+    cfg.BoolOpt(
+        'array_rebuild_mapping',
+        default=False,
+        help=('Rebuild the mapping from the running configuration of '
+              'devices when the server starts')
+    ),
+    cfg.IntOpt(
+        'array_rebuild_concurrency',
+        default=64,
+        min=1,
+        help=('Maximum number of devices or VAs queried at the same time '
+              'when rebuilding the mapping')
     )
 ]
 
-cfg.CONF.register_opts(OPTS, 'arraynetworks')
+# The options of db and adc_port_pool, which are imported lazily, are
+# registered here so that their values are checked at the start
+DB_OPTS = [
+    cfg.IntOpt(
+        'array_request_vlan_interval',
+        default=100,
+        min=0,
+        help=('Interval in millisecond to request VLAN ID'
+              'from database')
+    ),
+    cfg.IntOpt(
+        'array_request_vlan_max_retries',
+        default=10,
+        min=0,
+        help=('Maximum number to try to request vlan'
+              'from database')
+    ),
+    cfg.StrOpt(
+        'array_request_vlan_hostname',
+        default=10,
+        help=('Hostname of port binding')
+    )
+]
+
+PORT_POOL_OPTS = [
+    cfg.IntOpt(
+        'array_port_pool_low_water',
+        default=0,
+        min=0,
+        help=('Refill the pool of pre-created interface ports of a subnet '
+              'when it has less ports than this number')
+    ),
+    cfg.IntOpt(
+        'array_port_pool_high_water',
+        default=0,
+        min=0,
+        help=('Maximum number of pre-created interface ports kept for '
+              'each subnet, 0 means the pool is disabled')
+    ),
+    cfg.FloatOpt(
+        'array_port_pool_refill_rate',
+        default=5.0,
+        min=0,
+        help=('Maximum number of ports created per second when refilling '
+              'the pool')
+    )
+]
+
+cfg.CONF.register_opts(OPTS + DB_OPTS + PORT_POOL_OPTS, 'arraynetworks')
 
 
 class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
 
     def __init__(self, plugin):
         LOG.debug("ArrayApvDriver __init__")
+        self.metrics = None
+        self.metrics_exporter = None
+        if (cfg.CONF.arraynetworks.array_metrics_file or
+                cfg.CONF.arraynetworks.array_metrics_listen):
+            self.metrics = adc_metrics.Metrics()
+            # started by the first operation of every worker
+            self.metrics_exporter = adc_metrics.MetricsExporter(
+                self.metrics, cfg.CONF.arraynetworks.array_metrics_file,
+                cfg.CONF.arraynetworks.array_metrics_listen,
+                cfg.CONF.arraynetworks.array_metrics_interval)
+        self.tracer = None
+        exporter = cfg.CONF.arraynetworks.array_span_exporter
+        if exporter == 'file':
+            self.tracer = adc_spans.Tracer(adc_spans.FileSpanExporter(
+                cfg.CONF.arraynetworks.array_span_file))
+        elif exporter:
+            self.tracer = adc_spans.Tracer(importutils.import_object(exporter))
+        if self.metrics or self.tracer:
+            plugin = adc_metrics.InstrumentedPlugin(plugin, self.metrics, self.tracer)
         self.plugin = plugin
 
         self.hosts = cfg.CONF.arraynetworks.array_management_ip.split(',')[0:2]
         self.interfaces = cfg.CONF.arraynetworks.array_interfaces
         self.username = cfg.CONF.arraynetworks.array_api_user
         self.password = cfg.CONF.arraynetworks.array_api_password
-        self._load_driver()
+        self._client = None
+        self._port_pool = None
+        self._weight_coalescer = None
+        self._op_queue = None
+        self.scheduler = None
+        concurrency = cfg.CONF.arraynetworks.array_scheduler_concurrency
+        if concurrency > 0:
+            self.scheduler = adc_scheduler.FairScheduler(
+                concurrency,
+                weights=adc_scheduler.parse_weights(
+                    cfg.CONF.arraynetworks.array_scheduler_tenant_weights),
+                priority_ratio=cfg.CONF.arraynetworks.array_scheduler_priority_ratio)
+        self.limiters = None
+        max_concurrency = cfg.CONF.arraynetworks.array_limiter_max_concurrency
+        if max_concurrency > 0:
+            self.limiters = adc_limiter.DeviceLimiters(
+                cfg.CONF.arraynetworks.array_limiter_min_concurrency,
+                max_concurrency,
+                cfg.CONF.arraynetworks.array_limiter_min_rate,
+                cfg.CONF.arraynetworks.array_limiter_max_rate,
+                cfg.CONF.arraynetworks.array_limiter_latency_target / 1000.0)
+        self.dirty = None
+        if cfg.CONF.arraynetworks.array_skip_clean_write_memory:
+            self.dirty = adc_dirty.DirtyTracker()
+        self.trace_recorder = None
+        if cfg.CONF.arraynetworks.array_trace_file:
+            self.trace_recorder = adc_trace.TraceRecorder(
+                cfg.CONF.arraynetworks.array_trace_file)
+        self.profiler = None
+        if cfg.CONF.arraynetworks.array_profile_dir:
+            self.profiler = adc_profiler.OperationProfiler(
+                cfg.CONF.arraynetworks.array_profile_dir)
+            self._configure_profiler()
+            if cfg.CONF.arraynetworks.array_profile_enabled:
+                self.profiler.enable()
+            self._install_profile_switch()
+        self.digest = None
+        if cfg.CONF.arraynetworks.array_config_digest:
+            self.digest = adc_digest.ConfigDigest()
+        self.rest_types = adc_rest.parse_types(
+            cfg.CONF.arraynetworks.array_rest_object_types)
+        self.digest_ready = False
+        self._load_lock = threading.Lock()
+        if cfg.CONF.arraynetworks.array_rebuild_mapping:
+            # before any request is served, a failure stops the server
+            self.rebuild_mapping(n_context.get_admin_context())
+
+    def _configure_profiler(self):
+        self.profiler.configure(
+            adc_profiler.parse_operations(cfg.CONF.arraynetworks.array_profile_operations),
+            cfg.CONF.arraynetworks.array_profile_rate,
+            cfg.CONF.arraynetworks.array_profile_max_dumps,
+            cfg.CONF.arraynetworks.array_profile_duration)
+
+    def _install_profile_switch(self):
+        if not hasattr(signal, 'SIGUSR2'):
+            return
+        if signal.getsignal(signal.SIGUSR2) not in (signal.SIG_DFL, None):
+            LOG.warning("SIGUSR2 is taken, the profiling can't be switched by it")
+            return
+        try:
+            signal.signal(signal.SIGUSR2, self._switch_profiler)
+        except ValueError:
+            # only the main thread can install the signal handlers
+            LOG.warning("Failed to install the SIGUSR2 handler of the profiling")
+
+    def _switch_profiler(self, signum, frame):
+        """ Reload the profile options and switch the profiling """
+        if hasattr(cfg.CONF, 'reload_config_files'):
+            try:
+                cfg.CONF.reload_config_files()
+            except Exception as e:
+                LOG.warning("Failed to reload the configuration: %s", e)
+        self._configure_profiler()
+        self.profiler.toggle()
+
+    @property
+    def client(self):
+        """ The device driver is loaded when the first operation comes """
+        if self._client is None:
+            with self._load_lock:
+                if self._client is None:
+                    self._load_driver()
+        return self._client
+
+    @property
+    def port_pool(self):
+        if self._port_pool is None:
+            with self._load_lock:
+                if self._port_pool is None:
+                    self._port_pool = adc_port_pool.InterfacePortPool(
+                        self.plugin, DRIVER_NAME)
+        return self._port_pool
+
+    @property
+    def weight_coalescer(self):
+        window = cfg.CONF.arraynetworks.array_member_weight_coalesce_window
+        if window <= 0:
+            return None
+        if self._weight_coalescer is None:
+            with self._load_lock:
+                if self._weight_coalescer is None:
+                    self._weight_coalescer = adc_coalescer.Coalescer(
+                        window / 1000.0, self._flush_member_weights)
+        return self._weight_coalescer
+
+    @property
+    def op_queue(self):
+        window = cfg.CONF.arraynetworks.array_op_queue_window
+        if window <= 0:
+            return None
+        if self._op_queue is None:
+            with self._load_lock:
+                if self._op_queue is None:
+                    self._op_queue = adc_op_queue.OperationQueue(
+                        window / 1000.0, self._dispatch_operation,
+                        self._cancel_operation,
+                        lambda: self.client.request_count)
+        return self._op_queue
+
+    def _queued(self, obj_type, obj_id, op, *args):
+        """ Return True if the operation is held in the pending queue """
+        op_queue = self.op_queue
+        if not op_queue or op_queue.in_dispatch():
+            return False
+        op_queue.submit(obj_type, obj_id, op, *args)
+        return True
+
+    def _flush_queued(self, pool_id):
+        """ Run the pending operations of the pool before an operation
+            of the pool or its health monitors, which isn't queued
+        """
+        op_queue = self.op_queue
+        if op_queue and not op_queue.in_dispatch():
+            op_queue.flush(pool_id)
+
+    def _dispatch_operation(self, obj_type, op, args):
+        context = n_context.get_admin_context()
+        method = getattr(self, "%s_%s" % (op, obj_type))
+        try:
+            # it was traced when it was queued
+            with adc_trace.untraced():
+                method(context, *args)
+        except Exception:
+            model = loadbalancer_db.Vip
+            if obj_type == 'member':
+                model = loadbalancer_db.Member
+            self.plugin.update_status(context, model, args[-1]['id'],
+                                      constants.ERROR)
+            raise
+
+    def _cancel_operation(self, obj_type, op, args):
+        """ The object was never created on devices, only remove it
+            from database
+        """
+        context = n_context.get_admin_context()
+        if obj_type == 'vip':
+            self.plugin._delete_db_vip(context, args[-1]['id'])
+        else:
+            self.plugin._delete_db_member(context, args[-1]['id'])
 
     def _load_driver(self):
-        self.client = None
-
         LOG.debug('loading LBaaS driver %s' % cfg.CONF.arraynetworks.array_device_driver)
+        start = time.time()
         try:
-            self.client = importutils.import_object(
-                cfg.CONF.arraynetworks.array_device_driver,
-                self.hosts, self.interfaces, self.username,
-                self.password)
-            return
+            self._client = self._new_client()
+            LOG.info("Loaded LBaaS driver %s in %.3f seconds",
+                     cfg.CONF.arraynetworks.array_device_driver,
+                     time.time() - start)
         except ImportError as ie:
             msg = ('Error importing loadbalancer device driver: %s error %s'
                    % (cfg.CONF.arraynetworks.array_device_driver, repr(ie)))
             LOG.error(msg)
-            raise SystemExit(msg)
-
+            raise adc_exceptions.ArrayADCException(msg)
+
+    def _new_client(self):
+        client = importutils.import_object(
+            cfg.CONF.arraynetworks.array_device_driver,
+            self.hosts, self.interfaces, self.username,
+            self.password)
+        client.scheduler = self.scheduler
+        client.limiters = self.limiters
+        client.dirty = self.dirty
+        client.metrics = self.metrics
+        client.tracer = self.tracer
+        client.digest = self.digest
+        client.plan_batch_size = cfg.CONF.arraynetworks.array_bulk_batch_size
+        client.share_health_monitors = \
+            cfg.CONF.arraynetworks.array_share_health_monitors
+        client.share_real_servers = \
+            cfg.CONF.arraynetworks.array_share_real_servers
+        if hasattr(client, 'rest_types'):
+            client.rest_types = self.rest_types
+        return client
+
+    def planner(self):
+        """
+        Return a copy of the driver whose operations only plan the device
+        requests. It starts from a copy of the current mapping and keeps
+        its own changes, so a series of operations can be planned, and
+        nothing is sent to devices or changed in Neutron.
+        """
+        client = self._new_client()
+        client.scheduler = client.limiters = client.dirty = None
+        client.metrics = client.tracer = client.digest = None
+        client._cache = adc_dryrun.detached_cache(self.client.cache)
+        client.recorder = adc_dryrun.PlanRecorder()
+        plugin = adc_dryrun.ReadOnlyPlugin(self.plugin, client.recorder)
+        planner = _DetachedDriver(self, client, plugin, adc_dryrun.NoPortPool(plugin))
+        planner.recorder = client.recorder
+        return planner
+
+    def plan_operation(self, context, op, *args, **kwargs):
+        """
+        Plan the operation of the name with its arguments, such as
+        plan_operation(context, 'create_vip', vip), and return the plan of
+        the requests of each device and VA with the predicted round trips
+        and saves. The estimated seconds are given by the latency of the
+        device requests observed so far when the metrics are on.
+        """
+        planner = self.planner()
+        getattr(planner, op)(context, *args, **kwargs)
+        request_seconds = None
+        if self.metrics:
+            request_seconds = self.metrics.mean(adc_metrics.DEVICE_REQUEST)
+        return planner.recorder.summary(request_seconds)
+
+    def resync_device(self, context, host, va_name=None, checkpoint=None,
+                      concurrency=None, checkpoint_interval=50):
+        """
+        Push the whole configuration of the pools to host again from
+        Neutron and the mapping, such as after the device was replaced,
+        or only the pools of va_name on AVX whose VAs must exist already.
+        The requests to the other devices are dropped, the VIPs get the
+        interface ports they have in the mapping, and neither Neutron nor
+        the mapping is changed.
+
+        The pools are pushed by concurrency threads, array_rebuild_concurrency
+        by default, and saved every checkpoint_interval pools. The saved
+        pools are kept in the checkpoint file when it is given, and an
+        interrupted resync with the same file goes on after them. Return
+        the summary with the failed pools.
+        """
+        if host not in self.hosts:
+            msg = "The host(%s) is not one of %s" % (host, self.hosts)
+            raise adc_exceptions.ArrayADCException(msg)
+        client = self._new_client()
+        client.scheduler = client.dirty = None
+        client._cache = adc_dryrun.detached_cache(self.client.cache)
+        refs = client.start_resync(host, va_name)
+        plugin = adc_dryrun.ReadOnlyPlugin(self.plugin, adc_dryrun.PlanRecorder())
+        driver = _ResyncDriver(self, client, plugin,
+                               adc_resync.ReservedPortPool(plugin, self.hosts))
+        if concurrency is None:
+            concurrency = cfg.CONF.arraynetworks.array_rebuild_concurrency
+        resync = adc_resync.DeviceResync(driver, host, va_name, concurrency,
+                                         checkpoint, checkpoint_interval, refs)
+        return resync.run(context)
+
+    def _intended_digest(self, context):
+        """ Build the digest of the configuration intended for all the
+            devices by pushing all the pools to a digest instead of the
+            devices, from Neutron and a copy of the mapping
+        """
+        start = time.time()
+        digest = adc_digest.ConfigDigest()
+        client = self._new_client()
+        client.scheduler = client.limiters = client.dirty = None
+        client.metrics = client.tracer = client.digest = None
+        client._cache = adc_dryrun.detached_cache(self.client.cache)
+        refs = client.start_resync(None)
+        client.recorder = adc_digest.DigestRecorder(digest)
+        plugin = adc_dryrun.ReadOnlyPlugin(self.plugin, adc_dryrun.PlanRecorder())
+        driver = _ResyncDriver(self, client, plugin,
+                               adc_resync.ReservedPortPool(plugin, self.hosts, False))
+        adc_resync.DeviceResync(
+            driver, None, concurrency=cfg.CONF.arraynetworks.array_rebuild_concurrency,
+            refs=refs).run(context)
+        LOG.info("Built the digest of %d devices and VAs in %.2f seconds",
+                 len(digest.scopes), time.time() - start)
+        return digest
+
+    def audit_config(self, context, host=None, va_name=None):
+        """
+        Compare the configuration intended for each device and VA, or
+        only the ones of host and va_name, with their running
+        configuration. The virtual services, groups, real servers, health
+        monitors and policies are compared by their digests: the running
+        configuration is read once, the pools are compared only when the
+        digests of the device or VA differ, and their objects only when
+        the digests of the pools differ. Return the report of each
+        device and VA with the missing, unexpected and changed objects of
+        each drifted pool, '' is for the objects out of the pools.
+
+        With array_config_digest, the digest is built from Neutron by the
+        first audit and then kept by the requests sent to the devices,
+        otherwise it is built by every audit.
+        """
+        digest = self.digest
+        if digest is None or not self.digest_ready:
+            intended = self._intended_digest(context)
+            if digest is None:
+                digest = intended
+            else:
+                digest.replace(intended)
+                self.digest_ready = True
+
+        client = self.client
+        scopes = [scope for scope in client.config_scopes()
+                  if (not host or scope[0] == host) and
+                  (not va_name or scope[1] == va_name)]
+        start = time.time()
+        results = adc_utils.run_concurrently(
+            lambda scope: digest.compare(scope, client.show_running_config(scope)),
+            scopes, cfg.CONF.arraynetworks.array_rebuild_concurrency)
+        reports = []
+        for scope, result, error in results:
+            report = {'scope': scope[0] + ('/' + scope[1] if scope[1] else '')}
+            if error:
+                LOG.error("Audit: failed to read the configuration of %s: %s",
+                          report['scope'], error)
+                report['error'] = repr(error)
+            else:
+                report.update(result)
+                if result['drift']:
+                    LOG.warning("Audit: the configuration of %s drifted in %d pools",
+                                report['scope'], len(result['drift']))
+            reports.append(report)
+        LOG.info("Audit: compared %d devices and VAs in %.2f seconds, %d drifted",
+                 len(reports), time.time() - start,
+                 len([r for r in reports if r.get('drift')]))
+        return reports
+
+    def _get_vlan_id(self, context, port_id):
+        if not self.tracer:
+            return self._lookup_vlan_id(context, port_id)
+        with adc_spans.span(self.tracer, 'get_vlan_id', port_id=port_id) as span:
+            vlan_id = self._lookup_vlan_id(context, port_id)
+            span.set('vlan_id', vlan_id)
+        return vlan_id
+
+    def _lookup_vlan_id(self, context, port_id):
+        if not self.metrics:
+            return db.get_vlan_id_by_port_cmcc(context, port_id)
+        with self.metrics.timed(adc_metrics.VLAN_LOOKUP) as timer:
+            vlan_id = db.get_vlan_id_by_port_cmcc(context, port_id)
+            timer.failed = not vlan_id
+        return vlan_id
+
+    def rebuild_mapping(self, context):
+        """ Recover the mapping from the devices, it is used when the
+            mapping file is lost or stale
+        """
+        client = self.client
+        LOG.info("Rebuild the mapping from devices(%s)", self.hosts)
+        start = time.time()
+        filters = {'device_owner': [DRIVER_NAME]}
+        ports = self.plugin._core_plugin.get_ports(context, filters=filters)
+        ports = [port for port in ports if port['fixed_ips'] and not
+                 port['device_id'].startswith(adc_port_pool.POOL_PORT_PREFIX)]
+        pools = dict((pool['id'], pool)
+                     for pool in self.plugin.get_pools(context))
+        members = ()
+        if cfg.CONF.arraynetworks.array_share_real_servers:
+            members = self._member_argus(context, (
+                member for pool_id in pools
+                for member in self._stream_members(context, pool_id)), pools)
+        mapping = client.rebuild_cache(
+            ports, self._rebuild_vips(context, pools.values()), members,
+            cfg.CONF.arraynetworks.array_rebuild_concurrency)
+        LOG.info("Rebuilt the mapping with %d ports in %.2f seconds",
+                 len(ports), time.time() - start)
+        return mapping
+
+    def _rebuild_vips(self, context, pools):
+        """ The VLAN, subnet and netmask of the VIPs of the pools, which
+            tell the interfaces the VIPs use on the devices
+        """
+        vips = {}
+        netmasks = {}
+        for pool in pools:
+            if not pool.get('vip_id'):
+                continue
+            vip = self.plugin.get_vip(context, pool['vip_id'])
+            subnet_id = vip['subnet_id']
+            if subnet_id not in netmasks:
+                subnet = self.plugin._core_plugin.get_subnet(context, subnet_id)
+                netmasks[subnet_id] = str(netaddr.IPNetwork(subnet['cidr']).netmask)
+            vips[vip['id']] = {
+                'vlan_tag': self._get_vlan_id(context, vip['port_id']),
+                'subnet_id': subnet_id,
+                'netmask': netmasks[subnet_id],
+            }
+        return vips
+
+    @adc_instrument.operation
+    @tenant_operation()
     def create_vip(self, context, vip, updated=True):
         LOG.debug("Create a vip on Array ADC device")
         LOG.debug("vip = %s",vip)
+        if updated and self._queued('vip', vip['id'], 'create', vip):
+            return
 
         argu = {}
         sp_type = None
@@ -104,7 +781,7 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
         vip_port_mac = None
 
         port_id = vip['port_id']
-        vlan_tag = db.get_vlan_id_by_port_cmcc(context, port_id)
+        vlan_tag = self._get_vlan_id(context, port_id)
         if not vlan_tag:
             LOG.debug("Cann't get the vlan_tag by port_id(%s)", port_id)
         else:
@@ -145,6 +822,8 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
         if len(self.hosts) > 1:
             cnt = 0
             LOG.debug("self.hosts(%s): len(%d)", self.hosts, len(self.hosts))
+            pooled_ports = self.port_pool.claim(context, tenant_id,
+                                                subnet, len(self.hosts))
             for host in self.hosts:
                 interfaces = {}
                 port_data = {
@@ -158,8 +837,18 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
                     'fixed_ips': [{'subnet_id': subnet_id}]
                 }
                 cnt += 1
-                LOG.debug("Will create port(%s) for host(%s)", port_data, host)
-                port = self.plugin._core_plugin.create_port(context, {'port': port_data})
+                if pooled_ports:
+                    pooled_port = pooled_ports.pop(0)
+                    LOG.debug("Will use port(%s) in pool for host(%s)", pooled_port['id'], host)
+                    port_data = {
+                        'name': port_data['name'],
+                        'device_id': port_data['device_id']
+                    }
+                    port = self.plugin._core_plugin.update_port(context, pooled_port['id'],
+                                                                {'port': port_data})
+                else:
+                    LOG.debug("Will create port(%s) for host(%s)", port_data, host)
+                    port = self.plugin._core_plugin.create_port(context, {'port': port_data})
                 interfaces['address'] = port['fixed_ips'][0]['ip_address']
                 interfaces['port_id'] = port['id']
                 interface_mapping[host] = interfaces
@@ -167,10 +856,7 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
         self.client.allocate_vip(argu)
 
         #Add the member into this group
-        for member_id in pool['members']:
-            member = self.plugin.get_member(context, member_id)
-            LOG.debug("Will create a member(%s) = %s", (member_id, member))
-            self.create_member(context, member, updated=False)
+        self._create_pool_members(context, pool)
 
         #Add the health monitor into this group
         for hm_id in pool['health_monitors']:
@@ -186,10 +872,14 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
                                       status)
 
 
+    @adc_instrument.operation
+    @tenant_operation()
     def update_vip(self, context, old_vip, vip):
         LOG.debug("Update a vip on Array apv device")
         LOG.debug("old vip = %s", old_vip)
         LOG.debug("vip = %s", vip)
+        if self._queued('vip', vip['id'], 'update', old_vip, vip):
+            return
         need_recreate = False
         need_rebuild = False
 
@@ -220,10 +910,7 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
 
             # FIXME: In fact, step 4 and 5 can't work. since it doesn't have "slb group"
             # 4. create the member from old pool
-            for member_id in old_pool['members']:
-                member = self.plugin.get_member(context, member_id)
-                LOG.debug("Will create a member(%s) = %s", (member_id, member))
-                self.create_member(context, member, updated=False)
+            self._create_pool_members(context, old_pool)
 
             # 5. create the health_monitor from old pool
             for hm_id in old_pool['health_monitors']:
@@ -246,10 +933,7 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
             self.create_vip(context, vip, updated=False)
 
             # 9. create the member from new pool
-            for member_id in pool['members']:
-                member = self.plugin.get_member(context, member_id)
-                LOG.debug("Will create a member(%s) = %s", (member_id, member))
-                self.create_member(context, member, updated=False)
+            self._create_pool_members(context, pool)
 
             # 10. create the health_monitor from new pool
             for hm_id in pool['health_monitors']:
@@ -291,10 +975,7 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
             pool = self.plugin.get_pool(context, vip['pool_id'])
 
             # 5. create the member from new pool
-            for member_id in pool['members']:
-                member = self.plugin.get_member(context, member_id)
-                LOG.debug("Will create a member(%s) = %s", (member_id, member))
-                self.create_member(context, member, updated=False)
+            self._create_pool_members(context, pool)
 
             # 6. create the health_monitor from new pool
             for hm_id in pool['health_monitors']:
@@ -311,14 +992,18 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
         self.plugin.update_status(context, loadbalancer_db.Vip, old_vip["id"],
                                   status)
 
+    @adc_instrument.operation
+    @tenant_operation(adc_scheduler.LANE_PRIORITY)
     def delete_vip(self, context, vip, updated=True):
         LOG.debug("Delete a vip on Array apv device")
         LOG.debug("vip = %s", vip)
+        if updated and self._queued('vip', vip['id'], 'delete', vip):
+            return
 
         argu = {}
         sp_type = None
         port_id = vip['port_id']
-        vlan_tag = db.get_vlan_id_by_port_cmcc(context, port_id)
+        vlan_tag = self._get_vlan_id(context, port_id)
         if not vlan_tag:
             LOG.debug("Cann't get the vlan_tag by port_id(%s)", port_id)
 
@@ -340,9 +1025,8 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
             LOG.debug("Will delete the port created by ourselves.")
             mapping = self.client.get_cached_map(argu)
             if mapping:
-                for host in self.hosts:
-                    port_id = mapping[host]
-                    self.plugin._core_plugin.delete_port(context, port_id)
+                port_ids = [mapping[host] for host in self.hosts]
+                self.port_pool.release(context, port_ids)
 
         self.client.deallocate_vip(argu, updated)
         if updated:
@@ -350,9 +1034,12 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
             self.plugin._delete_db_vip(context, vip['id'])
 
 
+    @adc_instrument.operation
+    @tenant_operation()
     def create_pool(self, context, pool, updated=True):
         LOG.debug("Create a pool on Array apv device")
         LOG.debug("create pool = %s",pool)
+        self._flush_queued(pool['id'])
 
         argu = {}
         argu['tenant_id'] = pool['tenant_id']
@@ -367,10 +1054,13 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
                                       pool["id"], status)
 
 
+    @adc_instrument.operation
+    @tenant_operation()
     def update_pool(self, context, old_pool, pool):
         LOG.debug("Update a pool on Array apv device")
         LOG.debug("Update old pool = %s", old_pool)
         LOG.debug("Update pool = %s", pool)
+        self._flush_queued(pool['id'])
         need_recreate = False
 
 
@@ -414,28 +1104,36 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
         self.plugin.update_status(context, loadbalancer_db.Pool,
                                   old_pool["id"], status)
 
+    @adc_instrument.operation
+    @tenant_operation(adc_scheduler.LANE_PRIORITY)
     def delete_pool(self, context, pool, updated=True):
         LOG.debug("Delete a pool on Array apv device")
         LOG.debug("Delete pool = %s", pool)
+        self._flush_queued(pool['id'])
 
         argu = {}
-        members_dict = {}
+        protocol = pool.get('protocol', None)
         argu['tenant_id'] = pool['tenant_id']
         argu['pool_id'] = pool["id"]
         argu["lb_algorithm"] = pool["lb_method"]
         argu['health_monitors'] = pool['health_monitors']
-
-        for member_id in pool['members']:
-            members_dict[member_id] = pool.get('protocol', None)
-        argu['members'] = members_dict
+        argu['members'] = ({'member_id': member['id'],
+                            'protocol': protocol,
+                            'member_address': member['address'],
+                            'member_port': member['protocol_port']}
+                           for member in self._stream_members(context, pool['id']))
         self.client.delete_group(argu, updated)
 
         if updated:
             self.plugin._delete_db_pool(context, pool['id'])
 
+    @adc_instrument.operation
+    @tenant_operation()
     def create_member(self, context, member, updated=True):
         LOG.debug("Create a member on Array apv device")
         LOG.debug("member=%s",member)
+        if updated and self._queued('member', member['id'], 'create', member):
+            return
         status = constants.ACTIVE
 
         pool = self.plugin.get_pool(context, member['pool_id'])
@@ -456,10 +1154,14 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
             self.plugin.update_status(context, loadbalancer_db.Member,
                                       member["id"], status)
 
+    @adc_instrument.operation
+    @tenant_operation()
     def update_member(self,context,old_member,member):
         LOG.debug("Update a member on Array apv device")
         LOG.debug("old_member=%s",old_member)
         LOG.debug("member=%s",member)
+        if self._queued('member', member['id'], 'update', old_member, member):
+            return
         need_update = False
         need_recreate = False
 
@@ -468,7 +1170,12 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
         elif old_member['weight'] != member['weight']:
             need_update = True
 
-        if need_update:
+        if need_update and self.weight_coalescer:
+            # The status will be updated when the weights are pushed
+            LOG.debug("Will merge the weight of member(%s)", member['id'])
+            self.weight_coalescer.submit(member['pool_id'], member['id'], member)
+            return
+        elif need_update:
             argu = {}
             argu['pool_id'] = member['pool_id']
             argu['member_id'] = member['id']
@@ -476,6 +1183,8 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
             self.client.update_member(argu)
             self.client.write_memory(argu)
         elif need_recreate:
+            if self.weight_coalescer:
+                self.weight_coalescer.discard(old_member['pool_id'], old_member['id'])
             self.delete_member(context, old_member, updated=False)
             self.create_member(context, member, updated=False)
             argu = {}
@@ -488,9 +1197,13 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
                                   old_member["id"], status)
 
 
+    @adc_instrument.operation
+    @tenant_operation(adc_scheduler.LANE_PRIORITY)
     def delete_member(self, context, member, updated=True):
         LOG.debug("Delete a member on Array apv device")
         LOG.debug("member=%s",member)
+        if updated and self._queued('member', member['id'], 'delete', member):
+            return
 
         argu = {}
         pool = self.plugin.get_pool(context, member['pool_id'])
@@ -500,6 +1213,8 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
         argu['member_id'] = member['id']
         argu['pool_id'] = member['pool_id']
 
+        if self.weight_coalescer:
+            self.weight_coalescer.discard(member['pool_id'], member['id'])
         self.client.delete_member(argu)
 
         if updated:
@@ -507,10 +1222,223 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
             self.plugin._delete_db_member(context, member['id'])
 
 
+    def _member_argus(self, context, members, pools):
+        """ Generate the argu of members one by one, the pools which the
+            members belong to are fetched only once
+        """
+        for member in members:
+            pool = pools.get(member['pool_id'], None)
+            if not pool:
+                pool = self.plugin.get_pool(context, member['pool_id'])
+                pools[member['pool_id']] = pool
+
+            argu = {}
+            argu['tenant_id'] = member['tenant_id']
+            argu['protocol'] = pool.get('protocol', None)
+            argu['pool_id'] = member['pool_id']
+            argu['member_id'] = member['id']
+            argu['member_address'] = member['address']
+            argu['member_port'] = member['protocol_port']
+            argu['member_weight'] = member['weight']
+            yield argu
+
+    def _stream_members(self, context, pool_id):
+        """ Yield the members of the pool from DB in pages of STREAM_CHUNK
+            rows ordered by id, so that a large pool is never loaded as a
+            whole. Each page is fetched completely by its own query before
+            its members are pushed to devices, no cursor is kept open
+            while the devices are slow.
+        """
+        member_db = loadbalancer_db.Member
+        last_id = None
+        while True:
+            query = context.session.query(member_db).filter_by(pool_id=pool_id)
+            if last_id is not None:
+                query = query.filter(member_db.id > last_id)
+            page = [{
+                'id': member.id,
+                'tenant_id': member.tenant_id,
+                'pool_id': member.pool_id,
+                'address': member.address,
+                'protocol_port': member.protocol_port,
+                'weight': member.weight,
+            } for member in query.order_by(member_db.id).limit(STREAM_CHUNK).all()]
+            for member in page:
+                yield member
+            if len(page) < STREAM_CHUNK:
+                return
+            last_id = page[-1]['id']
+
+    def _create_pool_members(self, context, pool):
+        """ Stream the members of the pool from DB into batched device
+            writes, raise if any of them failed
+        """
+        start = time.time()
+        state = {'count': 0}
+
+        def members():
+            for member in self._stream_members(context, pool['id']):
+                state['count'] += 1
+                yield member
+
+        failures = self.client.create_members(
+            self._member_argus(context, members(), {pool['id']: pool}),
+            cfg.CONF.arraynetworks.array_bulk_batch_size)
+        elapsed = time.time() - start
+        LOG.info("Created %d members of pool(%s) in %.2f seconds, %.1f members "
+                 "per second", state['count'], pool['id'], elapsed,
+                 state['count'] / elapsed if elapsed else 0)
+        if failures:
+            for member_id, error in failures.items():
+                LOG.error("Failed to create member(%s): %s", member_id, error)
+            msg = "Failed to create %d of %d members in pool(%s)" % (
+                len(failures), state['count'], pool['id'])
+            raise adc_exceptions.ArrayADCException(msg)
+
+    def _write_memory_of_pools(self, pools):
+        for pool in pools.values():
+            argu = {}
+            argu['tenant_id'] = pool['tenant_id']
+            argu['pool_id'] = pool['id']
+            self.client.write_memory(argu)
+
+    def _update_member_status_in_bulk(self, context, member_ids, failures):
+        with context.session.begin(subtransactions=True):
+            for member_id in member_ids:
+                if member_id in failures:
+                    self.plugin.update_status(context, loadbalancer_db.Member,
+                                              member_id, constants.ERROR,
+                                              str(failures[member_id]))
+                else:
+                    self.plugin.update_status(context, loadbalancer_db.Member,
+                                              member_id, constants.ACTIVE)
+
+    def _log_member_failures(self, action, member_ids, failures):
+        LOG.info("%s %d members, %d failed", action, len(member_ids), len(failures))
+        for member_id, error in failures.items():
+            LOG.error("Failed to %s member(%s): %s", action.lower(), member_id, error)
+
+    @adc_instrument.operation
+    @tenant_operation()
+    def create_members(self, context, members, updated=True):
+        """ Create a large number of members in batches.
+            Return {member_id: error} of the failed members.
+        """
+        LOG.debug("Create members in bulk on Array ADC device")
+        pools = {}
+        member_ids = []
+
+        def argus():
+            for argu in self._member_argus(context, members, pools):
+                member_ids.append(argu['member_id'])
+                yield argu
+
+        failures = self.client.create_members(
+            argus(), cfg.CONF.arraynetworks.array_bulk_batch_size)
+        self._log_member_failures("Create", member_ids, failures)
+
+        if updated:
+            self._write_memory_of_pools(pools)
+            self._update_member_status_in_bulk(context, member_ids, failures)
+        return failures
+
+    @adc_instrument.operation
+    @tenant_operation()
+    def update_members(self, context, member_pairs):
+        """ Update a large number of members in batches, member_pairs is
+            an iterable of (old_member, member).
+            Return {member_id: error} of the failed members.
+        """
+        LOG.debug("Update members in bulk on Array ADC device")
+        pools = {}
+        member_ids = []
+        moved = []
+
+        def changed_members():
+            for old_member, member in member_pairs:
+                member_ids.append(old_member['id'])
+                if old_member['pool_id'] != member['pool_id']:
+                    moved.append((old_member, member))
+                elif old_member['weight'] != member['weight']:
+                    yield member
+
+        batch_size = cfg.CONF.arraynetworks.array_bulk_batch_size
+        failures = self.client.update_members(
+            self._member_argus(context, changed_members(), pools), batch_size)
+        if moved:
+            failures.update(self.client.delete_members(
+                self._member_argus(context, [old for old, _ in moved], pools),
+                batch_size))
+            failures.update(self.client.create_members(
+                self._member_argus(context, [new for _, new in moved], pools),
+                batch_size))
+        self._log_member_failures("Update", member_ids, failures)
+
+        self._write_memory_of_pools(pools)
+        self._update_member_status_in_bulk(context, member_ids, failures)
+        return failures
+
+    @adc_instrument.operation
+    @tenant_operation(adc_scheduler.LANE_PRIORITY)
+    def delete_members(self, context, members, updated=True):
+        """ Delete a large number of members in batches.
+            Return {member_id: error} of the failed members.
+        """
+        LOG.debug("Delete members in bulk on Array ADC device")
+        pools = {}
+        member_ids = []
+
+        def argus():
+            for argu in self._member_argus(context, members, pools):
+                member_ids.append(argu['member_id'])
+                yield argu
+
+        failures = self.client.delete_members(
+            argus(), cfg.CONF.arraynetworks.array_bulk_batch_size)
+        self._log_member_failures("Delete", member_ids, failures)
+
+        if updated:
+            self._write_memory_of_pools(pools)
+            with context.session.begin(subtransactions=True):
+                for member_id in member_ids:
+                    if member_id in failures:
+                        self.plugin.update_status(context, loadbalancer_db.Member,
+                                                  member_id, constants.ERROR,
+                                                  str(failures[member_id]))
+                    else:
+                        self.plugin._delete_db_member(context, member_id)
+        return failures
+
+    def _flush_member_weights(self, pool_id, items):
+        """ Push the latest weights of the members in one pool together """
+        context = n_context.get_admin_context()
+        argus = []
+        merged = 0
+        for member, member_merged in items:
+            argu = {}
+            argu['tenant_id'] = member['tenant_id']
+            argu['pool_id'] = pool_id
+            argu['member_id'] = member['id']
+            argu['member_weight'] = member['weight']
+            argus.append(argu)
+            merged += member_merged
+
+        failures = self.client.update_members(
+            argus, cfg.CONF.arraynetworks.array_bulk_batch_size)
+        self.client.write_memory(argus[0])
+        LOG.info("Pushed the weights of %d members in pool(%s), merged %d "
+                 "superseded updates", len(argus), pool_id, merged)
+        self._log_member_failures("Update", argus, failures)
+        self._update_member_status_in_bulk(
+            context, [argu['member_id'] for argu in argus], failures)
+
+    @adc_instrument.operation
+    @tenant_operation()
     def create_pool_health_monitor(self, context, health_monitor, pool_id, updated=True):
         LOG.debug("Create a pool health monitor on Array apv device")
         LOG.debug("health_monito=%s",health_monitor)
         LOG.debug("pool_id=%s",pool_id)
+        self._flush_queued(pool_id)
 
         lm_type = health_monitor['type']
         lm_url = None
@@ -543,10 +1471,13 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
                                                    pool_id,
                                                    status, "")
 
+    @adc_instrument.operation
+    @tenant_operation()
     def update_pool_health_monitor(self,context,old_health_monitor,health_monitor,pool_id):
         LOG.debug("Update a pool health monitor on Array apv device")
         LOG.debug("old_health_monitor=%s",old_health_monitor)
         LOG.debug("health_monitor=%s",health_monitor)
+        self._flush_queued(pool_id)
 
         self.delete_pool_health_monitor(
                                        context,
@@ -574,10 +1505,13 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
                                                status, "")
 
 
+    @adc_instrument.operation
+    @tenant_operation(adc_scheduler.LANE_PRIORITY)
     def delete_pool_health_monitor(self, context, health_monitor, pool_id, updated=True):
         LOG.debug("Delete a pool health monitor on Array apv device")
         LOG.debug("health_monito=%s",health_monitor)
         LOG.debug("pool_id=%s",pool_id)
+        self._flush_queued(pool_id)
 
         argu = {}
         argu['tenant_id'] = health_monitor['tenant_id']
@@ -593,3 +1527,47 @@ class ArrayADCDriver(abstract_driver.LoadBalancerAbstractDriver):
 
     def stats(self,context,pool_id):
         LOG.debug("Retrieve pool statistics from the Array apv device")
+
+
+class _DetachedDriver(ArrayADCDriver):
+    """ The driver of ArrayADCDriver.planner() and resync_device(), it has
+        its own client and mapping and doesn't change Neutron
+    """
+
+    # the operations are run at once
+    op_queue = None
+    weight_coalescer = None
+
+    def __init__(self, driver, client, plugin, port_pool):
+        self.plugin = plugin
+        self.hosts = driver.hosts
+        self.interfaces = driver.interfaces
+        self.username = driver.username
+        self.password = driver.password
+        self._client = client
+        self._port_pool = port_pool
+        self._weight_coalescer = None
+        self._op_queue = None
+        self.scheduler = None
+        self.limiters = None
+        self.dirty = None
+        self.trace_recorder = None
+        self.metrics = None
+        self.metrics_exporter = None
+        self.tracer = None
+        self.profiler = None
+        self._load_lock = threading.Lock()
+
+
+class _ResyncDriver(_DetachedDriver):
+    """ The driver of ArrayADCDriver.resync_device() """
+
+    def vlan_of(self, context, vip):
+        return self._get_vlan_id(context, vip['port_id'])
+
+    def resync_vip(self, context, vip, interface_map=None):
+        """ Push the VIP with its pool, members and health monitors, the
+            VIP gets the interface ports of interface_map
+        """
+        with self._port_pool.reserved(interface_map):
+            self.create_vip(context, vip, updated=False)
@@ -0,0 +1,28 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import pytest
+
+from arraylbaasv1driver.driver.v1 import adc_cache
+
+
+@pytest.fixture(autouse=True)
+def mapping_files(tmpdir, monkeypatch):
+    """ Keep the mapping files of the caches in a temporary directory """
+    apv = str(tmpdir.join('mapping_apv.json'))
+    avx = str(tmpdir.join('mapping_avx.json'))
+    monkeypatch.setattr(adc_cache, 'TENANT_APV_MAPPING', apv)
+    monkeypatch.setattr(adc_cache, 'TENANT_AVX_MAPPING', avx)
+    return apv, avx
@@ -0,0 +1,37 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+class CommandRecorder(object):
+    """ The recorder of a device driver keeping the commands of each
+        device instead of sending them
+    """
+    def __init__(self):
+        self.cmds = []
+
+    def cli_extend(self, base_rest_url, cmd):
+        self.cmds.append((base_rest_url, cmd))
+        return ''
+
+    def rest(self, base_rest_url, method, path, payload=None):
+        self.cmds.append((base_rest_url, (method, path, payload)))
+        return ''
+
+
+class FakeResponse(object):
+    """ The response of requests """
+
+    def __init__(self, status_code=200, text=''):
+        self.status_code = status_code
+        self.text = text
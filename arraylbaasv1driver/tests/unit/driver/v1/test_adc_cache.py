@@ -0,0 +1,78 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from arraylbaasv1driver.driver.v1 import adc_cache
+
+
+def test_reload_keeps_unsaved_refs():
+    cache = adc_cache.LogicalAVXCache('port2')
+    va_name = cache.get_va_by_pool('pool-1')
+    assert cache.acquire_ref(va_name, 'real.rs', 'member-1', dump=False)
+    assert not cache.acquire_ref(va_name, 'real.rs', 'member-2', dump=False)
+
+    # another pool in the same batch reloads the mapping from disk
+    cache.get_va_by_pool('pool-2')
+    assert cache.holds_ref(va_name, 'real.rs', 'member-1')
+    assert cache.holds_ref(va_name, 'real.rs', 'member-2')
+
+    cache.dump()
+    assert adc_cache.LogicalAVXCache('port2').refs == {
+        va_name: {'real.rs': ['member-1', 'member-2']}}
+
+
+def test_acquire_and_release_ref():
+    cache = adc_cache.LogicalAPVCache()
+    assert cache.acquire_ref('host1', 'vlan.10', 'vip-1', value='10.0.0.1')
+    assert not cache.acquire_ref('host1', 'vlan.10', 'vip-2', value='10.0.0.2')
+    assert cache.acquire_ref('host2', 'vlan.10', 'vip-3')
+    assert cache.ref_owner('host1', 'vlan.10') == ('vip-1', '10.0.0.1')
+    assert cache.find_ref('host1', 'vlan.', 'vip-2') == 'vlan.10'
+
+    # the resource is configured with the value of the next holder
+    assert not cache.release_ref('host1', 'vlan.10', 'vip-1')
+    assert cache.ref_owner('host1', 'vlan.10') == ('vip-2', '10.0.0.2')
+    assert cache.release_ref('host1', 'vlan.10', 'vip-2')
+    assert cache.ref_owner('host1', 'vlan.10') == (None, None)
+    assert 'host1' not in cache.refs
+    assert 'host1' not in cache.values
+
+
+def test_release_unknown_ref():
+    cache = adc_cache.LogicalAPVCache()
+    assert cache.release_ref('host1', 'vlan.10', 'vip-1')
+
+
+def test_refs_persisted():
+    cache = adc_cache.LogicalAPVCache()
+    cache.acquire_ref('host1', 'vlan.10', 'vip-1', value='10.0.0.1')
+    cache.acquire_ref('host1', 'vlan.10', 'vip-2', dump=False)
+    assert adc_cache.LogicalAPVCache().refs == {
+        'host1': {'vlan.10': ['vip-1']}}
+
+    cache.dump()
+    loaded = adc_cache.LogicalAPVCache()
+    assert loaded.refs == {'host1': {'vlan.10': ['vip-1', 'vip-2']}}
+    assert loaded.ref_owner('host1', 'vlan.10') == ('vip-1', '10.0.0.1')
+    assert adc_cache.SHARED_REFS_KEY not in loaded.mapping
+
+
+def test_clear_refs():
+    cache = adc_cache.LogicalAPVCache()
+    cache.acquire_ref('host1', 'vlan.10', 'vip-1', value='10.0.0.1')
+    cache.clear_refs('host1')
+    assert cache.unsaved
+    assert not cache.holds_ref('host1', 'vlan.10', 'vip-1')
+
+    cache.dump()
+    assert adc_cache.LogicalAPVCache().refs == {}
@@ -0,0 +1,79 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+from arraylbaasv1driver.driver.v1 import adc_digest
+
+BASE = [
+    'slb real http rs1 10.0.0.1 80',
+    'slb real http rs2 10.0.0.2 80',
+    'slb group method g1 rr',
+    'slb group member g1 rs1 1',
+    'slb group member g1 rs2 1',
+    'slb group method g2 rr',
+    'slb group member g2 rs1 1',
+]
+
+
+def _digest(cmds):
+    digest = adc_digest.ScopeDigest()
+    for cmd in cmds:
+        digest.apply(cmd)
+    return digest
+
+
+def test_parse_command():
+    assert adc_digest.parse_command('slb group member g1 rs1 1') == \
+        (True, 'member', ('g1', 'rs1'), 'g1', 'slb group member g1 rs1 1')
+    assert adc_digest.parse_command('no slb real http rs1') == \
+        (False, 'real', ('rs1',), adc_digest.NO_POOL, 'no slb real http rs1')
+    assert adc_digest.parse_command('slb real http "rs1" 10.0.0.1 80')[4] == \
+        'slb real http rs1 10.0.0.1 80'
+    assert adc_digest.parse_command('slb group member g1') is None
+    assert adc_digest.parse_command('show version') is None
+
+
+def test_same_objects_in_any_order_have_no_drift():
+    intended = _digest(BASE)
+    device = _digest(reversed(BASE))
+    assert intended.hash == device.hash
+    assert intended.diff(device) == {}
+
+
+def test_diff_reports_drifted_pools():
+    intended = _digest(BASE)
+    device = _digest(BASE[:4] + ['slb group method g2 rr',
+                                 'slb group member g2 rs1 5',
+                                 'slb group method g3 rr'])
+    assert intended.diff(device) == {
+        'g1': {'missing': ['member g1/rs2'], 'unexpected': [], 'changed': []},
+        'g2': {'missing': [], 'unexpected': [], 'changed': ['member g2/rs1']},
+        'g3': {'missing': [], 'unexpected': ['group g3'], 'changed': []},
+    }
+
+
+def test_delete_removes_children():
+    digest = _digest(BASE + ['no slb group method g1', 'no slb real http rs1'])
+    expected = _digest(['slb real http rs2 10.0.0.2 80',
+                        'slb group method g2 rr'])
+    assert digest.hash == expected.hash
+    assert sorted(digest.objects) == sorted(expected.objects)
+
+
+def test_virtual_service_is_in_pool_of_its_policy():
+    digest = _digest(BASE + ['slb virtual http vs1 10.0.0.100 80',
+                             'slb policy default vs1 g1'])
+    assert digest.objects[('virtual', ('vs1',))][0] == 'g1'
+    digest.apply('no slb policy default vs1')
+    assert digest.objects[('virtual', ('vs1',))][0] == adc_digest.NO_POOL
@@ -0,0 +1,63 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from arraylbaasv1driver.driver.v1 import adc_dirty
+
+URL = 'https://192.0.2.1:9997/rest/avx'
+
+
+def test_command_scope():
+    assert adc_dirty.command_scope(URL, 'va run va1 "slb real enable r1"') == \
+        ((URL, 'va1'), 'slb real enable r1')
+    assert adc_dirty.command_scope(URL, 'va create va1') == \
+        ((URL, None), 'va create va1')
+
+
+def test_is_mutating():
+    assert not adc_dirty.is_mutating('show slb real; write memory all')
+    assert not adc_dirty.is_mutating(' ; show version')
+    assert adc_dirty.is_mutating('show slb real; slb real disable r1')
+
+
+def test_first_save_always_runs():
+    tracker = adc_dirty.DirtyTracker()
+    assert tracker.begin_save((URL, 'va1'))
+    assert not tracker.begin_save((URL, 'va1'))
+    assert tracker.begin_save((URL, 'va2'))
+    assert tracker.stats() == {'saves': 2, 'skipped': 1, 'dirty': 0}
+
+
+def test_save_after_mutating_command():
+    tracker = adc_dirty.DirtyTracker()
+    tracker.begin_save((URL, 'va1'))
+    tracker.begin_save((URL, None))
+
+    tracker.record(URL, 'va run va1 "show slb real"')
+    assert not tracker.begin_save((URL, 'va1'))
+
+    tracker.record(URL, 'va run va1 "slb real disable r1"')
+    assert tracker.stats()['dirty'] == 1
+    assert not tracker.begin_save((URL, None))
+    assert tracker.begin_save((URL, 'va1'))
+    assert not tracker.begin_save((URL, 'va1'))
+
+
+def test_failed_save_keeps_scope_dirty():
+    tracker = adc_dirty.DirtyTracker()
+    tracker.begin_save((URL, None))
+    tracker.mark((URL, None))
+    assert tracker.begin_save((URL, None))
+    tracker.abort_save((URL, None))
+    assert tracker.begin_save((URL, None))
+    assert tracker.stats() == {'saves': 2, 'skipped': 0, 'dirty': 0}
@@ -0,0 +1,58 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+from arraylbaasv1driver.driver.v1 import adc_dryrun
+
+URL1 = 'https://192.0.2.1:9997/rest/avx'
+URL2 = 'https://192.0.2.2:9997/rest/avx'
+
+
+def _recorder():
+    recorder = adc_dryrun.PlanRecorder()
+    recorder.cli_extend(URL1, 'va run va1 "slb real http rs1 10.0.0.1 80;'
+                              'slb group member g1 rs1 1"')
+    recorder.cli_extend(URL1, 'va run va1 "write memory all"')
+    recorder.cli_extend(URL2, 'va create va1')
+    recorder.rest(URL2, 'POST', '/network/interface/VlanInterface',
+                  [{'name': 'vlan.100'}, {'name': 'vlan.200'}])
+    recorder.neutron('core.create_port', [{'port': {}}])
+    return recorder
+
+
+def test_summary_counts_each_device_and_va():
+    plan = _recorder().summary(request_seconds=0.25, with_requests=False)
+    assert plan == {
+        'round_trips': 4,
+        'commands': 6,
+        'saves': 1,
+        'devices': {
+            '192.0.2.1/va1': {'round_trips': 2, 'commands': 3, 'saves': 1},
+            '192.0.2.2': {'round_trips': 2, 'commands': 3, 'saves': 0},
+        },
+        'neutron_calls': [{'call': 'core.create_port', 'args': ["{'port': {}}"]}],
+        'estimated_seconds': 1.0,
+    }
+
+
+def test_summary_with_requests():
+    recorder = _recorder()
+    plan = recorder.summary()
+    assert 'estimated_seconds' not in plan
+    assert [r['verb'] for r in plan['requests']] == [
+        'batch', 'write memory', 'va create', 'POST VlanInterface']
+    assert plan['requests'][3]['rest']['method'] == 'POST'
+
+    recorder.reset()
+    assert recorder.summary()['round_trips'] == 0
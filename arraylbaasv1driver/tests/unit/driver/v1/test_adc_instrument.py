@@ -0,0 +1,85 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+
+import pytest
+
+from arraylbaasv1driver.driver.v1 import adc_instrument
+from arraylbaasv1driver.driver.v1 import adc_metrics
+
+
+class TraceRecorder(object):
+
+    def __init__(self):
+        self.records = []
+
+    def record(self, op, args, kwargs, start, elapsed, error):
+        self.records.append((op, error is not None))
+
+
+class Driver(object):
+
+    tracer = None
+    metrics = None
+    metrics_exporter = None
+    profiler = None
+
+    def __init__(self):
+        self.trace_recorder = TraceRecorder()
+
+    @adc_instrument.operation
+    def update_pool(self, context, old_pool, pool):
+        self.delete_pool(context, old_pool)
+
+    @adc_instrument.operation
+    def delete_pool(self, context, pool):
+        if pool.get('fail'):
+            raise ValueError(pool['id'])
+
+
+def test_only_outermost_operation_is_recorded():
+    driver = Driver()
+    driver.update_pool(None, {'id': 'p1'}, {'id': 'p1'})
+    driver.delete_pool(None, {'id': 'p1'})
+    assert driver.trace_recorder.records == [('update_pool', False),
+                                             ('delete_pool', False)]
+
+
+def test_failed_operation_is_recorded_with_error():
+    driver = Driver()
+    with pytest.raises(ValueError):
+        driver.update_pool(None, {'id': 'p1', 'fail': True}, {'id': 'p1'})
+    driver.delete_pool(None, {'id': 'p2'})
+    assert driver.trace_recorder.records == [('update_pool', True),
+                                             ('delete_pool', False)]
+
+
+def test_metrics_exporter_is_started_in_each_worker(tmpdir, monkeypatch):
+    driver = Driver()
+    driver.metrics = adc_metrics.Metrics()
+    driver.metrics_exporter = adc_metrics.MetricsExporter(
+        driver.metrics, str(tmpdir.join('metrics-%(pid)s')), interval=3600)
+    # nothing runs in the parent before the workers fork
+    assert driver.metrics_exporter.path == ''
+
+    driver.update_pool(None, {'id': 'p1'}, {'id': 'p1'})
+    exporter = driver.metrics_exporter
+    assert exporter.path == str(tmpdir.join('metrics-%d' % os.getpid()))
+
+    monkeypatch.setattr(os, 'getpid', lambda: 4242)
+    driver.delete_pool(None, {'id': 'p1'})
+    assert exporter.path == str(tmpdir.join('metrics-4242'))
+    exporter.write()
+    assert tmpdir.join('metrics-4242').check()
@@ -0,0 +1,111 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import time
+
+import pytest
+
+from arraylbaasv1driver.driver.v1 import adc_limiter
+
+
+def new_limiter(min_concurrency=1, max_concurrency=8, min_rate=1.0,
+                max_rate=0.0):
+    return adc_limiter.AdaptiveLimiter('192.0.2.1', min_concurrency,
+                                       max_concurrency, min_rate, max_rate,
+                                       1.0)
+
+
+def test_overload_halves_limit_once_per_latency_target():
+    limiter = new_limiter(max_rate=40.0)
+    limiter._release(0.1, True)
+    assert (limiter.limit, limiter.rate) == (4.0, 20.0)
+
+    # the requests sent before the decrease may still fail
+    limiter._release(2.0, False)
+    assert (limiter.limit, limiter.rate) == (4.0, 20.0)
+    assert (limiter.errors, limiter.slow) == (1, 1)
+
+    limiter.last_decrease -= 1.0
+    limiter._release(2.0, False)
+    assert (limiter.limit, limiter.rate) == (2.0, 10.0)
+
+
+def test_success_increases_limit_additively():
+    limiter = new_limiter()
+    limiter._release(0.1, True)
+    assert limiter.limit == 4.0
+    # a whole window of successful calls adds about one to the limit
+    for _ in range(5):
+        limiter._release(0.1, False)
+    assert 5 < limiter.limit < 5.5
+    for _ in range(100):
+        limiter._release(0.1, False)
+    assert limiter.limit == 8
+
+
+def test_no_rate_limit():
+    limiter = new_limiter(max_concurrency=2)
+    start = time.time()
+    for _ in range(20):
+        with limiter.slot():
+            pass
+    assert time.time() - start < 1.0
+    assert limiter.stats()['rate'] == 0
+    assert limiter.stats()['requests'] == 20
+
+    with limiter.slot() as call:
+        call.failed = True
+    assert limiter.stats()['rate'] == 0
+
+
+def test_limit_stays_above_minimum():
+    limiter = new_limiter(min_concurrency=3, min_rate=5.0, max_rate=8.0)
+    for _ in range(5):
+        limiter.last_decrease = 0
+        limiter._release(0.1, True)
+    assert (limiter.limit, limiter.rate) == (3, 5.0)
+
+
+def test_slot_marks_failed_call():
+    limiter = new_limiter()
+    with limiter.slot() as call:
+        assert limiter.inflight == 1
+        call.failed = True
+    assert limiter.limit == 4.0
+
+    with pytest.raises(ValueError):
+        with limiter.slot():
+            raise ValueError()
+    assert limiter.stats()['errors'] == 2
+    assert limiter.stats()['inflight'] == 0
+
+
+def test_latency_from_begin():
+    limiter = adc_limiter.AdaptiveLimiter('192.0.2.1', 1, 8, 1.0, 0, 0.05)
+    with limiter.slot() as call:
+        time.sleep(0.1)
+        call.begin()
+    assert limiter.stats()['slow'] == 0
+    assert limiter.limit == 8
+
+
+def test_limiter_per_host():
+    limiters = adc_limiter.DeviceLimiters(1, 8, 1.0, 0.0, 1.0)
+    first = limiters.get('https://192.0.2.1:9997/rest/apv/cli_extend')
+    assert limiters.get('https://192.0.2.1:9997/rest/apv/other') is first
+    other = limiters.get('https://192.0.2.2:9997/rest/apv/cli_extend')
+    assert other is not first
+
+    with adc_limiter.host_slot(None, 'https://192.0.2.1:9997/rest') as call:
+        assert not call.failed
@@ -0,0 +1,129 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from arraylbaasv1driver.driver.v1 import adc_op_queue
+
+
+class Recorder(object):
+
+    def __init__(self):
+        self.dispatched = []
+        self.cancelled = []
+        self.args = []
+
+    def dispatch(self, obj_type, op, args):
+        self.dispatched.append((obj_type, op, args[-1]['id']))
+        self.args.append(args)
+
+    def cancel(self, obj_type, op, args):
+        self.cancelled.append((obj_type, op, args[-1]['id']))
+
+
+def new_queue(recorder):
+    # the window is long enough that only flush dispatches
+    return adc_op_queue.OperationQueue(60, recorder.dispatch, recorder.cancel,
+                                       lambda: 0)
+
+
+def member(member_id, pool_id, weight=1):
+    return {'id': member_id, 'pool_id': pool_id, 'weight': weight}
+
+
+def test_flush_dispatches_only_the_pool():
+    recorder = Recorder()
+    queue = new_queue(recorder)
+    queue.submit('member', 'm1', 'create', member('m1', 'p1'))
+    queue.submit('member', 'm2', 'create', member('m2', 'p2'))
+    queue.submit('vip', 'v1', 'create', {'id': 'v1', 'pool_id': 'p1'})
+
+    queue.flush('p1')
+    assert recorder.dispatched == [('member', 'create', 'm1'),
+                                   ('vip', 'create', 'v1')]
+    assert list(queue.entries) == [('member', 'm2')]
+
+
+def test_flush_includes_member_moved_from_pool():
+    recorder = Recorder()
+    queue = new_queue(recorder)
+    queue.submit('member', 'm1', 'update', member('m1', 'p1'),
+                 member('m1', 'p2'))
+
+    queue.flush('p1')
+    assert recorder.dispatched == [('member', 'update', 'm1')]
+    assert not queue.entries
+
+
+def test_merge_create_and_updates():
+    recorder = Recorder()
+    queue = new_queue(recorder)
+    queue.submit('member', 'm1', 'create', member('m1', 'p1'))
+    queue.submit('member', 'm1', 'update', member('m1', 'p1'),
+                 member('m1', 'p1', 2))
+    queue.submit('member', 'm1', 'update', member('m1', 'p1', 2),
+                 member('m1', 'p1', 3))
+
+    queue.flush('p1')
+    assert recorder.dispatched == [('member', 'create', 'm1')]
+    assert recorder.args == [(member('m1', 'p1', 3),)]
+    assert queue.saved_ops == 2
+
+
+def test_cancel_create_and_delete():
+    recorder = Recorder()
+    queue = new_queue(recorder)
+    queue.submit('member', 'm1', 'create', member('m1', 'p1'))
+    queue.submit('member', 'm1', 'delete', member('m1', 'p1'))
+
+    assert recorder.cancelled == [('member', 'delete', 'm1')]
+    assert not queue.entries
+    queue.flush('p1')
+    assert not recorder.dispatched
+    assert queue.saved_ops == 2
+
+
+def test_merge_updates_from_first_old_state():
+    recorder = Recorder()
+    queue = new_queue(recorder)
+    queue.submit('member', 'm1', 'update', member('m1', 'p1'),
+                 member('m1', 'p1', 2))
+    queue.submit('member', 'm1', 'update', member('m1', 'p1', 2),
+                 member('m1', 'p1', 3))
+
+    queue.flush('p1')
+    assert recorder.args == [(member('m1', 'p1'), member('m1', 'p1', 3))]
+
+
+def test_merge_update_and_delete():
+    recorder = Recorder()
+    queue = new_queue(recorder)
+    queue.submit('member', 'm1', 'update', member('m1', 'p1'),
+                 member('m1', 'p1', 2))
+    queue.submit('member', 'm1', 'delete', member('m1', 'p1', 2))
+
+    queue.flush('p1')
+    assert recorder.dispatched == [('member', 'delete', 'm1')]
+    assert not recorder.cancelled
+
+
+def test_create_and_move_to_other_pool_not_merged():
+    recorder = Recorder()
+    queue = new_queue(recorder)
+    queue.submit('member', 'm1', 'create', member('m1', 'p1'))
+    queue.submit('member', 'm1', 'update', member('m1', 'p1'),
+                 member('m1', 'p2'))
+
+    queue.flush('p2')
+    assert recorder.dispatched == [('member', 'create', 'm1'),
+                                   ('member', 'update', 'm1')]
+    assert queue.saved_ops == 0
@@ -0,0 +1,129 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from arraylbaasv1driver.driver.v1 import adc_plan
+from arraylbaasv1driver.driver.v1.adc_plan import Command
+
+
+def real(name, action, text=None, requires=()):
+    return Command(text or 'slb real %s %s' % (action, name), 'real', name,
+                   action, requires)
+
+
+def group(name, action, text=None, requires=()):
+    return Command(text or 'slb group %s %s' % (action, name), 'group', name,
+                   action, requires)
+
+
+def optimized(*steps):
+    plan = adc_plan.Plan()
+    for scope, cmd in steps:
+        plan.add(cmd, scope)
+    return [(step.scope, str(step.command)) for step in plan.optimize().steps]
+
+
+def test_dedupe_drops_repeated_command():
+    cmd = real('r1', adc_plan.ACTION_UPDATE)
+    assert optimized(('va1', cmd), ('va1', cmd)) == [('va1', cmd)]
+
+
+def test_dedupe_keeps_command_after_required_change():
+    member = real('r1', adc_plan.ACTION_UPDATE, requires=[('group', 'g1')])
+    steps = optimized(('va1', member),
+                      ('va1', group('g1', adc_plan.ACTION_UPDATE)),
+                      ('va1', member))
+    assert len(steps) == 3
+
+
+def test_dedupe_stops_at_barrier():
+    cmd = real('r1', adc_plan.ACTION_UPDATE)
+    steps = optimized(('va1', cmd), ('va1', Command('write memory')),
+                      ('va1', cmd))
+    assert len(steps) == 3
+
+
+def test_cancel_create_and_delete():
+    steps = optimized(('va1', real('r1', adc_plan.ACTION_CREATE)),
+                      ('va1', real('r2', adc_plan.ACTION_CREATE)),
+                      ('va1', real('r1', adc_plan.ACTION_DELETE)))
+    assert steps == [('va1', 'slb real create r2')]
+
+
+def test_cancel_keeps_used_object():
+    member = group('g1', adc_plan.ACTION_UPDATE, 'slb group member g1 r1',
+                   requires=[('real', 'r1')])
+    steps = optimized(('va1', real('r1', adc_plan.ACTION_CREATE)),
+                      ('va1', member),
+                      ('va1', real('r1', adc_plan.ACTION_DELETE)))
+    assert len(steps) == 3
+
+
+def test_cancel_stops_at_barrier():
+    steps = optimized(('va1', real('r1', adc_plan.ACTION_CREATE)),
+                      ('va1', Command('write memory')),
+                      ('va1', real('r1', adc_plan.ACTION_DELETE)))
+    assert len(steps) == 3
+
+
+def test_reorder_groups_scopes():
+    steps = optimized(('va1', real('r1', adc_plan.ACTION_CREATE)),
+                      ('va2', real('r2', adc_plan.ACTION_CREATE)),
+                      ('va1', real('r3', adc_plan.ACTION_CREATE)),
+                      ('va2', real('r4', adc_plan.ACTION_CREATE)))
+    assert [scope for scope, _ in steps] == ['va1', 'va1', 'va2', 'va2']
+
+
+def test_reorder_keeps_dependencies():
+    member = group('g1', adc_plan.ACTION_UPDATE, 'slb group member g1 r1',
+                   requires=[('real', 'r1')])
+    steps = optimized(('va1', group('g1', adc_plan.ACTION_CREATE)),
+                      ('va2', real('r2', adc_plan.ACTION_CREATE)),
+                      ('va1', real('r1', adc_plan.ACTION_UPDATE)),
+                      ('va1', member),
+                      ('va1', real('r1', adc_plan.ACTION_DELETE)))
+    assert steps == [('va1', 'slb group create g1'),
+                     ('va1', 'slb real update r1'),
+                     ('va1', 'slb group member g1 r1'),
+                     ('va1', 'slb real delete r1'),
+                     ('va2', 'slb real create r2')]
+
+
+def test_reorder_does_not_cross_barrier():
+    steps = optimized(('va1', real('r1', adc_plan.ACTION_CREATE)),
+                      ('va2', real('r2', adc_plan.ACTION_CREATE)),
+                      ('va2', Command('write memory')),
+                      ('va1', real('r3', adc_plan.ACTION_CREATE)))
+    assert steps == [('va1', 'slb real create r1'),
+                     ('va2', 'slb real create r2'),
+                     ('va2', 'write memory'),
+                     ('va1', 'slb real create r3')]
+
+
+def test_batches_split_by_scope_and_size():
+    plan = adc_plan.Plan()
+    plan.extend(['slb real create r1',
+                 'slb real create r2; slb real enable r2',
+                 'slb real create r3'], 'va1')
+    plan.add('slb real create r4', 'va2')
+    assert list(plan.batches(2)) == [
+        ('va1', ['slb real create r1']),
+        ('va1', ['slb real create r2; slb real enable r2']),
+        ('va1', ['slb real create r3']),
+        ('va2', ['slb real create r4'])]
+
+
+def test_stream_batches():
+    cmds = iter(['a', '', 'b; c', 'd', 'e'])
+    assert list(adc_plan.stream_batches(cmds, 3)) == [['a', 'b; c'],
+                                                      ['d', 'e']]
@@ -0,0 +1,87 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import itertools
+
+import pytest
+
+from neutron.common import exceptions as n_exc
+
+from arraylbaasv1driver.driver.v1 import adc_port_pool
+# registers the options of the port pool
+from arraylbaasv1driver.driver.v1 import device_driver  # noqa
+
+
+SUBNET = {'id': 'subnet-1', 'network_id': 'net-1', 'tenant_id': 'admin'}
+
+
+class FakeCorePlugin(object):
+
+    def __init__(self):
+        self.ports = {}
+        self.deleted_subnets = set()
+        self.ids = itertools.count(1)
+
+    def create_port(self, context, body):
+        port = dict(body['port'])
+        subnet_id = port['fixed_ips'][0]['subnet_id']
+        if subnet_id in self.deleted_subnets:
+            raise n_exc.SubnetNotFound(id=subnet_id)
+        port['id'] = 'port-%d' % next(self.ids)
+        port['fixed_ips'] = [{'subnet_id': subnet_id}]
+        self.ports[port['id']] = port
+        return port
+
+    def delete_port(self, context, port_id):
+        self.ports.pop(port_id, None)
+
+
+class FakePlugin(object):
+
+    def __init__(self):
+        self._core_plugin = FakeCorePlugin()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(adc_port_pool.InterfacePortPool, '_start', lambda self: None)
+    monkeypatch.setattr(adc_port_pool.time, 'sleep', lambda seconds: None)
+    port_pool = adc_port_pool.InterfacePortPool(FakePlugin(), 'ArrayAPV')
+    port_pool.low_water = 1
+    port_pool.high_water = 2
+    return port_pool
+
+
+def test_ports_are_pooled_for_each_tenant(pool):
+    assert pool.claim(None, 'tenant-a', SUBNET, 2) == []
+    assert pool.claim(None, 'tenant-b', SUBNET, 2) == []
+    pool._refill(None)
+
+    ports = pool.claim(None, 'tenant-a', SUBNET, 2)
+    assert [port['tenant_id'] for port in ports] == ['tenant-a', 'tenant-a']
+    ports = pool.claim(None, 'tenant-b', SUBNET, 1)
+    assert [port['tenant_id'] for port in ports] == ['tenant-b']
+
+
+def test_deleted_subnet_is_dropped(pool):
+    pool.claim(None, 'tenant-a', SUBNET, 1)
+    pool._refill(None)
+    core_plugin = pool.core_plugin
+    assert len(core_plugin.ports) == 2
+
+    pool.claim(None, 'tenant-a', SUBNET, 2)
+    core_plugin.deleted_subnets.add(SUBNET['id'])
+    pool._refill(None)
+    assert not pool.subnets
+    assert not pool.ports
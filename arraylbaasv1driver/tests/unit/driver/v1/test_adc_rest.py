@@ -0,0 +1,29 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import pytest
+
+from arraylbaasv1driver.driver.v1 import adc_rest
+from arraylbaasv1driver.driver.v1.exceptions import ArrayADCException
+
+
+def test_parse_types():
+    assert adc_rest.parse_types(' vlan, ') == set([adc_rest.TYPE_VLAN])
+    assert adc_rest.parse_types('') == set()
+
+
+@pytest.mark.parametrize('value', ['real', 'vlan,member'])
+def test_unverified_types_are_rejected(value):
+    with pytest.raises(ArrayADCException):
+        adc_rest.parse_types(value)
@@ -0,0 +1,108 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import json
+
+import pytest
+
+from arraylbaasv1driver.driver.v1 import adc_resync
+from arraylbaasv1driver.driver.v1.exceptions import ArrayADCException
+
+URL = 'https://192.0.2.1:9997/rest/avx'
+
+
+class Client(object):
+
+    share_real_servers = False
+    share_health_monitors = False
+    request_count = 0
+
+    def __init__(self):
+        self.only_urls = set([URL])
+        self.saves = []
+
+    def resync_scope(self, pool_id):
+        return 'va1'
+
+    def get_cached_map(self, argu):
+        return {}
+
+    def write_memory(self, argu):
+        self.saves.append(argu['pool_id'])
+
+
+class Plugin(object):
+
+    def __init__(self, count):
+        self.pools = [{'id': 'p%d' % i, 'tenant_id': 't1', 'vip_id': 'v%d' % i,
+                       'members': []} for i in range(1, count + 1)]
+
+    def get_pools(self, context):
+        return self.pools
+
+    def get_vip(self, context, vip_id):
+        return {'id': vip_id, 'pool_id': 'p' + vip_id[1:]}
+
+
+class Driver(object):
+
+    def __init__(self, count, failing=()):
+        self.client = Client()
+        self.plugin = Plugin(count)
+        self.failing = set(failing)
+        self.pushed = []
+
+    def vlan_of(self, context, vip):
+        return 100
+
+    def resync_vip(self, context, vip, interface_map=None):
+        self.pushed.append((vip['pool_id'], bool(self.client.only_urls)))
+        if vip['pool_id'] in self.failing:
+            raise ArrayADCException(vip['pool_id'])
+
+
+def _resync(driver, path):
+    return adc_resync.DeviceResync(driver, '192.0.2.1', va_name='va1',
+                                   checkpoint=path, checkpoint_interval=1)
+
+
+def test_checkpoint_of_another_target_is_refused(tmpdir):
+    path = str(tmpdir.join('checkpoint'))
+    adc_resync.Checkpoint(path, '192.0.2.1/va1').save(set(['p1']))
+    assert adc_resync.Checkpoint(path, '192.0.2.1/va1').load() == set(['p1'])
+    with pytest.raises(ArrayADCException):
+        adc_resync.Checkpoint(path, '192.0.2.2/va1').load()
+
+
+def test_failed_pool_is_pushed_by_next_run(tmpdir):
+    path = str(tmpdir.join('checkpoint'))
+    driver = Driver(3, failing=['p2'])
+    summary = _resync(driver, path).run(None)
+    assert summary['pools'] == 3
+    assert list(summary['failed']) == ['p2']
+    assert driver.client.saves == ['p1', 'p3']
+    with open(path) as f:
+        assert json.load(f)['done'] == ['p1', 'p3']
+
+    driver.failing = set()
+    driver.pushed = []
+    driver.client.saves = []
+    summary = _resync(driver, path).run(None)
+    assert (summary['resumed'], summary['pools'], summary['failed']) == (2, 1, {})
+    # the pools done before are only restored in the mapping
+    assert driver.pushed == [('p1', False), ('p3', False), ('p2', True)]
+    assert driver.client.saves == ['p2']
+    assert driver.client.only_urls == set([URL])
+    assert not tmpdir.join('checkpoint').check()
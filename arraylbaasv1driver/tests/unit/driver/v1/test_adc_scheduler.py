@@ -0,0 +1,79 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import collections
+
+from arraylbaasv1driver.driver.v1 import adc_scheduler
+from arraylbaasv1driver.driver.v1.adc_scheduler import LANE_NORMAL, LANE_PRIORITY
+
+
+def enqueue(scheduler, requests):
+    """ Queue the waiters of (name, tenant_id, lane) without blocking """
+    waiters = []
+    for name, tenant_id, lane in requests:
+        waiter = adc_scheduler._Waiter(1)
+        scheduler.lanes[lane].setdefault(tenant_id, collections.deque()).append(waiter)
+        waiters.append((name, waiter))
+    return waiters
+
+
+def grant_order(scheduler, waiters):
+    """ Free the slots one by one and return the names in granted order """
+    order = []
+    for _ in waiters:
+        scheduler._release()
+        for name, waiter in waiters:
+            if waiter.granted and name not in order:
+                order.append(name)
+    return order
+
+
+def test_tenants_are_served_in_turn():
+    scheduler = adc_scheduler.FairScheduler(0)
+    waiters = enqueue(scheduler, [('a1', 'a', LANE_NORMAL), ('a2', 'a', LANE_NORMAL),
+                                  ('a3', 'a', LANE_NORMAL), ('b1', 'b', LANE_NORMAL),
+                                  ('b2', 'b', LANE_NORMAL)])
+    assert grant_order(scheduler, waiters) == ['a1', 'b1', 'a2', 'b2', 'a3']
+
+
+def test_tenant_weight():
+    scheduler = adc_scheduler.FairScheduler(0, weights={'a': 2})
+    waiters = enqueue(scheduler, [('a1', 'a', LANE_NORMAL), ('a2', 'a', LANE_NORMAL),
+                                  ('a3', 'a', LANE_NORMAL), ('a4', 'a', LANE_NORMAL),
+                                  ('b1', 'b', LANE_NORMAL), ('b2', 'b', LANE_NORMAL)])
+    assert grant_order(scheduler, waiters) == ['a1', 'a2', 'b1', 'a3', 'a4', 'b2']
+
+
+def test_priority_lane_yields_after_ratio():
+    scheduler = adc_scheduler.FairScheduler(0, priority_ratio=2)
+    waiters = enqueue(scheduler, [('n1', 'a', LANE_NORMAL), ('n2', 'a', LANE_NORMAL),
+                                  ('p1', 'b', LANE_PRIORITY), ('p2', 'b', LANE_PRIORITY),
+                                  ('p3', 'b', LANE_PRIORITY)])
+    assert grant_order(scheduler, waiters) == ['p1', 'p2', 'n1', 'p3', 'n2']
+
+
+def test_slot_uses_tenant_of_operation():
+    scheduler = adc_scheduler.FairScheduler(1)
+    with adc_scheduler.tenant_context('a', LANE_NORMAL):
+        with adc_scheduler.tenant_context('b', LANE_PRIORITY):
+            assert adc_scheduler.current_tenant() == ('a', LANE_NORMAL)
+        with scheduler.slot():
+            assert scheduler.available == 0
+    assert scheduler.available == 1
+    assert scheduler.metrics['a']['device_call']['count'] == 1
+    assert adc_scheduler.current_tenant() == (adc_scheduler.DEFAULT_TENANT, LANE_NORMAL)
+
+
+def test_parse_weights():
+    assert adc_scheduler.parse_weights(' a:3, b:0,bad,') == {'a': 3, 'b': 1}
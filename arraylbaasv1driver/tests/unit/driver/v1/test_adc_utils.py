@@ -0,0 +1,68 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+from arraylbaasv1driver.driver.v1 import adc_utils
+
+
+class FakeTargets(object):
+    """ Targets applying the commands in order until one fails """
+    def __init__(self, failing=()):
+        self.applied = {}
+        self.failing = set(failing)
+        self.runs = []
+
+    def run(self, target, scope, cmds):
+        self.runs.append((target, list(cmds)))
+        for cmd in cmds:
+            if (target, cmd) in self.failing:
+                raise ValueError(cmd)
+            self.applied.setdefault(target, []).append(cmd)
+
+    def applied_on(self, target, scope):
+        return lambda cmd: cmd in self.applied.get(target, [])
+
+
+def _items(count):
+    return [('m%d' % i, None, ['real r%d' % i, 'member r%d' % i]) for i in range(count)]
+
+
+def test_batches_of_scope_and_size():
+    targets = FakeTargets()
+    items = _items(3) + [('m9', 'va', ['real r9'])]
+    failures = adc_utils.run_in_batches(items, 4, targets.run, ['h1'], targets.applied_on)
+    assert failures == {}
+    assert [len(cmds) for _, cmds in targets.runs] == [4, 2, 1]
+
+
+def test_failed_batch_retries_only_what_is_not_applied():
+    targets = FakeTargets(failing=[('h2', 'member r1')])
+    failures = adc_utils.run_in_batches(_items(3), 10, targets.run, ['h1', 'h2'],
+                                        targets.applied_on)
+    assert list(failures) == ['m1']
+    # h1 took the whole batch once, h2 got the commands after the failed one
+    assert [target for target, _ in targets.runs] == ['h1', 'h2', 'h2', 'h2']
+    assert targets.runs[2:] == [('h2', ['member r1']), ('h2', ['real r2', 'member r2'])]
+    assert sorted(targets.applied['h1']) == sorted(targets.applied['h2'] + ['member r1'])
+
+
+def test_unknown_state_retries_all_commands():
+    targets = FakeTargets(failing=[('h1', 'member r1')])
+
+    def applied_on(target, scope):
+        raise IOError("timed out")
+    failures = adc_utils.run_in_batches(_items(2), 10, targets.run, ['h1'], applied_on)
+    assert list(failures) == ['m1']
+    assert targets.runs[1:] == [('h1', ['real r0', 'member r0']),
+                                ('h1', ['real r1', 'member r1'])]
@@ -0,0 +1,229 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import threading
+import time
+
+import pytest
+
+from arraylbaasv1driver.driver.v1 import adc_dirty
+from arraylbaasv1driver.driver.v1 import adc_limiter
+from arraylbaasv1driver.driver.v1 import adc_scheduler
+from arraylbaasv1driver.driver.v1 import apv_driver
+from arraylbaasv1driver.driver.v1.adc_cache import SLB_SCOPE
+from arraylbaasv1driver.driver.v1.adc_device import ADCDevice
+from arraylbaasv1driver.driver.v1.apv_driver import ArrayAPVAPIDriver
+from arraylbaasv1driver.driver.v1.exceptions import ArrayADCException
+from arraylbaasv1driver.tests.unit.driver.v1.fakes import CommandRecorder
+from arraylbaasv1driver.tests.unit.driver.v1.fakes import FakeResponse
+
+
+def _client(hosts):
+    client = ArrayAPVAPIDriver(hosts, 'port2', 'user', 'password')
+    client.recorder = CommandRecorder()
+    return client
+
+
+def _vip_argu(hosts, index):
+    return {
+        'tenant_id': 'tenant',
+        'pool_id': 'pool-%d' % index,
+        'vip_id': 'vip-%d' % index,
+        'vlan_tag': '100',
+        'vip_address': '10.0.0.%d' % (10 + index),
+        'netmask': '255.255.255.0',
+        'interface_mapping': dict(
+            (host, {'address': '10.0.0.%d' % (100 + 10 * index + i),
+                    'port_id': 'port-%d-%d' % (index, i)})
+            for i, host in enumerate(hosts)),
+        'vip_port_mac': None,
+        'protocol': 'HTTP',
+        'protocol_port': 80,
+        'connection_limit': -1,
+        'lb_algorithm': 'ROUND_ROBIN',
+        'session_persistence_type': None,
+        'cookie_name': None,
+    }
+
+
+def _ip_cmds(client):
+    cmds = [cmd for _, cmd in client.recorder.cmds
+            if not isinstance(cmd, tuple) and 'ip address' in cmd]
+    del client.recorder.cmds[:]
+    return [cmd.strip() for cmd in cmds]
+
+
+def test_interface_takes_address_of_next_vip():
+    client = _client(['192.0.2.1'])
+    first, second = _vip_argu(client.hostnames, 1), _vip_argu(client.hostnames, 2)
+    client.allocate_vip(first)
+    client.allocate_vip(second)
+    assert _ip_cmds(client) == ['ip address vlan.100 10.0.0.11 255.255.255.0']
+
+    client.deallocate_vip(first, True)
+    assert _ip_cmds(client) == ['ip address vlan.100 10.0.0.12 255.255.255.0']
+
+    client.deallocate_vip(second, True)
+    assert _ip_cmds(client) == ['no ip address vlan.100']
+
+
+def test_interface_takes_port_address_of_next_vip_on_each_host():
+    client = _client(['192.0.2.1', '192.0.2.2'])
+    first, second = _vip_argu(client.hostnames, 1), _vip_argu(client.hostnames, 2)
+    client.allocate_vip(first)
+    client.allocate_vip(second)
+    del client.recorder.cmds[:]
+
+    client.deallocate_vip(second, True)
+    assert _ip_cmds(client) == []
+    assert client.get_cached_map(second) is None
+
+    client.allocate_vip(second)
+    del client.recorder.cmds[:]
+    client.deallocate_vip(first, True)
+    assert _ip_cmds(client) == ['ip address vlan.100 10.0.0.120 255.255.255.0',
+                                'ip address vlan.100 10.0.0.121 255.255.255.0']
+    assert client.cache.ref_owner('192.0.2.1', 'ip.vlan.100') == (
+        'vip-2', ['10.0.0.120', '255.255.255.0'])
+
+
+def _port(port_id, index, subnet_id, address):
+    return {'id': port_id, 'name': '_lb-port-%d-%s' % (index, subnet_id),
+            'fixed_ips': [{'subnet_id': subnet_id, 'ip_address': address}]}
+
+
+def _running(address, virtuals):
+    lines = ['vlan port2 vlan.100 100',
+             'ip address vlan.100 %s 255.255.255.0' % address]
+    lines += ['slb virtual http %s %s 80' % virtual for virtual in virtuals]
+    return '\n'.join(lines)
+
+
+def _vip(subnet_id='subnet-1', vlan_tag=100):
+    return {'vlan_tag': vlan_tag, 'subnet_id': subnet_id,
+            'netmask': '255.255.255.0'}
+
+
+def test_rebuild_ports_of_every_vip_on_each_host():
+    client = _client(['192.0.2.1', '192.0.2.2'])
+    virtuals = [('vip-1', '10.0.0.11'), ('vip-2', '10.0.0.12')]
+    configs = {'192.0.2.1': _running('10.0.0.120', virtuals),
+               '192.0.2.2': _running('10.0.0.121', virtuals)}
+    client._show_running = configs.get
+    ports = [_port('port-1-0', 0, 'subnet-1', '10.0.0.110'),
+             _port('port-1-1', 1, 'subnet-1', '10.0.0.111'),
+             _port('port-2-0', 0, 'subnet-1', '10.0.0.120'),
+             _port('port-2-1', 1, 'subnet-1', '10.0.0.121')]
+
+    mapping = client.rebuild_cache(
+        ports, {'vip-1': _vip(), 'vip-2': _vip()}, (), 2)
+    # the port configured on the interface belongs to its first holder
+    assert mapping == {
+        'vip-1': {'192.0.2.1': 'port-2-0', '192.0.2.2': 'port-2-1'},
+        'vip-2': {'192.0.2.1': 'port-1-0', '192.0.2.2': 'port-1-1'}}
+    assert client.cache.refs['192.0.2.1'] == {
+        'ip.vlan.100': ['vip-1', 'vip-2'], 'vlan.100': ['vip-1', 'vip-2']}
+
+    client.deallocate_vip(_vip_argu(client.hostnames, 1), True)
+    assert _ip_cmds(client) == ['ip address vlan.100 10.0.0.110 255.255.255.0',
+                                'ip address vlan.100 10.0.0.111 255.255.255.0']
+    assert client.get_cached_map({'vip_id': 'vip-2'}) == {
+        '192.0.2.1': 'port-1-0', '192.0.2.2': 'port-1-1'}
+
+
+def test_rebuild_vip_out_of_interface_subnet():
+    client = _client(['192.0.2.1'])
+    virtuals = [('vip-1', '10.0.0.11'), ('vip-2', '10.1.0.5')]
+    client._show_running = {'192.0.2.1': _running('10.0.0.11', virtuals)}.get
+
+    client.rebuild_cache([], {'vip-1': _vip(),
+                              'vip-2': _vip('subnet-2')}, (), 1)
+    assert client.cache.ref_owner('192.0.2.1', 'ip.vlan.100') == (
+        'vip-1', ['10.0.0.11', '255.255.255.0'])
+
+    client.deallocate_vip(_vip_argu(client.hostnames, 1), True)
+    cmds = [str(cmd) for _, cmd in client.recorder.cmds]
+    assert not [cmd for cmd in cmds if 'no vlan' in cmd]
+    assert _ip_cmds(client) == ['ip address vlan.100 10.1.0.5 255.255.255.0']
+
+
+def test_rebuild_shared_real_server_refs():
+    client = _client(['192.0.2.1'])
+    client.share_real_servers = True
+    rs_name = ADCDevice.shared_real_server_name('HTTP', '10.2.0.5', 80)
+    running = '\n'.join([
+        _running('10.0.0.11', [('vip-1', '10.0.0.11')]),
+        'slb real HTTP %s 10.2.0.5 80 65535 none' % rs_name,
+        'slb group member pool-1 %s 1' % rs_name,
+        'slb group member pool-2 %s 1' % rs_name])
+    client._show_running = {'192.0.2.1': running}.get
+    members = [{'member_id': 'member-%d' % i, 'pool_id': 'pool-%d' % i,
+                'protocol': 'HTTP', 'member_address': '10.2.0.5',
+                'member_port': 80} for i in (1, 2, 3)]
+
+    client.rebuild_cache([], {'vip-1': _vip()}, members, 1)
+    assert client.cache.refs[SLB_SCOPE] == {
+        'real.' + rs_name: ['member-1', 'member-2']}
+
+    client.delete_member(dict(members[0], member_weight=1))
+    assert [cmd for _, cmd in client.recorder.cmds] == [
+        'no slb group member pool-1 %s' % rs_name]
+
+
+@pytest.mark.parametrize('status_code', [200, 500])
+def test_change_during_save_stays_dirty(monkeypatch, status_code):
+    client = ArrayAPVAPIDriver(['192.0.2.1'], 'port2', 'user', 'password')
+    client.dirty = adc_dirty.DirtyTracker()
+    scope = (client.base_rest_urls[0], None)
+    client.dirty.begin_save(scope)
+
+    def post(url, data, **kwargs):
+        # a write memory runs while the request waits for its slot
+        assert not client.dirty.begin_save(scope)
+        return FakeResponse(status_code)
+    monkeypatch.setattr(apv_driver.requests, 'post', post)
+
+    try:
+        client.run_cli_extend(scope[0], 'slb real enable r1')
+    except ArrayADCException:
+        assert status_code != 200
+    assert client.dirty.begin_save(scope)
+
+
+def test_waiting_on_device_limit_holds_no_scheduler_slot(monkeypatch):
+    client = ArrayAPVAPIDriver(['192.0.2.1', '192.0.2.2'], 'port2', 'user',
+                               'password')
+    client.scheduler = adc_scheduler.FairScheduler(1)
+    client.limiters = adc_limiter.DeviceLimiters(1, 1, 1.0, 0, 1.0)
+    monkeypatch.setattr(apv_driver.requests, 'post',
+                        lambda url, data, **kwargs: FakeResponse())
+    slow_url, other_url = client.base_rest_urls
+
+    def run(url):
+        thread = threading.Thread(target=client.run_cli_extend,
+                                  args=(url, 'show version'))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    with client.limiters.get(slow_url).slot():
+        waiting = run(slow_url)
+        time.sleep(0.1)
+        other = run(other_url)
+        other.join(2)
+        assert not other.is_alive()
+        assert waiting.is_alive()
+    waiting.join(2)
+    assert not waiting.is_alive()
@@ -0,0 +1,69 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+from arraylbaasv1driver.driver.v1.avx_driver import ArrayAVXAPIDriver
+from arraylbaasv1driver.tests.unit.driver.v1.fakes import CommandRecorder
+
+HOSTS = ['192.0.2.1', '192.0.2.2']
+
+
+def _client():
+    client = ArrayAVXAPIDriver(HOSTS, 'port2', 'user', 'password')
+    client.recorder = CommandRecorder()
+    return client
+
+
+def _vip_argu(pool_id, vip_id):
+    return {
+        'tenant_id': 'tenant',
+        'pool_id': pool_id,
+        'vip_id': vip_id,
+        'vlan_tag': '100',
+        'vip_address': '10.0.0.10',
+        'netmask': '255.255.255.0',
+        'gateway_ip': '10.0.0.1',
+        'interface_mapping': dict(
+            (host, {'address': '10.0.0.%d' % (20 + i), 'port_id': 'port-%d' % i})
+            for i, host in enumerate(HOSTS)),
+        'vip_port_mac': None,
+        'protocol': 'HTTP',
+        'protocol_port': 80,
+        'connection_limit': -1,
+        'lb_algorithm': 'ROUND_ROBIN',
+        'session_persistence_type': None,
+        'cookie_name': None,
+    }
+
+
+def test_deleted_vip_returns_va_to_pool():
+    client = _client()
+    va_count = len(client.cache.va_pools)
+
+    argu = _vip_argu('pool-1', 'vip-1')
+    client.allocate_vip(argu)
+    va_name = client.cache.find_va_by_pool('pool-1')
+    assert client.get_cached_map(argu) == {HOSTS[0]: 'port-0', HOSTS[1]: 'port-1'}
+    assert len(client.cache.va_pools) == va_count - 1
+
+    client.deallocate_vip(argu)
+    assert client.cache.find_va_by_pool('pool-1') is None
+    assert client.get_cached_map(argu) is None
+    assert len(client.cache.va_pools) == va_count
+    assert va_name not in client.cache.refs
+
+    argu = _vip_argu('pool-2', 'vip-2')
+    client.allocate_vip(argu)
+    assert client.cache.find_va_by_pool('pool-2') is not None
+    assert len(client.cache.va_pools) == va_count - 1
@@ -0,0 +1,42 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import pytest
+
+from arraylbaasv1driver.driver.v1 import adc_cache
+from arraylbaasv1driver.tools import bench
+from arraylbaasv1driver.tools import budget
+
+
+@pytest.fixture
+def options(monkeypatch):
+    """ Clear the options and the mapping files set by the scenarios """
+    monkeypatch.setattr(adc_cache, 'TENANT_APV_MAPPING', adc_cache.TENANT_APV_MAPPING)
+    monkeypatch.setattr(adc_cache, 'TENANT_AVX_MAPPING', adc_cache.TENANT_AVX_MAPPING)
+    yield
+    for name in list(bench.BASE_OPTIONS) + ['array_management_ip',
+                                            'array_device_driver']:
+        bench.cfg.CONF.clear_override(name, group='arraynetworks')
+
+
+def test_scenarios_are_within_budget(options):
+    budgets = budget.load_budgets()
+    keys = []
+    for key, usage, calls, error in budget.run_scenarios('apv', 1):
+        assert error is None, key
+        over, under = budget.check(key, usage, budgets.get(key))
+        assert over == []
+        keys.append(key)
+    assert keys == ['apv/1/%s' % scenario for scenario in budget.SCENARIOS]
@@ -0,0 +1,424 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Benchmark the operations of ArrayADCDriver end to end, with the fake
+Neutron plugin and fake devices started in a separate process:
+
+    python -m arraylbaasv1driver.tools.bench --sizes 10,100,1000,10000 \\
+        --hosts 1,2 --products apv,avx --latency 0.005 --output bench.jsonl
+
+Every scenario writes one JSON line with its wall time, device round
+trips, bytes sent to the devices and peak memory. A previous output can
+be compared with the current run by --compare.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from arraylbaasv1driver.driver.v1 import adc_cache
+from arraylbaasv1driver.driver.v1 import device_driver
+from arraylbaasv1driver.tools import fake_adc
+from arraylbaasv1driver.tools import fake_neutron
+
+LOG = logging.getLogger(__name__)
+
+cfg = device_driver.cfg
+
+PRODUCTS = {
+    'apv': 'arraylbaasv1driver.driver.v1.apv_driver.ArrayAPVAPIDriver',
+    'avx': 'arraylbaasv1driver.driver.v1.avx_driver.ArrayAVXAPIDriver',
+}
+ADDRESSES = ['127.0.0.2', '127.0.0.3']
+SCENARIOS = ('create_vip', 'update_vip', 'member_churn', 'hm_churn',
+             'delete_vip', 'delete_pool')
+# The operations on one object, which run between create_vip and
+# delete_vip, the delete follows its create
+SINGLE_SCENARIOS = ('create_member', 'update_member', 'delete_member',
+                    'create_health_monitor', 'delete_health_monitor')
+TENANT_ID = 'bench-tenant'
+HEALTH_MONITORS = 1
+HM_CHURN = 5
+
+# The options of the driver set for every run, --set overrides them
+BASE_OPTIONS = {
+    'array_api_user': 'bench',
+    'array_api_password': 'bench',
+    'array_interfaces': 'port2',
+    'array_op_queue_window': 0,
+    'array_member_weight_coalesce_window': 0,
+    'array_port_pool_high_water': 0,
+    'array_rebuild_mapping': False,
+    'array_request_vlan_hostname': fake_neutron.BINDING_HOST,
+    'array_request_vlan_max_retries': 1,
+}
+
+
+class FakeDeviceProcess(object):
+    """ The fake devices served by another process, so that they take
+        neither the memory nor the GIL of the driver
+    """
+    def __init__(self, hosts, options):
+        self.hosts = hosts
+        self.options = options
+        self.process = None
+
+    def _url(self, host, path):
+        return "https://%s:%d%s" % (host, fake_adc.DEFAULT_PORT, path)
+
+    def start(self, timeout=30):
+        cmd = [sys.executable, '-m', 'arraylbaasv1driver.tools.fake_adc',
+               '--hosts', ','.join(self.hosts)] + self.options
+        self.process = subprocess.Popen(cmd)
+        deadline = time.time() + timeout
+        while True:
+            try:
+                self.stats()
+                return self
+            except requests.RequestException:
+                if self.process.poll() is not None or time.time() > deadline:
+                    self.stop()
+                    raise RuntimeError("The fake devices didn't start: %s" % cmd)
+                time.sleep(0.2)
+
+    def stats(self):
+        """ The sum of the counters of all hosts """
+        total = {}
+        for host in self.hosts:
+            r = requests.get(self._url(host, '/_fake/stats'), verify=False)
+            for name, value in r.json().items():
+                if name == 'peak_concurrency':
+                    total[name] = max(total.get(name, 0), value)
+                else:
+                    total[name] = total.get(name, 0) + value
+        return total
+
+    def reset(self):
+        for host in self.hosts:
+            requests.post(self._url(host, '/_fake/reset'), verify=False)
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+        self.process = None
+
+
+class Bench(object):
+    """ One pool with a VIP driven through the scenarios """
+
+    def __init__(self, driver, plugin, size):
+        self.driver = driver
+        self.plugin = plugin
+        self.size = size
+        self.context = plugin.context(TENANT_ID)
+        self.pool = plugin.add_pool(TENANT_ID, members=size,
+                                    health_monitors=HEALTH_MONITORS)
+        self.vip = plugin.add_vip(self.pool)
+
+    def create_vip(self):
+        self.driver.create_vip(self.context, self.vip)
+
+    def update_vip(self):
+        vip = dict(self.vip, connection_limit=self.vip['connection_limit'] + 1000)
+        self.driver.update_vip(self.context, self.vip, vip)
+        self.plugin.vips[vip['id']] = vip
+        self.vip = vip
+
+    def create_member(self):
+        self.member = self.plugin.add_members(self.pool, 1)[0]
+        self.driver.create_member(self.context, self.member)
+
+    def update_member(self):
+        member = dict(self.member, weight=self.member['weight'] + 1)
+        self.driver.update_member(self.context, self.member, member)
+        self.member = member
+
+    def delete_member(self):
+        self.driver.delete_member(self.context, self.member)
+
+    def create_health_monitor(self):
+        self.hm = self.plugin.add_health_monitor(TENANT_ID, delay=30)
+        self.plugin.attach_health_monitor(self.pool, self.hm)
+        self.driver.create_pool_health_monitor(self.context, self.hm, self.pool['id'])
+
+    def delete_health_monitor(self):
+        self.driver.delete_pool_health_monitor(self.context, self.hm, self.pool['id'])
+
+    def member_churn(self):
+        members = self.plugin.add_members(self.pool, max(1, self.size // 10))
+        self.driver.create_members(self.context, members)
+        updated = [dict(member, weight=member['weight'] + 1) for member in members]
+        self.driver.update_members(self.context, list(zip(members, updated)))
+        self.driver.delete_members(self.context, updated)
+
+    def hm_churn(self):
+        hms = []
+        for i in range(HM_CHURN):
+            hm = self.plugin.add_health_monitor(TENANT_ID, delay=10 + i)
+            self.plugin.attach_health_monitor(self.pool, hm)
+            self.driver.create_pool_health_monitor(self.context, hm, self.pool['id'])
+            hms.append(hm)
+        for hm in hms:
+            self.driver.delete_pool_health_monitor(self.context, hm, self.pool['id'])
+
+    def delete_vip(self):
+        self.driver.delete_vip(self.context, self.vip)
+
+    def delete_pool(self):
+        self.driver.delete_pool(self.context, self.plugin.get_pool(self.context,
+                                                                   self.pool['id']))
+
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _set_options(options):
+    for name, value in options.items():
+        cfg.CONF.set_override(name, value, group='arraynetworks')
+
+
+def parse_overrides(values):
+    """ Parse OPTION=VALUE, the values of IntOpt and FloatOpt are converted
+        since set_override doesn't
+    """
+    numeric = {}
+    for opt in (device_driver.OPTS + device_driver.DB_OPTS +
+                device_driver.PORT_POOL_OPTS):
+        if isinstance(opt, cfg.IntOpt):
+            numeric[opt.name] = int
+        elif isinstance(opt, cfg.FloatOpt):
+            numeric[opt.name] = float
+    options = {}
+    for value in values or []:
+        name, _, option = value.partition('=')
+        name = name.strip()
+        if option.lower() in ('true', 'false'):
+            option = option.lower() == 'true'
+        elif name in numeric:
+            option = numeric[name](option)
+        options[name] = option
+    return options
+
+
+def new_driver(product, addresses, overrides, mapping_prefix):
+    """ Return (driver, plugin) of a new ArrayADCDriver of product on the
+        addresses, its mappings are kept in files of mapping_prefix
+    """
+    adc_cache.TENANT_APV_MAPPING = mapping_prefix + '_apv.json'
+    adc_cache.TENANT_AVX_MAPPING = mapping_prefix + '_avx.json'
+    options = dict(BASE_OPTIONS)
+    options['array_management_ip'] = ','.join(addresses)
+    options['array_device_driver'] = PRODUCTS[product]
+    options.update(overrides)
+    _set_options(options)
+
+    plugin = fake_neutron.FakePlugin()
+    driver = device_driver.ArrayADCDriver(plugin)
+    # load the device driver out of the measurement
+    driver.client
+    return driver, plugin
+
+
+def run_configuration(product, hosts, sizes, scenarios, device_options,
+                      overrides, trace_memory):
+    """ Run the scenarios on the fake devices of hosts for each pool size,
+        yield a record for each scenario
+    """
+    addresses = ADDRESSES[:hosts]
+    devices = FakeDeviceProcess(addresses, device_options).start()
+    tempdir = tempfile.mkdtemp(prefix='array_bench')
+    try:
+        for size in sizes:
+            # every size starts from an empty mapping
+            driver, plugin = new_driver(product, addresses, overrides,
+                                        os.path.join(tempdir, str(size)))
+            bench = Bench(driver, plugin, size)
+            for scenario in scenarios:
+                record = {
+                    'product': product,
+                    'hosts': hosts,
+                    'members': size,
+                    'scenario': scenario,
+                }
+                record.update(_measure(getattr(bench, scenario), driver,
+                                       devices, trace_memory))
+                LOG.info("%s", json.dumps(record, sort_keys=True))
+                yield record
+            devices.reset()
+    finally:
+        devices.stop()
+        for name in os.listdir(tempdir):
+            os.remove(os.path.join(tempdir, name))
+        os.rmdir(tempdir)
+
+
+def _measure(func, driver, devices, trace_memory):
+    devices.reset()
+    request_count = driver.client.request_count
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    error = None
+    start = time.time()
+    try:
+        func()
+    except Exception as e:
+        LOG.exception("The scenario failed")
+        error = repr(e)
+    wall = time.time() - start
+    peak_traced_kb = None
+    if trace_memory:
+        peak_traced_kb = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    stats = devices.stats()
+    return {
+        'wall_seconds': round(wall, 4),
+        'round_trips': stats.get('requests', 0),
+        'driver_requests': driver.client.request_count - request_count,
+        'bytes_sent': stats.get('bytes_received', 0),
+        'bytes_received': stats.get('bytes_sent', 0),
+        'commands': stats.get('commands', 0) + stats.get('rest_objects', 0),
+        'write_memory': stats.get('write_memory', 0),
+        'device_errors': stats.get('errors', 0) + stats.get('rejected', 0),
+        'peak_concurrency': stats.get('peak_concurrency', 0),
+        'peak_rss_kb': _peak_rss_kb(),
+        'peak_traced_kb': peak_traced_kb,
+        'error': error,
+    }
+
+
+def load_records(path):
+    records = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                records[_record_key(record)] = record
+    return records
+
+
+def _record_key(record):
+    return (record['product'], record['hosts'], record['members'], record['scenario'])
+
+
+def compare(baseline, records, out=sys.stdout):
+    """ Print the changes of the records from the baseline """
+    metrics = ('wall_seconds', 'round_trips', 'bytes_sent', 'write_memory')
+    out.write("%-5s %-5s %-7s %-13s %s\n" % ('prod', 'hosts', 'members', 'scenario',
+                                             '  '.join("%-24s" % m for m in metrics)))
+    for record in records:
+        base = baseline.get(_record_key(record))
+        if not base:
+            continue
+        changes = []
+        for metric in metrics:
+            old, new = base.get(metric) or 0, record.get(metric) or 0
+            ratio = "%+.1f%%" % ((new - old) * 100.0 / old) if old else "n/a"
+            changes.append("%-24s" % ("%s -> %s (%s)" % (old, new, ratio)))
+        out.write("%-5s %-5s %-7s %-13s %s\n" % (record['product'], record['hosts'],
+                                                 record['members'], record['scenario'],
+                                                 '  '.join(changes)))
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--sizes', default='10,100,1000,10000',
+                        help='comma separated numbers of members in the pool')
+    parser.add_argument('--hosts', default='1,2',
+                        help='comma separated numbers of hosts, 1 or 2')
+    parser.add_argument('--products', default='apv,avx')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help='comma separated scenarios run in order, '
+                             'create_vip should be the first')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds of the fake devices for every request')
+    parser.add_argument('--per-command-latency', type=float, default=0.0,
+                        help='seconds of the fake devices for every command')
+    parser.add_argument('--max-concurrency', type=int, default=0,
+                        help='the concurrency limit of the fake devices')
+    parser.add_argument('--set', action='append', metavar='OPTION=VALUE',
+                        help='override an option of the arraynetworks group')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='report the peak of traced allocations, slower')
+    parser.add_argument('--output', default=None,
+                        help='write the JSON lines to the file instead of stdout')
+    parser.add_argument('--compare', default=None,
+                        help='a previous output to compare with')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    if hasattr(requests, 'packages'):
+        requests.packages.urllib3.disable_warnings()
+    if args.trace_memory and tracemalloc is None:
+        parser.error("--trace-memory needs tracemalloc")
+
+    device_options = ['--latency', str(args.latency),
+                      '--per-command-latency', str(args.per_command_latency),
+                      '--max-concurrency', str(args.max_concurrency)]
+    overrides = parse_overrides(args.set)
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    for scenario in scenarios:
+        if scenario not in SCENARIOS + SINGLE_SCENARIOS:
+            parser.error("Unknown scenario: %s" % scenario)
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    records = []
+    try:
+        for product in args.products.split(','):
+            for hosts in _int_list(args.hosts):
+                for record in run_configuration(product.strip(), hosts,
+                                                _int_list(args.sizes), scenarios,
+                                                device_options, overrides,
+                                                args.trace_memory):
+                    out.write(json.dumps(record, sort_keys=True) + "\n")
+                    out.flush()
+                    records.append(record)
+    finally:
+        if args.output:
+            out.close()
+
+    if args.compare:
+        compare(load_records(args.compare), records, sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Check the device calls of the ArrayADCDriver operations against the
+budgets committed in budgets.json. Every canonical scenario is run on
+fake devices, and the number of requests, the write memory commands and
+the bytes sent must not go over the budget:
+
+    python -m arraylbaasv1driver.tools.budget
+    python -m arraylbaasv1driver.tools.budget --verbose
+
+It exits with 1 when any scenario is over its budget. A change which
+lowers the numbers should record them by --update, so that they can't
+creep back.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+from arraylbaasv1driver.tools import bench
+from arraylbaasv1driver.tools import fake_adc
+
+LOG = logging.getLogger(__name__)
+
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'budgets.json')
+MEMBERS = 20
+PRODUCTS = ('apv', 'avx')
+HOSTS = (1, 2)
+# run in order on one pool, each one is measured on its own
+SCENARIOS = ('create_vip', 'create_member', 'update_member', 'delete_member',
+             'create_health_monitor', 'delete_health_monitor', 'member_churn',
+             'update_vip', 'delete_vip', 'delete_pool')
+METRICS = ('round_trips', 'write_memory', 'bytes_sent')
+
+
+def _usage(servers):
+    usage = dict((metric, 0) for metric in METRICS)
+    calls = []
+    for server in servers:
+        stats = server.device.snapshot()
+        usage['round_trips'] += stats.get('requests', 0)
+        usage['write_memory'] += stats.get('write_memory', 0)
+        usage['bytes_sent'] += stats.get('bytes_received', 0)
+        calls.extend((server.host,) + call for call in server.device.calls)
+    return usage, calls
+
+
+def run_scenarios(product, hosts, overrides=None):
+    """ Yield (key, usage, calls, error) of every scenario """
+    addresses = bench.ADDRESSES[:hosts]
+    servers = fake_adc.start_fake_devices(addresses, record=True)
+    tempdir = tempfile.mkdtemp(prefix='array_budget')
+    try:
+        driver, plugin = bench.new_driver(product, addresses, overrides or {},
+                                          os.path.join(tempdir, 'mapping'))
+        scenarios = bench.Bench(driver, plugin, MEMBERS)
+        for scenario in SCENARIOS:
+            for server in servers:
+                server.device.reset_stats()
+            error = None
+            try:
+                getattr(scenarios, scenario)()
+            except Exception as e:
+                LOG.exception("Scenario %s failed", scenario)
+                error = repr(e)
+            usage, calls = _usage(servers)
+            yield "%s/%d/%s" % (product, hosts, scenario), usage, calls, error
+    finally:
+        for server in servers:
+            server.stop()
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+
+def load_budgets(path=BUDGET_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        content = json.load(f)
+    if content.get('members') != MEMBERS:
+        LOG.warning("The budgets are for %s members, not %d",
+                    content.get('members'), MEMBERS)
+    return content.get('budgets', {})
+
+
+def save_budgets(budgets, path=BUDGET_FILE):
+    with open(path, 'w') as f:
+        json.dump({'members': MEMBERS, 'budgets': budgets}, f,
+                  indent=2, sort_keys=True, separators=(',', ': '))
+        f.write("\n")
+
+
+def check(key, usage, budget):
+    """ Return the lines of the metrics over and under the budget """
+    over = []
+    under = []
+    if budget is None:
+        return ["%s: no budget, record it by --update" % key], under
+    for metric in METRICS:
+        actual, limit = usage[metric], budget.get(metric, 0)
+        if actual > limit:
+            over.append("%s: %s %d is over the budget %d" % (key, metric, actual, limit))
+        elif actual < limit:
+            under.append("%s: %s %d is under the budget %d" % (key, metric, actual, limit))
+    return over, under
+
+
+def _print_calls(calls, out):
+    for host, method, path, body in calls:
+        try:
+            body = json.loads(body).get('cmd', body)
+        except (ValueError, AttributeError):
+            pass
+        out.write("    %s %s %s %s\n" % (host, method, path, body))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--update', action='store_true',
+                        help='record the current numbers as the budgets')
+    parser.add_argument('--verbose', action='store_true',
+                        help='print the device calls of the scenarios over budget')
+    parser.add_argument('--set', action='append', metavar='OPTION=VALUE',
+                        help='override an option of the arraynetworks group')
+    parser.add_argument('--budgets', default=BUDGET_FILE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    overrides = bench.parse_overrides(args.set)
+    budgets = load_budgets(args.budgets)
+    results = {}
+    failures = []
+    unders = []
+    for product in PRODUCTS:
+        for hosts in HOSTS:
+            for key, usage, calls, error in run_scenarios(product, hosts, overrides):
+                results[key] = usage
+                if error:
+                    failures.append("%s: failed with %s" % (key, error))
+                    continue
+                over, under = check(key, usage, budgets.get(key))
+                unders.extend(under)
+                if over:
+                    failures.extend(over)
+                    if args.verbose:
+                        sys.stdout.write("%s made %d calls:\n" % (key, len(calls)))
+                        _print_calls(calls, sys.stdout)
+
+    if args.update:
+        save_budgets(results, args.budgets)
+        sys.stdout.write("Recorded the budgets of %d scenarios in %s\n" %
+                         (len(results), args.budgets))
+        return 0
+    for line in unders:
+        sys.stdout.write("%s, lower the budget by --update\n" % line)
+    for line in failures:
+        sys.stdout.write("FAIL %s\n" % line)
+    sys.stdout.write("%d scenarios, %d over budget or failed\n" %
+                     (len(results), len(failures)))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,547 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+A local stand-in for the REST API of APV and AVX, which keeps the
+configuration in memory. It listens on https://<host>:9997 like the
+devices, so the drivers can be pointed at it by the management IPs,
+such as 127.0.0.2 and 127.0.0.3, without any change:
+
+    python -m arraylbaasv1driver.tools.fake_adc --hosts 127.0.0.2 \\
+        --latency 0.02 --max-concurrency 8
+
+It serves /rest/apv/cli_extend, /rest/avx/cli_extend with "va run" and
+the structured REST resources of APV, and reports its counters on
+GET /_fake/stats, which are cleared by POST /_fake/reset.
+"""
+
+import argparse
+import base64
+import collections
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_PORT = 9997
+VA_RUN = re.compile(r'^\s*va\s+run\s+(\S+)\s+"(.*)"\s*$', re.S)
+
+# (type, create prefix, name positions, delete prefix, name positions),
+# the longer prefixes go first since they are matched in order
+OBJECTS = sorted([
+    ('vlan', ('vlan',), (2,), ('no', 'vlan'), (2,)),
+    ('mac', ('interface', 'mac'), (2,), None, None),
+    ('ip', ('ip', 'address'), (2,), ('no', 'ip', 'address'), (3,)),
+    ('route', ('ip', 'route', 'default'), (3,), None, None),
+    ('virtual', ('slb', 'virtual'), (3,), ('no', 'slb', 'virtual'), (4,)),
+    ('group', ('slb', 'group', 'method'), (3,), ('no', 'slb', 'group', 'method'), (4,)),
+    ('real', ('slb', 'real'), (3,), ('no', 'slb', 'real'), (4,)),
+    ('member', ('slb', 'group', 'member'), (3, 4),
+     ('no', 'slb', 'group', 'member'), (4, 5)),
+    ('health', ('slb', 'health'), (2,), ('no', 'slb', 'health'), (3,)),
+    ('group_health', ('slb', 'group', 'health'), (3, 4),
+     ('no', 'slb', 'group', 'health'), (4, 5)),
+    ('policy', ('slb', 'policy', 'default'), (3,),
+     ('no', 'slb', 'policy', 'default'), (4,)),
+    ('cookie', ('slb', 'policy', 'persistent', 'cookie'), (4,),
+     ('no', 'slb', 'policy', 'persistent', 'cookie'), (5,)),
+    ('icookie', ('slb', 'policy', 'icookie'), (3,),
+     ('no', 'slb', 'policy', 'icookie'), (4,)),
+], key=lambda entry: -len(entry[1]))
+
+# The objects which must exist before an object of the type is created
+# in the strict mode, by the positions of their names in the key
+REQUIRES = {
+    'member': (('group', 0), ('real', 1)),
+    'group_health': (('group', 0), ('health', 1)),
+    'policy': (('virtual', 0),),
+}
+
+# The objects removed together with an object of the type, by the
+# positions of its name in their keys
+CHILDREN = {
+    'group': (('member', 0), ('group_health', 0)),
+    'real': (('member', 1),),
+    'health': (('group_health', 1),),
+}
+
+REST_RESOURCES = {
+    '/network/interface/VlanInterface':
+        ('vlan', lambda o: "vlan %s %s %s" % (o['interface'], o['name'], o['tag']),
+         lambda name: "no vlan %s" % name),
+}
+
+
+class FakeCommandError(Exception):
+
+    def __init__(self, msg, status=400):
+        super(FakeCommandError, self).__init__(msg)
+        self.status = status
+
+
+class FakeConfig(object):
+    """ The running configuration of an APV or a VA """
+
+    def __init__(self, strict=False):
+        self.strict = strict
+        self.objects = collections.OrderedDict()
+        self.cluster = []
+        self.saved = None
+
+    def _match(self, words, create):
+        for obj_type, prefix, names, no_prefix, no_names in OBJECTS:
+            if not create:
+                prefix, names = no_prefix, no_names
+            if prefix is None:
+                continue
+            if tuple(words[:len(prefix)]) == prefix and len(words) > max(names):
+                return obj_type, tuple(words[i] for i in names)
+        return None, None
+
+    def has(self, obj_type, *names):
+        return (obj_type, names) in self.objects
+
+    def apply(self, cmd):
+        """ Apply one command, return its output """
+        words = cmd.split()
+        if not words:
+            return ""
+        if words[0] == 'show':
+            if words[1:2] == ['running']:
+                return self.running()
+            return ""
+        if words[:2] == ['write', 'memory']:
+            self.saved = self.running()
+            return ""
+        if words[0] == 'cluster' or words[:2] == ['clear', 'cluster']:
+            return self._apply_cluster(cmd, words)
+        if words[:3] == ['clear', 'ip', 'route']:
+            for key in [k for k in self.objects if k[0] == 'route']:
+                del self.objects[key]
+            return ""
+        if words[0] == 'no':
+            obj_type, names = self._match(words, False)
+            if obj_type is None:
+                if self.strict:
+                    raise FakeCommandError("Unknown command: %s" % cmd)
+                obj_type, names = 'line', (" ".join(words[1:]),)
+            self._delete(obj_type, names)
+            return ""
+        obj_type, names = self._match(words, True)
+        if obj_type is None:
+            if self.strict:
+                raise FakeCommandError("Unknown command: %s" % cmd)
+            obj_type, names = 'line', (cmd.strip(),)
+        if self.strict:
+            for required, index in REQUIRES.get(obj_type, ()):
+                if not self.has(required, names[index]):
+                    raise FakeCommandError("%s %s doesn't exist" % (required, names[index]))
+        self.objects[(obj_type, names)] = cmd.strip()
+        return ""
+
+    def _delete(self, obj_type, names):
+        key = (obj_type, names)
+        if key not in self.objects:
+            if self.strict:
+                raise FakeCommandError("%s %s doesn't exist" % (obj_type, " ".join(names)))
+            return
+        del self.objects[key]
+        for child_type, index in CHILDREN.get(obj_type, ()):
+            for other in [k for k in self.objects
+                          if k[0] == child_type and k[1][index] == names[0]]:
+                del self.objects[other]
+
+    def _apply_cluster(self, cmd, words):
+        if words[0] == 'clear':
+            # clear cluster virtual ifname <interface> <id>
+            interface = words[4] if len(words) > 4 else None
+            self.cluster = [line for line in self.cluster
+                            if interface not in line.split()]
+        elif words[2:3] == ['off']:
+            on = " ".join(['cluster', 'virtual', 'on'] + words[3:])
+            self.cluster = [line for line in self.cluster if line != on]
+        elif cmd.strip() not in self.cluster:
+            self.cluster.append(cmd.strip())
+        return ""
+
+    def running(self):
+        return "\n".join(list(self.objects.values()) + self.cluster)
+
+
+class FakeDevice(object):
+    """
+    One APV or AVX host. The latency of a request is latency plus
+    per_command_latency for each of its commands plus a random jitter.
+    The requests beyond max_concurrency are rejected with 503, and the
+    requests fail with 500 at error_rate or when a command matches
+    error_pattern. In the strict mode, unknown commands, deleting a
+    missing object or creating an object before the ones it requires
+    fail with 400; otherwise unknown commands are kept as they are.
+    """
+    def __init__(self, latency=0.0, per_command_latency=0.0, jitter=0.0,
+                 error_rate=0.0, error_pattern=None, max_concurrency=0,
+                 strict=False, user_name=None, user_passwd=None,
+                 seed=None, record=False):
+        self.latency = latency
+        self.per_command_latency = per_command_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_pattern = error_pattern and re.compile(error_pattern)
+        self.max_concurrency = max_concurrency
+        self.strict = strict
+        self.auth = None
+        if user_name is not None:
+            self.auth = (user_name, user_passwd or "")
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.host = FakeConfig(strict)
+        self.vas = {}
+        self.inflight = 0
+        self.stats = collections.defaultdict(int)
+        # (method, path, body) of every request when it is recorded
+        self.calls = [] if record else None
+
+    def config(self, va_name=None):
+        if va_name is None:
+            return self.host
+        with self.lock:
+            if va_name not in self.vas:
+                self.vas[va_name] = FakeConfig(self.strict)
+            return self.vas[va_name]
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = collections.defaultdict(int)
+            if self.calls is not None:
+                self.calls = []
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats['vas'] = len(self.vas)
+        return stats
+
+    def _count(self, name, value=1):
+        with self.lock:
+            self.stats[name] += value
+
+    def handle(self, method, path, body, authorization=None):
+        """ Return (status, text) of the request """
+        self._count('requests')
+        self._count('bytes_received', len(body or b""))
+        if self.calls is not None:
+            with self.lock:
+                self.calls.append((method, path, (body or b"").decode('utf-8')))
+        if self.auth and authorization != _basic_auth(*self.auth):
+            return 401, "Unauthorized"
+
+        with self.lock:
+            if self.max_concurrency and self.inflight >= self.max_concurrency:
+                self.stats['rejected'] += 1
+                return 503, "The device is busy"
+            self.inflight += 1
+            self.stats['peak_concurrency'] = max(self.stats['peak_concurrency'],
+                                                 self.inflight)
+        try:
+            status, text = self._handle(method, path, body)
+        finally:
+            with self.lock:
+                self.inflight -= 1
+        if status != 200:
+            self._count('errors')
+        self._count('bytes_sent', len(text))
+        return status, text
+
+    def _handle(self, method, path, body):
+        for product in ('/rest/apv', '/rest/avx'):
+            if path.startswith(product):
+                path = path[len(product):]
+                break
+        else:
+            return 404, "Not found: %s" % path
+        try:
+            payload = json.loads(body.decode('utf-8')) if body else None
+        except ValueError:
+            return 400, "Invalid JSON"
+
+        if path == '/cli_extend' and method == 'POST':
+            if not isinstance(payload, dict) or 'cmd' not in payload:
+                return 400, "Missing cmd"
+            return self._cli_extend(product, payload['cmd'])
+        if product == '/rest/apv':
+            return self._rest(method, path, payload)
+        return 404, "Not found: %s%s" % (product, path)
+
+    def _cli_extend(self, product, cmd):
+        va_name = None
+        match = VA_RUN.match(cmd)
+        if match:
+            va_name, cmd = match.group(1), match.group(2)
+        elif product == '/rest/avx' and not cmd.strip().startswith('show'):
+            return 400, "The command should run in a VA: %s" % cmd
+        cmds = [c.strip() for c in cmd.split(';') if c.strip()]
+        self._count('commands', len(cmds))
+        self._count('write_memory', len([c for c in cmds if c == 'write memory']))
+        error = self._delay(cmds)
+        if error:
+            return error
+
+        config = self.config(va_name)
+        output = []
+        with self.lock:
+            try:
+                for c in cmds:
+                    output.append(config.apply(c))
+            except FakeCommandError as e:
+                return e.status, str(e)
+        return 200, json.dumps({"contents": "\n".join(o for o in output if o)})
+
+    def _rest(self, method, path, payload):
+        for collection, (obj_type, create, delete) in REST_RESOURCES.items():
+            if path == collection and method == 'POST':
+                try:
+                    cmds = [create(payload)]
+                except (KeyError, TypeError) as e:
+                    return 400, "Invalid object: %s" % e
+                break
+            if path.startswith(collection + '/') and method == 'DELETE':
+                cmds = [delete(path[len(collection) + 1:])]
+                break
+        else:
+            return 404, "Not found: %s" % path
+        self._count('rest_objects', len(cmds))
+        error = self._delay(cmds)
+        if error:
+            return error
+        with self.lock:
+            try:
+                for cmd in cmds:
+                    self.host.apply(cmd)
+            except FakeCommandError as e:
+                return e.status, str(e)
+        return 200, json.dumps({"status": "ok"})
+
+    def _delay(self, cmds):
+        """ Sleep for the latency, return (status, text) of an injected error """
+        delay = self.latency + self.per_command_latency * len(cmds)
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        if self.error_rate and self.random.random() < self.error_rate:
+            return 500, "Injected error"
+        if self.error_pattern:
+            for cmd in cmds:
+                if self.error_pattern.search(cmd):
+                    return 500, "Injected error on: %s" % cmd
+        return None
+
+
+def _basic_auth(user_name, user_passwd):
+    token = base64.b64encode(("%s:%s" % (user_name, user_passwd)).encode('utf-8'))
+    return "Basic " + token.decode('ascii')
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    # send the headers and the body together, otherwise every response
+    # waits for the delayed ACK of the client
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def _serve(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b""
+        device = self.server.device
+        if method == 'GET' and self.path == '/_fake/stats':
+            status, text = 200, json.dumps(device.snapshot())
+        elif method == 'POST' and self.path == '/_fake/reset':
+            device.reset_stats()
+            status, text = 200, json.dumps({"status": "ok"})
+        else:
+            status, text = device.handle(method, self.path, body,
+                                         self.headers.get('Authorization'))
+        data = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._serve('GET')
+
+    def do_POST(self):
+        self._serve('POST')
+
+    def do_PUT(self):
+        self._serve('PUT')
+
+    def do_DELETE(self):
+        self._serve('DELETE')
+
+    def log_message(self, fmt, *args):
+        LOG.debug("%s %s", self.address_string(), fmt % args)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _generate_certificate(directory):
+    """ Generate a self-signed certificate by openssl, return (cert, key) """
+    certfile = os.path.join(directory, 'fake_adc.crt')
+    keyfile = os.path.join(directory, 'fake_adc.key')
+    subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048',
+                           '-nodes', '-days', '2', '-subj', '/CN=fake-adc',
+                           '-keyout', keyfile, '-out', certfile],
+                          stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+    return certfile, keyfile
+
+
+def _wrap_socket(sock, certfile, keyfile):
+    if hasattr(ssl, 'SSLContext'):
+        context = ssl.SSLContext(getattr(ssl, 'PROTOCOL_TLS_SERVER', ssl.PROTOCOL_SSLv23))
+        context.load_cert_chain(certfile, keyfile)
+        return context.wrap_socket(sock, server_side=True)
+    return ssl.wrap_socket(sock, certfile=certfile, keyfile=keyfile, server_side=True)
+
+
+class FakeADCServer(object):
+    """ Serve a FakeDevice on https://host:port in a background thread """
+
+    def __init__(self, device, host='127.0.0.1', port=DEFAULT_PORT,
+                 certfile=None, keyfile=None):
+        self.device = device
+        self.host = host
+        self.port = port
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self._tempdir = None
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        if not self.certfile:
+            self._tempdir = tempfile.mkdtemp(prefix='fake_adc')
+            self.certfile, self.keyfile = _generate_certificate(self._tempdir)
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.device = self.device
+        self._server.socket = _wrap_socket(self._server.socket,
+                                           self.certfile, self.keyfile)
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        LOG.info("Fake ADC is serving on https://%s:%d", self.host, self.port)
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._tempdir:
+            shutil.rmtree(self._tempdir, ignore_errors=True)
+            self._tempdir = None
+            self.certfile = self.keyfile = None
+
+
+def start_fake_devices(hosts, port=DEFAULT_PORT, certfile=None, keyfile=None,
+                       **options):
+    """ Start a FakeADCServer with its own FakeDevice on each host, the
+        options are passed to FakeDevice
+    """
+    servers = []
+    try:
+        for host in hosts:
+            server = FakeADCServer(FakeDevice(**options), host, port,
+                                   certfile, keyfile)
+            servers.append(server.start())
+    except Exception:
+        for server in servers:
+            server.stop()
+        raise
+    return servers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--hosts', default='127.0.0.2',
+                        help='comma separated addresses to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds added to every request')
+    parser.add_argument('--per-command-latency', type=float, default=0.0,
+                        help='seconds added for every command of a request')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='random seconds up to this added to every request')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='the ratio of requests failed with 500')
+    parser.add_argument('--error-pattern', default=None,
+                        help='fail the requests with a command matching it')
+    parser.add_argument('--max-concurrency', type=int, default=0,
+                        help='reject the requests beyond it with 503, 0 for no limit')
+    parser.add_argument('--strict', action='store_true',
+                        help='fail on missing objects and objects in use')
+    parser.add_argument('--user', default=None)
+    parser.add_argument('--password', default=None)
+    parser.add_argument('--cert', default=None)
+    parser.add_argument('--key', default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    servers = start_fake_devices([h.strip() for h in args.hosts.split(',') if h.strip()],
+                                 port=args.port, certfile=args.cert, keyfile=args.key,
+                                 latency=args.latency,
+                                 per_command_latency=args.per_command_latency,
+                                 jitter=args.jitter, error_rate=args.error_rate,
+                                 error_pattern=args.error_pattern,
+                                 max_concurrency=args.max_concurrency,
+                                 strict=args.strict,
+                                 user_name=args.user, user_passwd=args.password,
+                                 seed=args.seed)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            LOG.info("%s: %s", server.host, json.dumps(server.device.snapshot(),
+                                                       sort_keys=True))
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,407 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+An in-memory stand-in for the LBaaS plugin, the core plugin and the DB
+session used by ArrayADCDriver, so that the driver operations can be
+run against fake devices without a Neutron deployment. The ids are
+generated in order, so that the same scenario sends the same bytes.
+"""
+
+import collections
+import contextlib
+import copy
+import zlib
+
+import netaddr
+
+# The host of the port bindings, array_request_vlan_hostname should be
+# set to it so that the VLAN of a VIP port is found
+BINDING_HOST = 'fake-host'
+BINDING_LEVEL = 1
+
+ACTIVE = 'ACTIVE'
+
+
+class FakeRow(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeQuery(object):
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter_by(self, **kwargs):
+        return FakeQuery([row for row in self.rows
+                          if all(getattr(row, k, None) == v for k, v in kwargs.items())])
+
+    def filter(self, criterion):
+        """ Only the comparisons of a column with a value are supported """
+        key, value = criterion.left.key, criterion.right.value
+        return FakeQuery([row for row in self.rows
+                          if criterion.operator(getattr(row, key, None), value)])
+
+    def order_by(self, column):
+        return FakeQuery(sorted(self.rows, key=lambda row: getattr(row, column.key)))
+
+    def limit(self, count):
+        return FakeQuery(self.rows[:count])
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def all(self):
+        return list(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeSession(object):
+    """ The tables are keyed by the name of the model """
+
+    def __init__(self):
+        self.tables = collections.defaultdict(collections.OrderedDict)
+
+    def table(self, model):
+        return self.tables[getattr(model, '__name__', model)]
+
+    def query(self, model):
+        return FakeQuery(list(self.table(model).values()))
+
+    @contextlib.contextmanager
+    def begin(self, subtransactions=False):
+        yield self
+
+
+class FakeContext(object):
+
+    def __init__(self, session, tenant_id=None, is_admin=True):
+        self.session = session
+        self.tenant_id = tenant_id
+        self.is_admin = is_admin
+
+
+class _Ids(object):
+
+    def __init__(self):
+        self.count = 0
+
+    def next(self, kind):
+        self.count += 1
+        prefix = zlib.crc32(kind.encode('utf-8')) & 0xffffffff
+        return "%08x-0000-4000-8000-%012d" % (prefix, self.count)
+
+
+class FakeCorePlugin(object):
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.subnets = {}
+        self.ports = {}
+        self.addresses = {}
+
+    def add_subnet(self, tenant_id, cidr):
+        network = netaddr.IPNetwork(cidr)
+        subnet = {
+            'id': self.ids.next('subnet'),
+            'tenant_id': tenant_id,
+            'network_id': self.ids.next('network'),
+            'cidr': str(network),
+            'gateway_ip': str(network[1]),
+        }
+        self.subnets[subnet['id']] = subnet
+        self.addresses[subnet['id']] = iter(network[2:-1])
+        return subnet
+
+    def load_subnet(self, subnet_id, tenant_id, cidr):
+        """ Add the subnet of a known id unless it exists """
+        if subnet_id not in self.subnets:
+            network = netaddr.IPNetwork(cidr)
+            self.subnets[subnet_id] = {
+                'id': subnet_id,
+                'tenant_id': tenant_id,
+                'network_id': self.ids.next('network'),
+                'cidr': str(network.cidr),
+                'gateway_ip': str(network[1]),
+            }
+            self.addresses[subnet_id] = iter(network[2:-1])
+        return self.subnets[subnet_id]
+
+    def load_port(self, port_id, subnet_id, address):
+        """ Add the port of a known id unless it exists """
+        if port_id not in self.ports:
+            self.ports[port_id] = {
+                'id': port_id,
+                'tenant_id': self.subnets[subnet_id]['tenant_id'],
+                'network_id': self.subnets[subnet_id]['network_id'],
+                'mac_address': "fa:16:3f:%02x:%02x:%02x" % (
+                    (len(self.ports) >> 16) & 0xff, (len(self.ports) >> 8) & 0xff,
+                    len(self.ports) & 0xff),
+                'fixed_ips': [{'subnet_id': subnet_id, 'ip_address': address}],
+            }
+        return self.ports[port_id]
+
+    def get_subnet(self, context, subnet_id):
+        return copy.deepcopy(self.subnets[subnet_id])
+
+    def create_port(self, context, port):
+        data = dict(port['port'])
+        subnet_id = data['fixed_ips'][0]['subnet_id']
+        data['id'] = self.ids.next('port')
+        data['mac_address'] = "fa:16:3e:%02x:%02x:%02x" % (
+            (len(self.ports) >> 16) & 0xff, (len(self.ports) >> 8) & 0xff,
+            len(self.ports) & 0xff)
+        data['fixed_ips'] = [{'subnet_id': subnet_id,
+                              'ip_address': str(next(self.addresses[subnet_id]))}]
+        self.ports[data['id']] = data
+        return copy.deepcopy(data)
+
+    def update_port(self, context, port_id, port):
+        self.ports[port_id].update(port['port'])
+        return copy.deepcopy(self.ports[port_id])
+
+    def get_port(self, context, port_id):
+        return copy.deepcopy(self.ports[port_id])
+
+    _get_port = get_port
+
+    def delete_port(self, context, port_id):
+        self.ports.pop(port_id, None)
+
+    def get_ports(self, context, filters=None):
+        ports = []
+        for port in self.ports.values():
+            if all(port.get(k) in v for k, v in (filters or {}).items()):
+                ports.append(copy.deepcopy(port))
+        return ports
+
+
+class FakePlugin(object):
+    """ The LBaaS v1 plugin methods used by ArrayADCDriver """
+
+    def __init__(self):
+        self.ids = _Ids()
+        self.session = FakeSession()
+        self._core_plugin = FakeCorePlugin(self.ids)
+        self.pools = {}
+        self.vips = {}
+        self.health_monitors = {}
+        self.statuses = {}
+
+    def context(self, tenant_id=None):
+        return FakeContext(self.session, tenant_id)
+
+    @property
+    def members(self):
+        return self.session.table('Member')
+
+    def add_pool(self, tenant_id, members=0, health_monitors=0,
+                 protocol='HTTP', lb_method='ROUND_ROBIN'):
+        pool = {
+            'id': self.ids.next('pool'),
+            'tenant_id': tenant_id,
+            'name': 'pool',
+            'protocol': protocol,
+            'lb_method': lb_method,
+            'health_monitors': [],
+            'vip_id': None,
+            'admin_state_up': True,
+        }
+        self.pools[pool['id']] = pool
+        self.add_members(pool, members)
+        for _ in range(health_monitors):
+            self.attach_health_monitor(pool, self.add_health_monitor(tenant_id))
+        return pool
+
+    def add_members(self, pool, count, weight=1, port=80):
+        """ Add count members into DB, return their dicts """
+        members = []
+        for _ in range(count):
+            index = len(self.members)
+            member = {
+                'id': self.ids.next('member'),
+                'tenant_id': pool['tenant_id'],
+                'pool_id': pool['id'],
+                'address': "10.%d.%d.%d" % ((index >> 16) & 0xff, (index >> 8) & 0xff,
+                                            index & 0xff),
+                'protocol_port': port,
+                'weight': weight,
+                'admin_state_up': True,
+            }
+            self.members[member['id']] = FakeRow(**member)
+            members.append(member)
+        return members
+
+    def add_health_monitor(self, tenant_id, hm_type='HTTP', delay=5):
+        hm = {
+            'id': self.ids.next('health_monitor'),
+            'tenant_id': tenant_id,
+            'type': hm_type,
+            'delay': delay,
+            'max_retries': 3,
+            'timeout': 3,
+            'http_method': 'GET',
+            'url_path': '/',
+            'expected_codes': '200',
+            'admin_state_up': True,
+        }
+        self.health_monitors[hm['id']] = hm
+        return hm
+
+    def attach_health_monitor(self, pool, hm):
+        pool['health_monitors'].append(hm['id'])
+
+    def add_vip(self, pool, vlan_tag=100, protocol_port=80, connection_limit=-1):
+        """ Add a VIP of the pool on a new subnet whose port is bound to
+            the VLAN of vlan_tag
+        """
+        subnet = self._core_plugin.add_subnet(pool['tenant_id'],
+                                              "172.16.%d.0/24" % (len(self.vips) % 256))
+        port = self._core_plugin.create_port(None, {'port': {
+            'tenant_id': pool['tenant_id'],
+            'network_id': subnet['network_id'],
+            'device_owner': 'neutron:LOADBALANCER',
+            'fixed_ips': [{'subnet_id': subnet['id']}],
+        }})
+        segment_id = self.ids.next('segment')
+        self.session.table('NetworkSegment')[segment_id] = FakeRow(
+            id=segment_id, network_type='vlan', segmentation_id=vlan_tag)
+        self.session.table('PortBindingLevel')[port['id']] = FakeRow(
+            port_id=port['id'], host=BINDING_HOST, level=BINDING_LEVEL,
+            segment_id=segment_id)
+        vip = {
+            'id': self.ids.next('vip'),
+            'tenant_id': pool['tenant_id'],
+            'name': 'vip',
+            'pool_id': pool['id'],
+            'subnet_id': subnet['id'],
+            'port_id': port['id'],
+            'address': port['fixed_ips'][0]['ip_address'],
+            'protocol': pool['protocol'],
+            'protocol_port': protocol_port,
+            'connection_limit': connection_limit,
+            'session_persistence': None,
+            'admin_state_up': True,
+        }
+        self.vips[vip['id']] = vip
+        pool['vip_id'] = vip['id']
+        return vip
+
+    def load_pool(self, pool):
+        """ Add or update a pool given by Neutron, the members are kept
+            in their own table
+        """
+        pool = copy.deepcopy(pool)
+        pool.pop('members', None)
+        old = self.pools.get(pool['id'], {})
+        pool.setdefault('health_monitors', old.get('health_monitors', []))
+        pool.setdefault('vip_id', old.get('vip_id'))
+        for hm_id in pool['health_monitors']:
+            if hm_id not in self.health_monitors:
+                # the monitors attached before are made up
+                hm = self.add_health_monitor(pool['tenant_id'])
+                del self.health_monitors[hm['id']]
+                hm['id'] = hm_id
+                self.health_monitors[hm_id] = hm
+        self.pools[pool['id']] = pool
+        return pool
+
+    def ensure_pool(self, pool_id, tenant_id, protocol='HTTP'):
+        """ The pool created before the given operations """
+        if pool_id not in self.pools:
+            self.load_pool({'id': pool_id, 'tenant_id': tenant_id,
+                            'protocol': protocol, 'lb_method': 'ROUND_ROBIN',
+                            'admin_state_up': True})
+        return self.pools[pool_id]
+
+    def load_member(self, member):
+        self.members[member['id']] = FakeRow(**copy.deepcopy(member))
+
+    def load_health_monitor(self, hm, pool_id=None):
+        self.health_monitors[hm['id']] = copy.deepcopy(hm)
+        pool = self.pools.get(pool_id)
+        if pool and hm['id'] not in pool['health_monitors']:
+            pool['health_monitors'].append(hm['id'])
+
+    def load_vip(self, vip, vlan_tag=100):
+        """ Add or update a VIP given by Neutron, its subnet and port are
+            made up unless they exist
+        """
+        core = self._core_plugin
+        if vip['subnet_id'] not in core.subnets:
+            network = netaddr.IPNetwork("%s/24" % vip['address'])
+            core.load_subnet(vip['subnet_id'], vip['tenant_id'], network)
+            # the VIP address is not given to other ports
+            core.addresses[vip['subnet_id']] = (
+                address for address in core.addresses[vip['subnet_id']]
+                if str(address) != vip['address'])
+        core.load_port(vip['port_id'], vip['subnet_id'], vip['address'])
+        if vip['port_id'] not in self.session.table('PortBindingLevel'):
+            segment_id = self.ids.next('segment')
+            self.session.table('NetworkSegment')[segment_id] = FakeRow(
+                id=segment_id, network_type='vlan', segmentation_id=vlan_tag)
+            self.session.table('PortBindingLevel')[vip['port_id']] = FakeRow(
+                port_id=vip['port_id'], host=BINDING_HOST, level=BINDING_LEVEL,
+                segment_id=segment_id)
+        self.vips[vip['id']] = copy.deepcopy(vip)
+        if vip['pool_id'] in self.pools:
+            self.pools[vip['pool_id']]['vip_id'] = vip['id']
+        return self.vips[vip['id']]
+
+    def get_pool(self, context, pool_id):
+        pool = copy.deepcopy(self.pools[pool_id])
+        pool['members'] = [member.id for member in self.members.values()
+                           if member.pool_id == pool_id]
+        return pool
+
+    def get_pools(self, context, filters=None):
+        return [self.get_pool(context, pool_id) for pool_id in sorted(self.pools)]
+
+    def get_vip(self, context, vip_id):
+        return copy.deepcopy(self.vips[vip_id])
+
+    def get_health_monitor(self, context, hm_id):
+        return copy.deepcopy(self.health_monitors[hm_id])
+
+    def get_member(self, context, member_id):
+        return dict(self.members[member_id].__dict__)
+
+    def update_status(self, context, model, obj_id, status, status_description=None):
+        self.statuses[obj_id] = status
+
+    def update_pool_health_monitor(self, context, hm_id, pool_id, status,
+                                   status_description=None):
+        self.statuses[(pool_id, hm_id)] = status
+
+    def _delete_db_vip(self, context, vip_id):
+        vip = self.vips.pop(vip_id, None)
+        if vip and vip['pool_id'] in self.pools:
+            self.pools[vip['pool_id']]['vip_id'] = None
+
+    def _delete_db_pool(self, context, pool_id):
+        self.pools.pop(pool_id, None)
+        for member_id in [m.id for m in self.members.values() if m.pool_id == pool_id]:
+            del self.members[member_id]
+
+    def _delete_db_member(self, context, member_id):
+        self.members.pop(member_id, None)
+
+    def _delete_db_pool_health_monitor(self, context, hm_id, pool_id):
+        pool = self.pools.get(pool_id)
+        if pool and hm_id in pool['health_monitors']:
+            pool['health_monitors'].remove(hm_id)
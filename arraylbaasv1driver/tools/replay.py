@@ -0,0 +1,313 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Replay a trace recorded by array_trace_file against ArrayADCDriver, with
+the fake Neutron plugin and fake devices started in a separate process:
+
+    python -m arraylbaasv1driver.tools.replay trace.jsonl --speedup 10 \\
+        --concurrency 8 --product apv --hosts 2 --latency 0.005
+
+The operations are sent at their recorded times divided by the speedup,
+0 sends them as fast as possible. The operations of the same pool are
+run in order by the same worker, the ones of different pools run in
+parallel on the workers. One JSON line is written for each operation
+type with its throughput, latency and queueing percentiles, and a last
+one for the whole replay.
+
+With --plan, no device is needed: the trace only runs through the
+planner of the driver, and one JSON line gives the predicted round
+trips, commands and saves of each device and VA, and the estimated
+seconds by --request-seconds.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import requests
+
+from arraylbaasv1driver.driver.v1 import adc_trace
+from arraylbaasv1driver.tools import bench
+
+LOG = logging.getLogger(__name__)
+
+PERCENTILES = (50, 90, 99)
+_STOP = object()
+
+
+def percentile(values, pct):
+    """ The nearest-rank percentile of the sorted values """
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, int(round(pct / 100.0 * len(values))) - 1))
+    return values[index]
+
+
+def _pool_id(op, args):
+    """ The pool which the operation belongs to, it decides the worker """
+    for arg in args:
+        if isinstance(arg, list) and arg:
+            arg = arg[0]
+            if isinstance(arg, list):
+                # the (old, new) pairs of update_members
+                arg = arg[-1]
+        if isinstance(arg, dict):
+            if arg.get('pool_id'):
+                return arg['pool_id']
+            if op.endswith('_pool'):
+                return arg.get('id')
+    # the pool_id argument of the health monitor operations
+    if args and not isinstance(args[-1], (dict, list)):
+        return args[-1]
+    return None
+
+
+class Replayer(object):
+    """ Drive the recorded operations through the driver, the objects in
+        their arguments are put into the fake plugin before each one
+    """
+    def __init__(self, driver, plugin, concurrency=1, speedup=1.0):
+        self.driver = driver
+        self.plugin = plugin
+        self.concurrency = max(1, concurrency)
+        self.speedup = speedup
+        self.plugin_lock = threading.Lock()
+        self.results_lock = threading.Lock()
+        self.results = []
+        self.vlans = 0
+
+    def _prepare(self, op, args):
+        plugin = self.plugin
+        pool_id = _pool_id(op, args)
+        objects = []
+        for arg in args:
+            if isinstance(arg, dict):
+                objects.append(arg)
+            elif isinstance(arg, list):
+                objects.extend(item[-1] if isinstance(item, list) else item
+                               for item in arg)
+        with self.plugin_lock:
+            if op.endswith('_pool'):
+                plugin.load_pool(objects[-1])
+                return
+            if pool_id and objects:
+                plugin.ensure_pool(pool_id, objects[-1].get('tenant_id'),
+                                   objects[-1].get('protocol') or 'HTTP')
+            if op.endswith('_vip'):
+                if objects[-1]['port_id'] not in plugin._core_plugin.ports:
+                    self.vlans += 1
+                plugin.load_vip(objects[-1], vlan_tag=100 + self.vlans % 4000)
+            elif op.endswith('_pool_health_monitor'):
+                plugin.load_health_monitor(objects[-1], pool_id)
+            elif op.endswith(('_member', '_members')):
+                for member in objects:
+                    plugin.load_member(member)
+
+    def _run_one(self, entry, scheduled):
+        started = time.time()
+        op, args = entry['op'], entry.get('args', [])
+        error = None
+        try:
+            self._prepare(op, args)
+            method = getattr(self.driver, op)
+            method(self.plugin.context(), *args, **entry.get('kw', {}))
+        except Exception as e:
+            LOG.debug("Failed to replay %s", op, exc_info=True)
+            error = repr(e)
+        finished = time.time()
+        with self.results_lock:
+            self.results.append({
+                'op': op,
+                'queue': started - scheduled,
+                'latency': finished - started,
+                'recorded': entry.get('dur'),
+                'error': error,
+            })
+
+    def _worker(self, work):
+        while True:
+            item = work.get()
+            if item is _STOP:
+                return
+            self._run_one(*item)
+
+    def run(self, entries):
+        """ Replay the entries, return the wall seconds """
+        works = [queue.Queue() for _ in range(self.concurrency)]
+        threads = [threading.Thread(target=self._worker, args=(work,))
+                   for work in works]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        start = time.time()
+        first = None
+        for entry in entries:
+            if first is None:
+                first = entry['ts']
+            scheduled = start
+            if self.speedup > 0:
+                scheduled = start + (entry['ts'] - first) / self.speedup
+                delay = scheduled - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                scheduled = time.time()
+            key = _pool_id(entry['op'], entry.get('args', [])) or entry['op']
+            index = (zlib.crc32(str(key).encode('utf-8')) & 0xffffffff) % len(works)
+            works[index].put((entry, scheduled))
+
+        for work in works:
+            work.put(_STOP)
+        for thread in threads:
+            thread.join()
+        return time.time() - start
+
+    def report(self, wall):
+        """ Return the summary of each operation type and the total """
+        by_op = {}
+        for result in self.results:
+            by_op.setdefault(result['op'], []).append(result)
+        summaries = []
+        for op in sorted(by_op):
+            summaries.append(self._summary(op, by_op[op], wall))
+        summaries.append(self._summary('total', self.results, wall))
+        return summaries
+
+    def _summary(self, op, results, wall):
+        latencies = sorted(r['latency'] for r in results)
+        queues = sorted(r['queue'] for r in results)
+        recorded = sorted(r['recorded'] for r in results if r['recorded'] is not None)
+        summary = {
+            'op': op,
+            'count': len(results),
+            'errors': len([r for r in results if r['error']]),
+            'throughput': round(len(results) / wall, 3) if wall else None,
+        }
+        for pct in PERCENTILES:
+            summary['latency_p%d_ms' % pct] = _ms(percentile(latencies, pct))
+            summary['queue_p%d_ms' % pct] = _ms(percentile(queues, pct))
+            summary['recorded_p%d_ms' % pct] = _ms(percentile(recorded, pct))
+        summary['latency_max_ms'] = _ms(latencies[-1] if latencies else None)
+        summary['queue_max_ms'] = _ms(queues[-1] if queues else None)
+        return summary
+
+
+def _ms(seconds):
+    if seconds is None:
+        return None
+    return round(seconds * 1000, 3)
+
+
+def plan(args, addresses):
+    tempdir = tempfile.mkdtemp(prefix='array_replay')
+    try:
+        driver, plugin = bench.new_driver(args.product, addresses,
+                                          bench.parse_overrides(args.set),
+                                          os.path.join(tempdir, 'mapping'))
+        planner = driver.planner()
+        replayer = Replayer(planner, plugin, 1, 0)
+        replayer.run(adc_trace.read_trace(args.trace))
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+    summary = planner.recorder.summary(args.request_seconds, with_requests=False)
+    summary['operations'] = len(replayer.results)
+    summary['errors'] = len([r for r in replayer.results if r['error']])
+    summary['neutron_calls'] = len(summary['neutron_calls'])
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        out.write(json.dumps(summary, sort_keys=True) + "\n")
+    finally:
+        if args.output:
+            out.close()
+    return 1 if summary['errors'] else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('trace', help='the JSON lines file of array_trace_file')
+    parser.add_argument('--speedup', type=float, default=1.0,
+                        help='divide the recorded intervals by it, 0 means '
+                             'as fast as possible')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='the number of workers running the operations')
+    parser.add_argument('--product', default='apv', choices=sorted(bench.PRODUCTS))
+    parser.add_argument('--hosts', type=int, default=1, choices=(1, 2))
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds of the fake devices for every request')
+    parser.add_argument('--per-command-latency', type=float, default=0.0,
+                        help='seconds of the fake devices for every command')
+    parser.add_argument('--max-concurrency', type=int, default=0,
+                        help='the concurrency limit of the fake devices')
+    parser.add_argument('--set', action='append', metavar='OPTION=VALUE',
+                        help='override an option of the arraynetworks group')
+    parser.add_argument('--plan', action='store_true',
+                        help='only plan the device requests of the trace')
+    parser.add_argument('--request-seconds', type=float, default=None,
+                        help='seconds of one device request to estimate the '
+                             'time of the plan')
+    parser.add_argument('--output', default=None,
+                        help='write the JSON lines to the file instead of stdout')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    if hasattr(requests, 'packages'):
+        requests.packages.urllib3.disable_warnings()
+
+    addresses = bench.ADDRESSES[:args.hosts]
+    if args.plan:
+        return plan(args, addresses)
+    devices = bench.FakeDeviceProcess(
+        addresses, ['--latency', str(args.latency),
+                    '--per-command-latency', str(args.per_command_latency),
+                    '--max-concurrency', str(args.max_concurrency)]).start()
+    tempdir = tempfile.mkdtemp(prefix='array_replay')
+    try:
+        driver, plugin = bench.new_driver(args.product, addresses,
+                                          bench.parse_overrides(args.set),
+                                          os.path.join(tempdir, 'mapping'))
+        replayer = Replayer(driver, plugin, args.concurrency, args.speedup)
+        wall = replayer.run(adc_trace.read_trace(args.trace))
+        summaries = replayer.report(wall)
+        summaries[-1]['wall_seconds'] = round(wall, 4)
+        summaries[-1]['round_trips'] = devices.stats().get('requests', 0)
+    finally:
+        devices.stop()
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for summary in summaries:
+            out.write(json.dumps(summary, sort_keys=True) + "\n")
+    finally:
+        if args.output:
+            out.close()
+    return 1 if summaries[-1]['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())